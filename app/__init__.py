@@ -0,0 +1,5 @@
+# 🔹 Las variables de entorno se cargan una sola vez, al importar el paquete `app`,
+# antes de que cualquier módulo lea su configuración con `os.getenv`.
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -1,18 +1,31 @@
-from app.database import get_dynamic_state, save_dynamic_state
-from openai import OpenAI
+import os
+import asyncio
+from app import llm, trazas
 from app.categorias.recomendaciones import categorizar_recomendacion
-from app.categorias.servicios_adicionales import categorizar_servicio_adicional 
+from app.categorias.servicios_adicionales import clasificar_servicio_adicional
 from app.categorias.averia_estancia import handle_issue_report
 from app.categorias.informacion_alojamiento import categorizar_pregunta_informacion
-
-def handle_intents(numero_telefono, analysis_result, user_message, conv_state, nombre_apartamento) -> str:
+from app.categorias.arbol import separar_categoria
+from app.categorias.tipo_informacion.handle_instalaciones import handle_apartment_info
+from app.categorias.tipo_informacion.handle_normas import handle_normas_info
+from app.categorias.tipo_informacion.handle_penalizaciones import handle_penalizacion_info
+from app.categorias.servicios.limpiezas import handle_limpieza
+from app.categorias.servicios.transporte import handle_transporte as handle_transporte_privado
+from app.categorias.tipo_de_recomendacion.recomendaciones_restaurantes import handle_recomendaciones
+from app.categorias.tipo_de_recomendacion.actividades_ocio import handle_actividades_ocio
+from app.categorias.tipo_de_recomendacion.transporte_movilidad import handle_transporte as handle_transporte_movilidad
+
+# 🔹 Máximo de intenciones de un mismo mensaje que se procesan a la vez
+MAX_INTENCIONES_CONCURRENTES = int(os.getenv("MAX_INTENCIONES_CONCURRENTES", 4))
+
+async def handle_intents(numero_telefono, analysis_result, user_message, conv_state, nombre_apartamento) -> str:
     """
     Recibe el número de teléfono, el resultado del análisis NLU y el mensaje original.
     Gestiona la intención detectada y devuelve la respuesta adecuada.
+    Si hay varias intenciones, sus manejadores se ejecutan a la vez.
     """
 
-    # 🔹 **1️⃣ Obtener estado del usuario (Memoria Dinámica - Supabase)**
-    conversation_state = get_dynamic_state(numero_telefono)
+    # 🔹 **1️⃣ `conv_state` es el estado de la sesión: todos los manejadores comparten el mismo objeto**
 
     intenciones = analysis_result.get("intenciones", [])
     idioma = analysis_result.get("idioma", "es")  # Si no hay idioma detectado, asumimos español
@@ -20,37 +33,117 @@ def handle_intents(numero_telefono, analysis_result, user_message, conv_state, n
     if not intenciones:
         return _sin_intencion_respuesta(idioma)
 
-    responses = []
-    
     # 🔹 **2️⃣ Procesar cada intención detectada**
-    for intent in intenciones:
-        text = dispatch_intent(conversation_state, intent, user_message, idioma, nombre_apartamento)
-        responses.append(text)
+    if len(intenciones) == 1:
+        responses = [await dispatch_intent(conv_state, intenciones[0], user_message, idioma, nombre_apartamento)]
+    else:
+        responses = await _despachar_en_paralelo(conv_state, intenciones, user_message, idioma, nombre_apartamento)
 
-    # 🔹 **3️⃣ Guardar conversación actualizada en Supabase**
-    #save_dynamic_state(conversation_state)
+    # 🔹 **3️⃣ La conversación actualizada la guarda `ConversationSession` al terminar `/chat`**
 
     return "\n".join([str(resp) if isinstance(resp, dict) else resp for resp in responses])
 
-def dispatch_intent(conversation_state, intent, user_message, idioma, nombre_apartamento) -> str:
+async def _despachar_en_paralelo(conv_state, intenciones, user_message, idioma, nombre_apartamento) -> list:
+    """
+    Ejecuta cada intención sobre su propia copia del estado, con un máximo de
+    `MAX_INTENCIONES_CONCURRENTES` a la vez. Las respuestas se devuelven en el orden
+    de las intenciones y los cambios de cada copia se aplican al estado de la sesión
+    en ese mismo orden (si dos intenciones tocan el mismo dato, gana la última).
+    """
+    semaforo = asyncio.Semaphore(MAX_INTENCIONES_CONCURRENTES)
+    base = conv_state.copia()
+    copias = [conv_state.copia() for _ in intenciones]
+
+    async def _ejecutar(posicion, intent):
+        async with semaforo:
+            # Solo la primera intención emite por `/chat/stream`; el resto llega en el evento `fin`
+            if posicion > 0:
+                llm.emisor_actual.set(None)
+            return await dispatch_intent(copias[posicion], intent, user_message, idioma, nombre_apartamento)
+
+    resultados = await asyncio.gather(
+        *(_ejecutar(posicion, intent) for posicion, intent in enumerate(intenciones)),
+        return_exceptions=True,
+    )
+
+    for copia in copias:
+        _fusionar_estado(conv_state, base, copia)
+
+    for resultado in resultados:
+        if isinstance(resultado, BaseException):
+            raise resultado
+    return resultados
+
+_SIN_VALOR = object()
+
+def _fusionar_estado(conv_state, base, copia):
+    """Aplica a `conv_state` lo que una copia cambió respecto al estado de partida."""
+    for campo in ("categoria_activa", "is_closed", "idioma"):
+        if getattr(copia, campo) != getattr(base, campo):
+            setattr(conv_state, campo, getattr(copia, campo))
+
+    for clave, valor in copia.datos_categoria.items():
+        if base.datos_categoria.get(clave, _SIN_VALOR) != valor:
+            conv_state.datos_categoria[clave] = valor
+    for clave in base.datos_categoria.keys() - copia.datos_categoria.keys():
+        conv_state.datos_categoria.pop(clave, None)
+
+async def _servicio_sin_gestor(conversation_state, user_message, nombre_apartamento=None):
+    """Packs y alquiler de toallas/sombrillas todavía no tienen flujo propio."""
+    idioma = conversation_state.idioma if conversation_state.idioma in ["es", "en"] else "es"
+    return solicitar_servicio_extra(conversation_state, idioma)
+
+# 📌 **Manejadores de cada hoja del árbol de categorías (`app/categorias/arbol.py`)**
+MANEJADORES_HOJA = {
+    "informacion_alojamiento/instalaciones": handle_apartment_info,
+    "informacion_alojamiento/normas": handle_normas_info,
+    "informacion_alojamiento/penalizaciones": handle_penalizacion_info,
+    "servicios_adicionales/limpieza": handle_limpieza,
+    "servicios_adicionales/transporte": handle_transporte_privado,
+    "servicios_adicionales/packs": _servicio_sin_gestor,
+    "servicios_adicionales/toallas_sombrillas": _servicio_sin_gestor,
+    "recomendaciones_personalizadas/restaurantes": handle_recomendaciones,
+    "recomendaciones_personalizadas/actividades": handle_actividades_ocio,
+    "recomendaciones_personalizadas/transporte": handle_transporte_movilidad,
+}
+
+async def dispatch_intent(conversation_state, intent, user_message, idioma, nombre_apartamento) -> str:
     """
     Redirige cada intención a su respectiva función de manejo.
+    Si el clasificador ya devolvió la hoja ("intencion/subcategoria") se salta
+    directamente a su manejador, sin la segunda clasificación de `categorizar_*`.
     """
 
     # 🔹 Asegurar que idioma tenga un valor válido
     idioma = idioma if idioma in ["es", "en"] else "es"
 
+    intencion, subcategoria = separar_categoria(intent)
+    with trazas.span("manejador", intencion=intencion, subcategoria=subcategoria):
+        return await _despachar_intencion(conversation_state, intent, user_message, idioma, nombre_apartamento)
+
+async def _despachar_intencion(conversation_state, intent, user_message, idioma, nombre_apartamento) -> str:
+    # 🔹 Hoja conocida: llamada directa al manejador final
+    manejador = MANEJADORES_HOJA.get(intent)
+    if manejador is not None:
+        return await manejador(conversation_state, user_message, nombre_apartamento)
+
+    # 🔹 Solo intención de primer nivel: los `categorizar_*` eligen la subcategoría
+    intent, _ = separar_categoria(intent)
+
     if intent == "informacion_alojamiento":
-        return categorizar_pregunta_informacion(conversation_state.numero_telefono, user_message, nombre_apartamento)
+        return await categorizar_pregunta_informacion(conversation_state, user_message, nombre_apartamento)
 
     elif intent == "averia_estancia":
-        return handle_issue_report(conversation_state.numero_telefono, user_message)
+        return await handle_issue_report(conversation_state, user_message)
 
     elif intent == "servicios_adicionales":
-        return categorizar_servicio_adicional(conversation_state, user_message)
+        # El clasificador solo elige la hoja; el manejador sale de la misma tabla que la vía directa
+        hoja = await clasificar_servicio_adicional(conversation_state, user_message)
+        manejador = MANEJADORES_HOJA.get(hoja, _servicio_sin_gestor)
+        return await manejador(conversation_state, user_message, nombre_apartamento)
 
     elif intent == "recomendaciones_personalizadas":
-        return categorizar_recomendacion(conversation_state.numero_telefono, user_message, nombre_apartamento)
+        return await categorizar_recomendacion(conversation_state, user_message, nombre_apartamento)
 
     elif intent == "descuentos_promociones":
         return descuentos_promociones(idioma)
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from collections import OrderedDict
+import numpy as np
+from app.preclasificador import normalizar_texto, obtener_preclasificador, vectorizar
+
+###############################################################################
+# Caché semántica de respuestas sobre el alojamiento
+###############################################################################
+#
+# Las preguntas de instalaciones, normas y penalizaciones se repiten mucho entre
+# huéspedes del mismo apartamento. Guardamos la respuesta generada por el LLM con
+# clave (apartamento, tipo de pregunta, idioma, pregunta normalizada) y, si la pregunta
+# no coincide exactamente, buscamos la más parecida por similitud coseno entre las del
+# mismo apartamento, tipo e idioma (la respuesta está escrita en el idioma del huésped).
+#
+#   - Solo se vectorizan las palabras de contenido ("secador", "silencio"), sin "hay",
+#     "el apartamento tiene"..., y los n-gramas se ponderan con el IDF del banco de
+#     ejemplos del preclasificador: así "¿hay secador?" y "¿tenéis secador de pelo?" se
+#     parecen y "¿tiene parking el apartamento?" no se parece a "¿tiene vistas al mar?".
+#   - Además del umbral, las dos preguntas deben tener las mismas negaciones:
+#     "¿hay wifi?" no es "¿no hay wifi?".
+#
+# El umbral se ajusta con `datos/corpus_cache.json` (grupos de preguntas que deben
+# compartir respuesta, sacados del banco de ejemplos): python -m app.cache_respuestas
+
+RUTA_CORPUS = os.path.join(os.path.dirname(__file__), "datos", "corpus_cache.json")
+
+CAPACIDAD_POR_DEFECTO = 2000
+TTL_POR_DEFECTO = 6 * 3600          # segundos
+SIMILITUD_POR_DEFECTO = 0.6         # ajustado con `python -m app.cache_respuestas`
+
+_NEGACIONES = {"no", "ni", "sin", "nunca", "nada", "not", "never", "without", "nothing", "dont", "cant", "isnt", "doesnt", "arent", "wont"}
+# Palabras que no distinguen una pregunta de otra: artículos, "hay", "se puede", "el apartamento"...
+_VACIAS = {
+    "el", "la", "los", "las", "lo", "un", "una", "unos", "unas", "de", "del", "al", "a", "en", "y", "o", "que", "se",
+    "por", "para", "con", "es", "hay", "mi", "me", "te", "su", "cual", "cuales", "como", "cuando", "esta", "estan",
+    "puedo", "puede", "podemos", "permitido", "permite", "permiten", "admiten", "tiene", "teneis",
+    "apartamento", "piso", "edificio", "hola", "porfa", "favor", "gracias",
+    "the", "a", "an", "is", "are", "there", "can", "could", "i", "we", "my", "our", "to", "of", "in", "at", "on",
+    "do", "does", "you", "have", "allowed", "allow", "what", "how", "when", "which", "any", "it",
+    "apartment", "flat", "building", "please", "hi", "hello", "thanks",
+}
+
+
+def negaciones(pregunta: str) -> frozenset:
+    """Negaciones de la pregunta; dos preguntas solo comparten respuesta si coinciden."""
+    return frozenset(p for p in normalizar_texto(pregunta).split() if p in _NEGACIONES)
+
+
+def contenido(pregunta: str) -> str:
+    """La pregunta sin palabras vacías ni negaciones (o entera, si no queda nada)."""
+    palabras = normalizar_texto(pregunta).split()
+    return " ".join(p for p in palabras if p not in _VACIAS and p not in _NEGACIONES) or " ".join(palabras)
+
+
+def vector_pregunta(pregunta: str) -> np.ndarray:
+    """Vector de n-gramas de las palabras de contenido, ponderado con el IDF del banco de ejemplos y normalizado."""
+    vector = vectorizar([contenido(pregunta)])[0] * obtener_preclasificador().idf
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else vector
+
+
+def huella_instalaciones(instalaciones) -> str:
+    """Huella estable de la fila de `instalaciones`; si cambia, la caché del apartamento se invalida."""
+    fila = json.dumps(instalaciones, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(fila.encode("utf-8")).hexdigest()
+
+
+class _Entrada:
+    __slots__ = ("respuesta", "vector", "negaciones", "creada", "segundos", "tokens")
+
+    def __init__(self, respuesta, vector, negaciones, segundos, tokens):
+        self.respuesta = respuesta
+        self.vector = vector
+        self.negaciones = negaciones
+        self.creada = time.monotonic()
+        self.segundos = segundos
+        self.tokens = tokens
+
+
+class CacheRespuestas:
+    """
+    Caché LRU con TTL. Las entradas se agrupan por (apartamento, tipo, idioma) para que
+    la búsqueda semántica solo compare preguntas del mismo apartamento y en el mismo idioma.
+    """
+
+    def __init__(self, capacidad=None, ttl=None, umbral_similitud=None):
+        self.capacidad = capacidad or int(os.getenv("CACHE_RESPUESTAS_CAPACIDAD", CAPACIDAD_POR_DEFECTO))
+        self.ttl = ttl or float(os.getenv("CACHE_RESPUESTAS_TTL", TTL_POR_DEFECTO))
+        self.umbral_similitud = umbral_similitud or float(os.getenv("CACHE_RESPUESTAS_SIMILITUD", SIMILITUD_POR_DEFECTO))
+
+        self._entradas = OrderedDict()      # (apartamento, tipo, idioma, pregunta) -> _Entrada, en orden LRU
+        self._grupos = {}                   # (apartamento, tipo, idioma) -> set de claves
+        self._huellas = {}                  # apartamento -> huella de `instalaciones`
+
+        self.aciertos = 0
+        self.aciertos_semanticos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.segundos_ahorrados = 0.0
+        self.tokens_ahorrados = 0
+
+    # 🔹 Utilidades internas
+    def _eliminar(self, clave):
+        self._entradas.pop(clave, None)
+        grupo = self._grupos.get(clave[:3])
+        if grupo is not None:
+            grupo.discard(clave)
+            if not grupo:
+                del self._grupos[clave[:3]]
+
+    def _caducada(self, entrada) -> bool:
+        return time.monotonic() - entrada.creada > self.ttl
+
+    def _comprobar_huella(self, apartamento, huella):
+        if huella is not None and self._huellas.get(apartamento) not in (None, huella):
+            self.invalidar(apartamento)
+
+    def _acierto(self, clave, entrada, semantico=False):
+        self._entradas.move_to_end(clave)
+        self.aciertos += 1
+        self.aciertos_semanticos += int(semantico)
+        self.segundos_ahorrados += entrada.segundos
+        self.tokens_ahorrados += entrada.tokens
+        return entrada.respuesta
+
+    # 🔹 API pública
+    def buscar(self, nombre_apartamento, tipo, pregunta, huella=None, idioma=None):
+        """Devuelve la respuesta cacheada o `None`. Primero busca coincidencia exacta y después semántica."""
+        apartamento = normalizar_texto(nombre_apartamento or "")
+        self._comprobar_huella(apartamento, huella)
+
+        clave = (apartamento, tipo, idioma or "", normalizar_texto(pregunta))
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            if not self._caducada(entrada):
+                return self._acierto(clave, entrada)
+            self._eliminar(clave)
+
+        # Búsqueda semántica entre las preguntas del mismo apartamento, tipo e idioma
+        candidatas = []
+        for otra in list(self._grupos.get(clave[:3], ())):
+            if self._caducada(self._entradas[otra]):
+                self._eliminar(otra)
+            else:
+                candidatas.append(otra)
+
+        # Solo compiten las que tienen las mismas negaciones
+        propias = negaciones(pregunta)
+        candidatas = [c for c in candidatas if self._entradas[c].negaciones == propias]
+        if candidatas:
+            matriz = np.vstack([self._entradas[c].vector for c in candidatas])
+            similitudes = matriz @ vector_pregunta(pregunta)
+            mejor = int(similitudes.argmax())
+            if similitudes[mejor] >= self.umbral_similitud:
+                return self._acierto(candidatas[mejor], self._entradas[candidatas[mejor]], semantico=True)
+
+        self.fallos += 1
+        return None
+
+    def guardar(self, nombre_apartamento, tipo, pregunta, respuesta, huella=None, segundos=0.0, tokens=0, idioma=None):
+        """Guarda una respuesta generada, junto con lo que costó generarla."""
+        apartamento = normalizar_texto(nombre_apartamento or "")
+        self._comprobar_huella(apartamento, huella)
+        if huella is not None:
+            self._huellas[apartamento] = huella
+
+        clave = (apartamento, tipo, idioma or "", normalizar_texto(pregunta))
+        self._eliminar(clave)
+        self._entradas[clave] = _Entrada(respuesta, vector_pregunta(pregunta), negaciones(pregunta), segundos, tokens)
+        self._grupos.setdefault(clave[:3], set()).add(clave)
+
+        # Expulsión LRU
+        while len(self._entradas) > self.capacidad:
+            self._eliminar(next(iter(self._entradas)))
+
+    def invalidar(self, nombre_apartamento=None):
+        """Elimina las entradas de un apartamento (o todas si no se indica ninguno)."""
+        apartamento = normalizar_texto(nombre_apartamento) if nombre_apartamento else None
+        claves = [c for c in self._entradas if apartamento is None or c[0] == apartamento]
+        for clave in claves:
+            self._eliminar(clave)
+        if apartamento is None:
+            self._huellas.clear()
+        else:
+            self._huellas.pop(apartamento, None)
+        self.invalidaciones += 1
+
+    def estadisticas(self) -> dict:
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._entradas),
+            "aciertos": self.aciertos,
+            "aciertos_semanticos": self.aciertos_semanticos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+            "invalidaciones": self.invalidaciones,
+            "segundos_llm_ahorrados": round(self.segundos_ahorrados, 3),
+            "tokens_llm_ahorrados": self.tokens_ahorrados,
+        }
+
+
+# 🔹 Instancia compartida por los manejadores de `tipo_informacion`
+cache_respuestas = CacheRespuestas()
+
+
+def evaluar(corpus, umbral: float) -> dict:
+    """
+    Simula la caché con el corpus: cada pregunta se busca con todas las demás de su
+    tipo e idioma ya guardadas. Es un acierto si la respuesta servida es la de su grupo
+    y un falso acierto si es la de otro grupo (otra pregunta).
+    """
+    aciertos = falsos = buscadas = 0
+    falsos_aciertos = []
+    for tipo, idioma in sorted({(grupo["tipo"], grupo["idioma"]) for grupo in corpus}):
+        preguntas = [
+            (p, i) for i, grupo in enumerate(corpus)
+            if (grupo["tipo"], grupo["idioma"]) == (tipo, idioma) for p in grupo["preguntas"]
+        ]
+        for pregunta, grupo in preguntas:
+            cache = CacheRespuestas(capacidad=len(preguntas), ttl=TTL_POR_DEFECTO, umbral_similitud=umbral)
+            for otra, otro_grupo in preguntas:
+                if otra != pregunta:
+                    cache.guardar("corpus", tipo, otra, (otro_grupo, otra), idioma=idioma)
+            respuesta = cache.buscar("corpus", tipo, pregunta, idioma=idioma)
+            buscadas += 1
+            if respuesta is None:
+                continue
+            if respuesta[0] == grupo:
+                aciertos += 1
+            else:
+                falsos += 1
+                falsos_aciertos.append({"pregunta": pregunta, "servida": respuesta[1]})
+    return {
+        "buscadas": buscadas,
+        "aciertos": aciertos,
+        "falsos_aciertos": falsos,
+        "tasa_aciertos": aciertos / buscadas if buscadas else 0.0,
+        "detalle_falsos": falsos_aciertos,
+    }
+
+
+# 🔹 **Ajuste del umbral**: python -m app.cache_respuestas [--fichero corpus.json] [--umbrales 0.5 0.6 0.7]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajusta el umbral de similitud de la caché de respuestas.")
+    parser.add_argument("--fichero", default=RUTA_CORPUS, help="Corpus JSON con grupos de preguntas equivalentes")
+    parser.add_argument("--umbrales", type=float, nargs="+", default=[0.4, 0.5, 0.55, 0.6, 0.65, 0.7, 0.8, 0.9])
+    args = parser.parse_args()
+
+    with open(args.fichero, encoding="utf-8") as f:
+        corpus = json.load(f)
+    for umbral in args.umbrales:
+        resultado = evaluar(corpus, umbral)
+        for falso in resultado["detalle_falsos"]:
+            print(f"   ❌ {falso['pregunta']!r} recibiría la respuesta de {falso['servida']!r}")
+        print(f"📌 Umbral {umbral:g}: {resultado['aciertos']}/{resultado['buscadas']} aciertos "
+              f"({resultado['tasa_aciertos']:.1%}), {resultado['falsos_aciertos']} falsos aciertos")
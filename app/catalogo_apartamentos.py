@@ -0,0 +1,125 @@
+import os
+import asyncio
+from datetime import datetime
+from app import registro, trazas
+from app.database import obtener_supabase
+from app.preclasificador import normalizar_texto
+from app.geo import centro_poblacion
+from app.cache_respuestas import cache_respuestas, huella_instalaciones
+
+log = registro.obtener(__name__)
+
+###############################################################################
+# Catálogo en memoria de la tabla `apartamentos`
+###############################################################################
+#
+# Los datos de los apartamentos cambian muy poco (aprox. una vez al mes), así que
+# se cargan todos, justo después de arrancar, en un diccionario indexado por nombre normalizado.
+# Una tarea en segundo plano los recarga cada `CATALOGO_APARTAMENTOS_INTERVALO`
+# segundos y también se pueden recargar a demanda con `invalidar()`.
+
+INTERVALO_POR_DEFECTO = 3600  # segundos
+
+
+class CatalogoApartamentos:
+    def __init__(self, intervalo=None):
+        self.intervalo = intervalo or float(os.getenv("CATALOGO_APARTAMENTOS_INTERVALO", INTERVALO_POR_DEFECTO))
+        self._por_nombre = {}
+        self.cargado_en = None
+        self._tarea = None
+        self._lock = asyncio.Lock()
+
+    def _indexar(self, filas) -> dict:
+        return {normalizar_texto(f.get("nombre") or ""): f for f in filas if f.get("nombre")}
+
+    def _invalidar_respuestas_cambiadas(self, anterior: dict, nuevo: dict):
+        """Las respuestas cacheadas de un apartamento dejan de valer si cambian sus instalaciones."""
+        for clave, fila in anterior.items():
+            nueva = nuevo.get(clave)
+            if nueva is None or huella_instalaciones(nueva.get("instalaciones")) != huella_instalaciones(fila.get("instalaciones")):
+                cache_respuestas.invalidar(fila.get("nombre"))
+
+    async def cargar(self):
+        """Lee toda la tabla `apartamentos` y sustituye el índice de una sola vez."""
+        async with self._lock:
+            supabase = await obtener_supabase()
+            response = await supabase.table("apartamentos").select("*").execute()
+            nuevo = self._indexar(response.data or [])
+            self._invalidar_respuestas_cambiadas(self._por_nombre, nuevo)
+            self._por_nombre = nuevo
+            self.cargado_en = datetime.utcnow().isoformat()
+            log.info("Catálogo de apartamentos cargado", categoria="catalogo", apartamentos=len(nuevo))
+
+    def obtener(self, nombre_apartamento):
+        """Búsqueda en memoria por nombre (sin distinguir mayúsculas ni tildes). Devuelve la fila o `None`."""
+        return self._por_nombre.get(normalizar_texto(nombre_apartamento or ""))
+
+    def coordenadas(self, nombre_apartamento):
+        """
+        `(latitud, longitud)` del apartamento: las de su fila o, si no las tiene, el centro
+        de su `poblacion`. `None` si no se sabe dónde está.
+        """
+        apartamento = self.obtener(nombre_apartamento) or {}
+        if apartamento.get("latitud") is not None and apartamento.get("longitud") is not None:
+            return float(apartamento["latitud"]), float(apartamento["longitud"])
+        return centro_poblacion(apartamento.get("poblacion"))
+
+    async def buscar(self, nombre_apartamento):
+        """
+        Como `obtener`, pero si el apartamento no está en el índice (p. ej. se dio de alta
+        después de la última recarga) lo consulta en Supabase y lo añade.
+        """
+        fila = self.obtener(nombre_apartamento)
+        if fila is not None:
+            return fila
+
+        with trazas.span("almacen.apartamento", etapa="supabase"):
+            supabase = await obtener_supabase()
+            response = await supabase.table("apartamentos").select("*").eq("nombre", nombre_apartamento).execute()
+        if not response.data:
+            return None
+        fila = response.data[0]
+        self._por_nombre[normalizar_texto(fila.get("nombre") or nombre_apartamento)] = fila
+        return fila
+
+    async def invalidar(self, nombre_apartamento=None):
+        """Recarga todo el catálogo, o solo un apartamento si se indica su nombre."""
+        if nombre_apartamento is None:
+            await self.cargar()
+            return
+
+        clave = normalizar_texto(nombre_apartamento)
+        anterior = self._por_nombre.pop(clave, None)
+        fila = await self.buscar(nombre_apartamento)
+        if anterior is not None:
+            self._invalidar_respuestas_cambiadas({clave: anterior}, {clave: fila} if fila else {})
+
+    async def _recargar_periodicamente(self):
+        # 🔹 La primera carga también va en segundo plano: arrancar no espera a Supabase
+        # y, mientras tanto, `buscar` consulta los apartamentos que falten uno a uno.
+        primera = True
+        while True:
+            if not primera:
+                await asyncio.sleep(self.intervalo)
+            try:
+                await self.cargar()
+            except Exception as e:
+                log.error("Error al cargar el catálogo de apartamentos", categoria="catalogo", primera_carga=primera, error=str(e))
+            primera = False
+
+    async def iniciar(self):
+        """Arranca la carga inicial y la recarga periódica en segundo plano (sin bloquear el arranque)."""
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._recargar_periodicamente())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+    def __len__(self):
+        return len(self._por_nombre)
+
+
+# 🔹 Instancia compartida por todo el proceso
+catalogo_apartamentos = CatalogoApartamentos()
@@ -0,0 +1,328 @@
+import os
+import json
+import asyncio
+from datetime import datetime
+import numpy as np
+from app import registro, trazas
+from app.geo import IndiceGeo
+from app.horarios import HorariosSemanales
+from app.preclasificador import normalizar_texto
+
+log = registro.obtener(__name__)
+
+###############################################################################
+# Catálogo en memoria de locales (restaurantes) con índices invertidos
+###############################################################################
+#
+# Los locales se cargan de un JSON (`datos/restaurantes.json`) o, si se configura
+# `CATALOGO_RESTAURANTES_TABLA`, de esa tabla de Supabase. Al cargar se construye un
+# índice invertido por cada atributo (`tipo_cocina`, `budget`, `poblacion`) y otro por
+# etiqueta libre ("terraza", "vistas al mar"...): valor normalizado -> mapa de bits con
+# los locales que lo tienen (bit i = i-ésimo local en orden de id).
+#
+#     catalogo_restaurantes.buscar(tipo_cocina="italiano", budget=["barato", "medio"],
+#                                  poblacion="Calafell", etiquetas=["terraza"], excluir_ids={4})
+#
+#   - Cada filtro acepta un valor o una lista (cualquiera de ellos vale). Los filtros se
+#     combinan con AND/OR sobre enteros de Python usados como mapas de bits, que con
+#     decenas de miles de locales son unos pocos KB: la consulta no recorre el catálogo
+#     y los primeros `limite` resultados salen de los bits más bajos.
+#   - Los valores que escribe el huésped (o el LLM) pasan por los sinónimos del fichero:
+#     "pizza" -> "italiano", "económico" -> "barato".
+#   - Al cargar también se construyen el índice geográfico (`app/geo.py`) y los horarios
+#     semanales (`app/horarios.py`): `cercanos(origen, n, radio_km, abierto_en=...)`
+#     devuelve los más próximos que cumplen los filtros y están abiertos.
+#   - Lo que abre cada (día de la semana, mes) queda precalculado en 84 mapas de bits, así
+#     que `mascara(abierto_el=fecha, ...)` es un AND más.
+#   - `python -m benchmarks.catalogo_locales` mide la latencia de las consultas.
+
+RUTA_RESTAURANTES = os.path.join(os.path.dirname(__file__), "datos", "restaurantes.json")
+RUTA_ACTIVIDADES = os.path.join(os.path.dirname(__file__), "datos", "actividades.json")
+
+CAMPOS_INDEXADOS = ("tipo_cocina", "budget", "poblacion")
+CAMPO_ETIQUETAS = "etiquetas"
+
+
+def _mascara_de(bits: np.ndarray) -> int:
+    """Vector booleano (una posición por local) -> mapa de bits."""
+    return int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+
+
+def _como_lista(valor) -> list:
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        return [valor]
+    return list(valor)
+
+
+class CatalogoLocales:
+    def __init__(self, nombre: str, ruta: str = None, tabla: str = None,
+                 campos: tuple = CAMPOS_INDEXADOS, campo_etiquetas: str = CAMPO_ETIQUETAS):
+        self.nombre = nombre
+        self.ruta = ruta
+        self.tabla = tabla
+        self.campos = campos
+        self.campo_etiquetas = campo_etiquetas
+        self.cargado_en = None
+        self._por_id = {}
+        self._locales = []              # posición del bit -> local
+        self._posicion = {}             # id -> posición del bit
+        self._todos = 0
+        self.geo = IndiceGeo([], [])
+        self.horarios = HorariosSemanales([])
+        self._abiertos_el = [[0] * 12 for _ in range(7)]
+        self._indices = {campo: {} for campo in (*campos, campo_etiquetas)}
+        self._sinonimos = {}
+        self.extras = {}                # resto de claves del JSON (p. ej. `afinidades_cocina`)
+        self._por_longitud = {}
+        self._lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------ carga
+
+    def indexar(self, locales, sinonimos: dict = None, extras: dict = None):
+        """Construye los índices de una sola vez y los sustituye (las consultas en curso ven los anteriores)."""
+        locales = sorted(locales, key=lambda local: local["id"])
+        posiciones = {campo: {} for campo in (*self.campos, self.campo_etiquetas)}
+        for posicion, local in enumerate(locales):
+            for campo in posiciones:
+                for valor in _como_lista(local.get(campo)):
+                    posiciones[campo].setdefault(normalizar_texto(valor), []).append(posicion)
+
+        indices = {}
+        for campo, por_valor in posiciones.items():
+            indices[campo] = {}
+            for valor, lista in por_valor.items():
+                bits = np.zeros(len(locales), dtype=bool)
+                bits[lista] = True
+                indices[campo][valor] = _mascara_de(bits)
+
+        self._sinonimos = {
+            campo: {normalizar_texto(alias): normalizar_texto(valor) for alias, valor in tabla.items()}
+            for campo, tabla in (sinonimos or {}).items()
+        }
+        # Valores más largos primero: "vistas al mar" antes que "mar"
+        self._por_longitud = {campo: sorted(indice, key=len, reverse=True) for campo, indice in indices.items()}
+        self.extras = extras or {}
+        self._locales = locales
+        self._posicion = {local["id"]: posicion for posicion, local in enumerate(locales)}
+        self._por_id = {local["id"]: local for local in locales}
+        self._todos = (1 << len(locales)) - 1
+        self._indices = indices
+        self.geo = IndiceGeo(
+            [l.get("latitud") if l.get("latitud") is not None else np.nan for l in locales],
+            [l.get("longitud") if l.get("longitud") is not None else np.nan for l in locales],
+        )
+        horarios = HorariosSemanales(locales)
+        # 🔹 "¿Qué abre ese día?" precalculado: un mapa de bits por (día de la semana, mes)
+        self._abiertos_el = [
+            [_mascara_de(horarios.abiertos_dia(dia) & horarios.en_temporada(mes)) for mes in range(1, 13)]
+            for dia in range(7)
+        ]
+        self.horarios = horarios
+        self.cargado_en = datetime.utcnow().isoformat()
+        log.info("Catálogo de locales cargado", categoria="catalogo", catalogo=self.nombre, locales=len(locales))
+
+    def _leer_fichero(self, ruta: str = None) -> dict:
+        """El JSON `{"sinonimos": {...}, "locales": [...], ...}` (o directamente la lista de locales)."""
+        ruta = ruta or self.ruta
+        if not ruta or not os.path.exists(ruta):
+            return {}
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        return {"locales": datos} if isinstance(datos, list) else datos
+
+    def _extras(self, datos: dict) -> dict:
+        return {clave: valor for clave, valor in datos.items() if clave not in ("locales", "sinonimos")}
+
+    def cargar_fichero(self, ruta: str = None):
+        datos = self._leer_fichero(ruta)
+        self.indexar(datos.get("locales", []), datos.get("sinonimos"), self._extras(datos))
+
+    async def cargar_tabla(self, tabla: str = None):
+        """Carga los locales de una tabla de Supabase; los sinónimos y extras siguen saliendo del fichero."""
+        from app.database import obtener_supabase
+
+        async with self._lock:
+            with trazas.span("almacen.locales", etapa="supabase"):
+                supabase = await obtener_supabase()
+                response = await supabase.table(tabla or self.tabla).select("*").execute()
+            datos = self._leer_fichero()
+            self.indexar(response.data or [], datos.get("sinonimos"), self._extras(datos))
+
+    async def iniciar(self):
+        """Carga el catálogo (y construye sus índices) al arrancar: de la tabla si hay, si no del fichero."""
+        try:
+            if self.tabla:
+                await self.cargar_tabla()
+            elif self.ruta:
+                self.cargar_fichero()
+        except Exception as e:
+            log.error("Error al cargar el catálogo de locales", categoria="catalogo", catalogo=self.nombre, error=str(e))
+
+    def _asegurar_cargado(self):
+        if self.cargado_en is None and self.ruta:
+            self.cargar_fichero()
+
+    # ---------------------------------------------------------------- consulta
+
+    def canonico(self, campo: str, valor: str) -> str:
+        """Valor normalizado y traducido con los sinónimos del catálogo ("Pizzería" -> "italiano")."""
+        self._asegurar_cargado()
+        normalizado = normalizar_texto(valor or "")
+        return self._sinonimos.get(campo, {}).get(normalizado, normalizado)
+
+    def valores_en(self, campo: str, texto: str) -> list:
+        """Valores de un índice (o sus sinónimos) que aparecen en un texto libre, p. ej. `mas_informacion`."""
+        self._asegurar_cargado()
+        relleno = f" {normalizar_texto(texto or '')} "
+        encontrados = []
+        for valor in self._por_longitud[campo]:
+            if f" {valor} " in relleno:
+                encontrados.append(valor)
+                relleno = relleno.replace(f" {valor} ", " ")
+        alias = self._sinonimos.get(campo, {})
+        encontrados += [valor for clave, valor in alias.items() if f" {clave} " in relleno and valor not in encontrados]
+        return encontrados
+
+    def etiquetas_en(self, texto: str) -> list:
+        return self.valores_en(self.campo_etiquetas, texto)
+
+    def _mascara_valores(self, campo: str, valores) -> int:
+        indice = self._indices[campo]
+        mascara = 0
+        for valor in valores:
+            mascara |= indice.get(self.canonico(campo, valor), 0)
+        return mascara
+
+    def mascara(self, excluir_ids=None, excluir_etiquetas=None, abierto_el=None, **filtros) -> int:
+        """
+        Mapa de bits de los locales que cumplen todos los filtros (`campo=valor` o
+        `campo=[valores]`, con `etiquetas=[...]` exigiendo todas), abren algún rato el día
+        `abierto_el` (`date`; día de la semana y temporada) y no están excluidos.
+        """
+        self._asegurar_cargado()
+        mascara = self._todos
+        if abierto_el is not None:
+            mascara &= self._abiertos_el[abierto_el.weekday()][abierto_el.month - 1]
+        for campo, valor in filtros.items():
+            valores = _como_lista(valor)
+            if not valores:
+                continue
+            if campo == self.campo_etiquetas:
+                for etiqueta in valores:
+                    mascara &= self._mascara_valores(campo, [etiqueta])
+            elif campo in self.campos:
+                mascara &= self._mascara_valores(campo, valores)
+            else:
+                raise ValueError(f"❌ Campo no indexado en el catálogo {self.nombre}: {campo}")
+            if not mascara:
+                return 0
+
+        if excluir_etiquetas:
+            mascara &= ~self._mascara_valores(self.campo_etiquetas, _como_lista(excluir_etiquetas))
+        for identificador in excluir_ids or ():
+            posicion = self._posicion.get(identificador)
+            if posicion is not None:
+                mascara &= ~(1 << posicion)
+        return mascara
+
+    def posiciones(self, mascara: int, limite: int = None) -> list:
+        """Posiciones de los bits activos, de menor a mayor; con `limite`, solo las primeras."""
+        if limite is not None and limite <= 16:
+            resultado = []
+            while mascara and len(resultado) < limite:
+                bajo = mascara & -mascara
+                resultado.append(bajo.bit_length() - 1)
+                mascara ^= bajo
+            return resultado
+        posiciones = np.flatnonzero(self.vector(mascara))
+        return (posiciones[:limite] if limite else posiciones).tolist()
+
+    def vector(self, mascara: int) -> np.ndarray:
+        """El mapa de bits como vector booleano de NumPy (una posición por local)."""
+        bytes_mascara = mascara.to_bytes((len(self._locales) + 7) // 8, "little")
+        bits = np.unpackbits(np.frombuffer(bytes_mascara, dtype=np.uint8), bitorder="little")
+        return bits[:len(self._locales)].astype(bool)
+
+    def buscar_ids(self, excluir_ids=None, excluir_etiquetas=None, **filtros) -> list:
+        """Ids (ordenados) de los locales que cumplen los filtros de `mascara`."""
+        posiciones = self.posiciones(self.mascara(excluir_ids, excluir_etiquetas, **filtros))
+        return [self._locales[p]["id"] for p in posiciones]
+
+    def buscar(self, limite: int = None, excluir_ids=None, excluir_etiquetas=None, **filtros) -> list:
+        """Como `buscar_ids`, pero devuelve los locales (ordenados por id) hasta `limite`."""
+        posiciones = self.posiciones(self.mascara(excluir_ids, excluir_etiquetas, **filtros), limite)
+        return [self._locales[p] for p in posiciones]
+
+    def contar(self, excluir_ids=None, excluir_etiquetas=None, **filtros) -> int:
+        return self.mascara(excluir_ids, excluir_etiquetas, **filtros).bit_count()
+
+    def cercanos(self, origen, n: int = 5, radio_km: float = 5.0, abierto_en=None, abierto_el=None,
+                 excluir_ids=None, excluir_etiquetas=None, **filtros) -> list:
+        """
+        Los `n` locales más cercanos a `origen` `(latitud, longitud)` a menos de `radio_km`
+        que cumplen los filtros de `mascara` (incluido `abierto_el`) y, si se indica, están
+        abiertos en el `datetime` `abierto_en`. Devuelve `[(local, km)]`.
+        """
+        self._asegurar_cargado()
+        permitidos = None
+        if filtros or excluir_ids or excluir_etiquetas or abierto_el is not None:
+            permitidos = self.vector(self.mascara(excluir_ids, excluir_etiquetas, abierto_el, **filtros))
+
+        def abiertos(posiciones):
+            return self.horarios.abiertos(abierto_en, posiciones)
+
+        filtro = abiertos if abierto_en is not None else None
+        posiciones, distancias = self.geo.cercanos(origen, n, radio_km, permitidos, filtro)
+        return [(self._locales[p], round(float(d), 2)) for p, d in zip(posiciones.tolist(), distancias.tolist())]
+
+    def vector_valor(self, campo: str, valor: str) -> np.ndarray:
+        """Vector booleano de los locales que tienen ese valor (ya normalizado) en el índice."""
+        return self.vector(self._indices[campo].get(valor, 0))
+
+    @property
+    def locales(self) -> list:
+        """Los locales en el orden de los bits (por id)."""
+        self._asegurar_cargado()
+        return self._locales
+
+    def posicion(self, identificador):
+        return self._posicion.get(identificador)
+
+    def obtener(self, identificador):
+        self._asegurar_cargado()
+        return self._por_id.get(identificador)
+
+    def valores(self, campo: str) -> list:
+        """Valores (normalizados) disponibles de un atributo, p. ej. para sugerirlos al huésped."""
+        self._asegurar_cargado()
+        return sorted(self._indices[campo])
+
+    def estadisticas(self) -> dict:
+        return {
+            "locales": len(self._por_id),
+            "cargado_en": self.cargado_en,
+            "valores_por_indice": {campo: len(indice) for campo, indice in self._indices.items()},
+            "con_coordenadas": len(self.geo),
+            "con_horario": self.horarios.con_horario,
+            "con_temporada": self.horarios.con_temporada,
+        }
+
+    def __len__(self):
+        self._asegurar_cargado()
+        return len(self._por_id)
+
+
+# 🔹 Instancia compartida por todo el proceso
+catalogo_restaurantes = CatalogoLocales(
+    "restaurantes",
+    ruta=RUTA_RESTAURANTES,
+    tabla=os.getenv("CATALOGO_RESTAURANTES_TABLA") or None,
+)
+catalogo_actividades = CatalogoLocales(
+    "actividades",
+    ruta=RUTA_ACTIVIDADES,
+    tabla=os.getenv("CATALOGO_ACTIVIDADES_TABLA") or None,
+    campos=("tipo", "poblacion", "grupos"),
+)
@@ -0,0 +1,90 @@
+###############################################################################
+# Árbol declarativo de categorías
+###############################################################################
+#
+# Cada intención de primer nivel puede tener subcategorías. Una hoja se identifica
+# como "<intencion>/<subcategoria>" (ej. "recomendaciones_personalizadas/restaurantes")
+# y el clasificador de `nlu.py` la devuelve en una sola llamada, de modo que
+# `dispatch_intent` salta directamente al manejador de la hoja.
+
+ARBOL_CATEGORIAS = {
+    "informacion_alojamiento": {
+        "descripcion": "Preguntas sobre características del alojamiento",
+        "subcategorias": {
+            "instalaciones": 'Servicios y comodidades del apartamento (ej. "¿Tienen WiFi?", "¿Hay secador de pelo?")',
+            "normas": 'Reglas y comportamiento dentro del apartamento (ej. "¿A qué hora hay que hacer silencio?")',
+            "penalizaciones": 'Consecuencias de ciertas acciones (ej. "¿Cuánto cuesta perder las llaves?")',
+        },
+    },
+    "averia_estancia": {
+        "descripcion": "Reportes de problemas o averías en la estancia",
+    },
+    "servicios_adicionales": {
+        "descripcion": "Servicios extra que se pueden contratar durante la estancia",
+        "subcategorias": {
+            "limpieza": "Solicitudes de limpieza extra en el apartamento",
+            "transporte": "Transporte privado: si le pueden ir a buscar o llevar a algún lugar",
+            "packs": "Paquetes especiales o servicios adicionales",
+            "toallas_sombrillas": "Alquiler de toallas y sombrillas",
+        },
+    },
+    "recomendaciones_personalizadas": {
+        "descripcion": "Preguntas sobre turismo, comida y actividades en la zona",
+        "subcategorias": {
+            "restaurantes": "Opciones para comer, tipos de cocina, precios",
+            "actividades": "Lugares para visitar, tours, excursiones",
+            "transporte": "Cómo moverse por la zona, transporte público",
+        },
+    },
+    "alquilar_mas_dias": {
+        "descripcion": "Peticiones para extender la estancia",
+    },
+    "descuentos_promociones": {
+        "descripcion": "Preguntas sobre ofertas y descuentos",
+    },
+}
+
+SEPARADOR = "/"
+
+
+def separar_categoria(categoria: str):
+    """
+    Divide "intencion/subcategoria" en sus dos partes.
+    Si no hay subcategoría devuelve `(intencion, None)`.
+    """
+    intencion, _, subcategoria = categoria.partition(SEPARADOR)
+    return intencion, (subcategoria or None)
+
+
+def es_categoria_valida(categoria: str) -> bool:
+    """Comprueba que la categoría (hoja o intención de primer nivel) existe en el árbol."""
+    intencion, subcategoria = separar_categoria(categoria)
+    nodo = ARBOL_CATEGORIAS.get(intencion)
+    if nodo is None:
+        return False
+    return subcategoria is None or subcategoria in nodo.get("subcategorias", {})
+
+
+def hojas() -> list:
+    """Lista de todas las categorías finales del árbol, en el orden en que están declaradas."""
+    resultado = []
+    for intencion, nodo in ARBOL_CATEGORIAS.items():
+        subcategorias = nodo.get("subcategorias")
+        if subcategorias:
+            resultado.extend(f"{intencion}{SEPARADOR}{sub}" for sub in subcategorias)
+        else:
+            resultado.append(intencion)
+    return resultado
+
+
+def describir_arbol() -> str:
+    """Genera el listado de categorías finales que se incluye en el prompt del clasificador."""
+    lineas = []
+    for intencion, nodo in ARBOL_CATEGORIAS.items():
+        subcategorias = nodo.get("subcategorias")
+        if not subcategorias:
+            lineas.append(f"- **{intencion}** - {nodo['descripcion']}")
+            continue
+        for sub, descripcion in subcategorias.items():
+            lineas.append(f"- **{intencion}{SEPARADOR}{sub}** - {nodo['descripcion']}: {descripcion}")
+    return "\n".join(lineas)
@@ -1,24 +1,20 @@
-import os
-import json
-from dotenv import load_dotenv
-from app.database import get_dynamic_state, save_dynamic_state
-from openai import OpenAI
-from openai import OpenAI
+from app import llm, prompts, registro, trazas
 from app.categorias.tipo_informacion.handle_instalaciones import handle_apartment_info
 from app.categorias.tipo_informacion.handle_normas import handle_normas_info
 from app.categorias.tipo_informacion.handle_penalizaciones import handle_penalizacion_info
-# Cargar variables de entorno
-# 🔹 Cargar variables de entorno
-load_dotenv()
+from app.memory import get_token_window
 
-# 🔹 Verificar si la clave API está configurada correctamente
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("❌ ERROR: La API Key de OpenAI no está configurada correctamente.")
-client = OpenAI(api_key=api_key)
+log = registro.obtener(__name__)
 
+# 🔹 Subcategoría del árbol que corresponde a cada respuesta del clasificador (para las métricas)
+SUBCATEGORIAS = {
+    "Instalaciones": "instalaciones",
+    "Normas": "normas",
+    "Penalizaciones": "penalizaciones",
+}
 
-def categorizar_pregunta_informacion(numero, user_message,nombre_apartamento):
+
+async def categorizar_pregunta_informacion(conv_state, user_message, nombre_apartamento):
     """
     Clasifica el mensaje del usuario en una de las siguientes categorías:
 
@@ -27,68 +23,33 @@ def categorizar_pregunta_informacion(numero, user_message,nombre_apartamento):
     3️⃣ **Penalizaciones** - Preguntas sobre consecuencias de ciertas acciones (ej. "¿Qué pasa si pierdo las llaves?")
     """
 
-    # 🔹 **1️⃣ Obtener estado del usuario (Memoria en Supabase)**
-    conv_state = get_dynamic_state(numero)
+    # 🔹 **1️⃣ El estado del usuario (Memoria en Supabase) llega desde la sesión de `/chat`**
 
     # 🔹 **2️⃣ Construcción de memoria híbrida (Supabase + Ventana de tokens)**
-    historial = []
-    for msg in conv_state.historial[-10:]:  
-        if isinstance(msg, dict) and "usuario" in msg and "bot" in msg:
-            historial.append({"role": "user", "content": msg["usuario"]})
-
-            # Convertir bot a string si es un diccionario
-            bot_response = msg["bot"]
-            if isinstance(bot_response, dict):
-                bot_response = json.dumps(bot_response, ensure_ascii=False)  
-
-            historial.append({"role": "assistant", "content": bot_response})
+    historial = get_token_window(conv_state, "categorizacion")
 
     # 📌 **3️⃣ Generar el prompt para OpenAI**
-    classification_prompt = f"""
-    Eres un asistente experto en clasificar preguntas de usuarios sobre su estancia en un apartamento turístico.  
-    📌 **Tu tarea es analizar el mensaje y clasificarlo en una de las siguientes categorías:**  
-
-    1️⃣ **Instalaciones** - Preguntas sobre servicios y comodidades del apartamento (ej. "¿Tienen WiFi?", "¿Hay secador de pelo?").  
-    2️⃣ **Normas** - Preguntas sobre reglas y comportamiento dentro del apartamento (ej. "¿A qué hora hay que hacer silencio?").  
-    3️⃣ **Penalizaciones** - Preguntas sobre consecuencias de ciertas acciones (ej. "¿Cuánto cuesta perder las llaves?").  
-
-    📌 **Reglas importantes:**  
-    🔹 **Usa solo las categorías indicadas.**  
-    🔹 **Si el mensaje no encaja exactamente en una categoría, elige la más cercana.**  
-
-    📌 **Historial de conversación reciente:**  
-    {json.dumps(historial, ensure_ascii=False, indent=2)}
-
-    📌 **Mensaje del usuario:**  
-    "{user_message}"  
-
-    🔹 **Devuelve SIEMPRE un JSON puro con esta estructura exacta (sin texto adicional, sin backticks):**  
-    {{
-      "Categoria": "<nombre de la categoría>"
-    }}
-    """
+    mensajes = prompts.mensajes(
+        "categorizacion_informacion",
+        historial=historial,
+        mensaje_usuario=user_message,
+    )
 
     # 🔹 **4️⃣ Llamada a OpenAI**
     try:
-        classification_response = client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "system", "content": classification_prompt}],
-            max_tokens=50,
-            temperature=0
-        )
-        
-        response_text = classification_response.choices[0].message.content.strip()
-        category_result = json.loads(response_text)
+        response_text = await llm.completar("categorizacion", mensajes)
+        category_result = llm.parsear_json(response_text)
 
-        print("📌 Respuesta de OpenAI para clasificación:", category_result)
+        log.debug("Respuesta de OpenAI para clasificación", categoria="respuesta_llm", etapa="categorizacion", resultado=category_result)
+        trazas.etiquetar(subcategoria=SUBCATEGORIAS.get(category_result.get("Categoria")))
 
         # 🔹 **5️⃣ Redirigir la consulta a la función correspondiente**
         if category_result.get("Categoria") == "Instalaciones":
-            return handle_apartment_info(numero, user_message,nombre_apartamento)
+            return await handle_apartment_info(conv_state, user_message, nombre_apartamento)
         elif category_result.get("Categoria") == "Normas":
-            return handle_normas_info(numero, user_message,nombre_apartamento)
+            return await handle_normas_info(conv_state, user_message, nombre_apartamento)
         elif category_result.get("Categoria") == "Penalizaciones":
-            return handle_penalizacion_info(numero, user_message,nombre_apartamento)
+            return await handle_penalizacion_info(conv_state, user_message, nombre_apartamento)
     except Exception as e:
-        print(f"❌ Error en clasificación de categoría: {e}")
+        log.error("Error en clasificación de categoría", categoria="clasificacion", error=str(e))
         return {"Categoria": "No clasificado"}  # Por defecto
\ No newline at end of file
@@ -1,22 +1,20 @@
-import os
-import json
-from openai import OpenAI
-from dotenv import load_dotenv
-from app.database import get_dynamic_state
+from app import llm, prompts, registro, trazas
 from app.categorias.tipo_de_recomendacion.recomendaciones_restaurantes import handle_recomendaciones 
 from app.categorias.tipo_de_recomendacion.actividades_ocio import handle_actividades_ocio
 from app.categorias.tipo_de_recomendacion.transporte_movilidad import handle_transporte
-# Cargar variables de entorno
-load_dotenv()
+from app.memory import get_token_window
 
-# Verificar si la clave API está configurada correctamente
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("❌ ERROR: La API Key de OpenAI no está configurada correctamente.")
-client = OpenAI(api_key=api_key)
+log = registro.obtener(__name__)
 
+# 🔹 Subcategoría del árbol que corresponde a cada respuesta del clasificador (para las métricas)
+SUBCATEGORIAS = {
+    "Restaurantes y Comida": "restaurantes",
+    "Actividades y Ocio": "actividades",
+    "Transporte y Movilidad": "transporte",
+}
 
-def categorizar_recomendacion(numero, user_message,nombre_apartamento):
+
+async def categorizar_recomendacion(conv_state, user_message, nombre_apartamento):
     """
     Clasifica el mensaje del usuario en una de las siguientes categorías:
     
@@ -27,68 +25,33 @@ def categorizar_recomendacion(numero, user_message,nombre_apartamento):
     5️⃣ Servicios y Otros
     """
 
-    # 🔹 **1️⃣ Obtener estado del usuario (Memoria en Supabase)**
-    conv_state = get_dynamic_state(numero)
+    # 🔹 **1️⃣ El estado del usuario (Memoria en Supabase) llega desde la sesión de `/chat`**
 
     # 🔹 **2️⃣ Construcción de memoria híbrida (Supabase + Ventana de tokens)**
-    historial = []
-    for msg in conv_state.historial[-10:]:  
-        if isinstance(msg, dict) and "usuario" in msg and "bot" in msg:
-            historial.append({"role": "user", "content": msg["usuario"]})
-
-            # Convertir bot a string si es un diccionario
-            bot_response = msg["bot"]
-            if isinstance(bot_response, dict):
-                bot_response = json.dumps(bot_response, ensure_ascii=False)  
-
-            historial.append({"role": "assistant", "content": bot_response})
+    historial = get_token_window(conv_state, "categorizacion")
 
     # 📌 **3️⃣ Generar el prompt para OpenAI**
-    classification_prompt = f"""
-    Eres un asistente experto en clasificar consultas de usuarios en función de su contenido.  
-    📌 **Tu tarea es analizar el mensaje y clasificarlo en una de las siguientes categorías:**  
-
-    1️⃣ **Actividades y Ocio** - Lugares para visitar, tours, excursiones.  
-    2️⃣ **Restaurantes y Comida** - Opciones para comer, tipos de cocina, precios.  
-    3️⃣ **Transporte y Movilidad** - Cómo moverse por la zona, transporte público.  
-    📌 **Reglas importantes:**  
-    🔹 **Usa solo las categorías indicadas.**  
-    🔹 **Si el mensaje no encaja exactamente en una categoría, elige la más cercana.**  
-
-    📌 **Historial de conversación reciente:**  
-    {json.dumps(historial, ensure_ascii=False, indent=2)}
-
-    📌 **Mensaje del usuario:**  
-    "{user_message}"  
-
-    🔹 **Devuelve SIEMPRE un JSON puro con esta estructura exacta (sin texto adicional, sin backticks):**  
-    {{
-      "Categoria": "<nombre de la categoría>"
-    }}
-    
-    """
+    mensajes = prompts.mensajes(
+        "categorizacion_recomendacion",
+        historial=historial,
+        mensaje_usuario=user_message,
+    )
 
     # 🔹 **4️⃣ Llamada a OpenAI**
     try:
-        classification_response = client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[{"role": "system", "content": classification_prompt}],
-            max_tokens=50,
-            temperature=0
-        )
-        
-        response_text = classification_response.choices[0].message.content.strip()
-        category_result = json.loads(response_text)
+        response_text = await llm.completar("categorizacion", mensajes)
+        category_result = llm.parsear_json(response_text)
 
-        print("📌 Respuesta de OpenAI para clasificación:", category_result)
+        log.debug("Respuesta de OpenAI para clasificación", categoria="respuesta_llm", etapa="categorizacion", resultado=category_result)
+        trazas.etiquetar(subcategoria=SUBCATEGORIAS.get(category_result.get("Categoria")))
 
         # 🔹 **5️⃣ Redirigir la consulta a la función correspondiente**
         if category_result.get("Categoria") == "Restaurantes y Comida":
-            return handle_recomendaciones(numero, user_message)
+            return await handle_recomendaciones(conv_state, user_message, nombre_apartamento)
         elif category_result.get("Categoria") == "Actividades y Ocio":
-            return handle_actividades_ocio(numero, user_message)
+            return await handle_actividades_ocio(conv_state, user_message, nombre_apartamento)
         elif category_result.get("Categoria") == "Transporte y Movilidad":
-            return handle_transporte(numero, user_message,nombre_apartamento)
+            return await handle_transporte(conv_state, user_message, nombre_apartamento)
     except Exception as e:
-        print(f"❌ Error en clasificación de categoría: {e}")
+        log.error("Error en clasificación de categoría", categoria="clasificacion", error=str(e))
         return {"Categoria": "Servicios y Otros"}  # Por defecto
\ No newline at end of file
@@ -1,83 +1,86 @@
-import os
+import asyncio
 import json
-from dotenv import load_dotenv
 from datetime import datetime
-from app.database import get_dynamic_state, save_dynamic_state
+from app.database import ConversationSession
+from app import fechas, llm, prompts, registro
+from app.catalogo_apartamentos import catalogo_apartamentos
 
-# 🔹 Cargar variables de entorno
-load_dotenv()
+log = registro.obtener(__name__)
 
-def handle_limpieza(numero, user_message):
+# 🔹 Preguntas de la vía rápida cuando el mensaje solo trae uno de los dos datos
+PREGUNTAS = {
+    "fecha": {"es": "¿Qué día quieres la limpieza?", "en": "Which day would you like the cleaning?"},
+    "hora": {"es": "¿A qué hora te va bien la limpieza?", "en": "What time would suit you for the cleaning?"},
+}
+CONFIRMACION = {
+    "es": "✅ ¡Limpieza programada para el {fecha} a las {hora}!",
+    "en": "✅ Cleaning scheduled for {fecha} at {hora}!",
+}
+
+
+def confirmacion(fecha, hora, idioma: str = "es") -> str:
+    idioma = idioma if idioma in CONFIRMACION else "es"
+    return CONFIRMACION[idioma].format(fecha=fechas.describir_fecha(fecha, idioma), hora=hora)
+
+
+async def handle_limpieza(conv_state, user_message, nombre_apartamento=None):
     """
     Maneja solicitudes de limpieza en la estancia.
     Pregunta los datos faltantes y agenda cuando toda la información esté completa.
     """
-    # 🔹 **1️⃣ Obtener estado dinámico del usuario en Supabase**
-    conv_state = get_dynamic_state(numero)
+    # 🔹 **1️⃣ El estado dinámico del usuario llega desde la sesión de `/chat`**
 
     # 🔹 **2️⃣ Revisar si ya tiene la información necesaria**
-    fecha = conv_state["datos_categoria"].get("fecha", "No definido")
-    hora = conv_state["datos_categoria"].get("hora", "No definido")
+    fecha = conv_state.datos_categoria.get("fecha", "No definido")
+    hora = conv_state.datos_categoria.get("hora", "No definido")
+
+    # 🔹 **⚡ Vía rápida: fecha y hora con el intérprete local, sin LLM**
+    apartamento = catalogo_apartamentos.obtener(nombre_apartamento) or {}
+    local = fechas.interpretar(user_message, fechas.ahora_local(apartamento.get("zona_horaria")))
+    fechas.registrar_turno(local)
+    if local["fecha"] or local["hora"]:
+        fecha = local["fecha"] or fecha
+        hora = local["hora"] or hora
+        conv_state.datos_categoria["fecha"] = fecha
+        conv_state.datos_categoria["hora"] = hora
+        log.info("Limpieza interpretada sin LLM", categoria="limpieza", fecha=fecha, hora=hora)
+
+        idioma = conv_state.idioma if conv_state.idioma in ("es", "en") else "es"
+        for dato, valor in (("fecha", fecha), ("hora", hora)):
+            if valor == "No definido":
+                return PREGUNTAS[dato][idioma]
+        return confirmacion(fecha, hora, idioma)
 
     # 🔹 **3️⃣ Generar el prompt para OpenAI para verificar si faltan datos**
-    info_prompt = f"""
-    Eres un asistente de gestión de limpiezas para apartamentos turísticos.
-    📌 **Antes de agendar una limpieza, debes asegurarte de que el usuario proporcionó la fecha y la hora.**
-    
-    - Si ya tiene toda la información, responde con `"respuesta_al_cliente": null`.
-    - Si falta algún dato, responde con la pregunta que debe hacer.
-    - Interpreta correctamente expresiones como "hoy", "mañana", "el próximo lunes".
-    - La hora debe estar en formato 24 horas (HH:MM).
-
-    📌 **Datos actuales en memoria:**  
-    - **Fecha:** {fecha}
-    - **Hora:** {hora}
-
-    📌 **Mensaje del usuario**:
-    "{user_message}"
-
-    📌 **Estructura esperada en JSON**:
-    {{
-        "fecha": "<fecha o 'No definido'>",
-        "hora": "<hora o 'No definido'>",
-        "respuesta_al_cliente": "<pregunta al usuario o null>"
-    }}
-    """
-    print("📌 Prompt enviado a OpenAI:\n", info_prompt) 
+    mensajes = prompts.mensajes(
+        "limpieza",
+        fecha=fecha,
+        hora=hora,
+        mensaje_usuario=user_message,
+    )
+    log.prompt("limpieza", mensajes)
 
     # 🔹 **4️⃣ Llamada a OpenAI para procesar el mensaje**
-    from openai import OpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-
-    info_response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "system", "content": info_prompt}],
-        max_tokens=100,
-        temperature=0
-    )
+    response_text = await llm.completar("limpieza", mensajes)
 
-    response_text = info_response.choices[0].message.content.strip()
 
     # 🔹 **5️⃣ Validar si la respuesta es JSON**
     try:
-        result = json.loads(response_text)
+        result = llm.parsear_json(response_text)
     except json.JSONDecodeError:
         return "❌ Hubo un problema al procesar tu solicitud, intenta de nuevo."
 
     # 🔹 **6️⃣ Guardar información nueva en `dinamic`**
     if isinstance(result, dict):
-        conv_state["datos_categoria"]["fecha"] = result.get("fecha", fecha)
-        conv_state["datos_categoria"]["hora"] = result.get("hora", hora)
-
-        save_dynamic_state(conv_state.to_dict())  # Guardamos en Supabase
+        conv_state.datos_categoria["fecha"] = result.get("fecha", fecha)
+        conv_state.datos_categoria["hora"] = result.get("hora", hora)
 
     # 🔹 **7️⃣ Si falta información, preguntar al usuario**
     if result.get("respuesta_al_cliente") is not None:
         return result["respuesta_al_cliente"]
 
     # 🔹 **8️⃣ Si ya tiene toda la información, confirmar**
-    return f"✅ ¡Limpieza programada para el {result['fecha']} a las {result['hora']}!"
+    return confirmacion(result.get("fecha", fecha), result.get("hora", hora), conv_state.idioma)
     
 
 # 🔹 **Ejemplo de uso**
@@ -85,5 +88,9 @@ if __name__ == "__main__":
     numero = "644123456"  # Simulación de número de teléfono en lugar de user_id
     user_message = "¿Podrían limpiar mi apartamento el próximo lunes a las 10 de la mañana?"  # Mensaje de ejemplo
 
-    response = handle_limpieza(numero, user_message)
+    async def _ejemplo():
+        async with ConversationSession(numero) as conv_state:
+            return await handle_limpieza(conv_state, user_message)
+
+    response = asyncio.run(_ejemplo())
     print(response)
\ No newline at end of file
@@ -1,106 +1,162 @@
 import os
 import json
-from datetime import datetime
-from app.database import get_dynamic_state, save_dynamic_state
-from openai import OpenAI
+from app.database import ConversationState
+from app import fechas, geo, llm, prompts, registro
+from app.catalogo_apartamentos import catalogo_apartamentos
+from app.catalogo_locales import catalogo_actividades
+from app.horarios import tramos_del_dia
+from app.memory import anotar_sugeridos, get_token_window, ya_sugeridos
+from app.ranking_actividades import buscar_actividades, criterios_desde_slots
+
+log = registro.obtener(__name__)
+
+MAX_ACTIVIDADES = int(os.getenv("ACTIVIDADES_MAX", 3))
+# Si cambia alguno, las actividades ya sugeridas vuelven a valer
+SLOTS = ("dia", "tipo_grupo", "mas_informacion")
+
+TEXTOS = {
+    "es": {
+        "exactas": "🎯 Para el {fecha} te propongo:",
+        "parecidas": "🎯 Para el {fecha} no he encontrado justo eso, pero estas te pueden gustar:",
+        "sin_fecha": "🎯 Te propongo:",
+        "ninguna": "😕 No me quedan actividades que encajen para ese día. ¿Quieres probar con otro día u otro plan?",
+        "cercanas": "📍 Abiertas ahora cerca de tu apartamento:",
+        "sin_cercanas": "😕 Ahora mismo no hay ninguna actividad abierta a menos de {radio:g} km. ¿Te busco algo para otro día?",
+    },
+    "en": {
+        "exactas": "🎯 For {fecha} I suggest:",
+        "parecidas": "🎯 I couldn't find exactly that for {fecha}, but you may like these:",
+        "sin_fecha": "🎯 I suggest:",
+        "ninguna": "😕 I have no more activities for that day. Would you like to try another day or plan?",
+        "cercanas": "📍 Open now near your apartment:",
+        "sin_cercanas": "😕 There is nothing open right now within {radio:g} km. Shall I look for something on another day?",
+    },
+}
+
+
+def actividades_cercanas(texto: str, origen, ahora=None) -> list:
+    """Las actividades abiertas `ahora` (hora local del apartamento) más cercanas a él (del tipo que nombre el mensaje). Sin LLM."""
+    cercanas = catalogo_actividades.cercanos(
+        origen,
+        n=geo.MAX_CERCANOS,
+        radio_km=geo.RADIO_CERCANIA_KM,
+        abierto_en=ahora or fechas.ahora_local(),
+        tipo=catalogo_actividades.valores_en("tipo", texto),
+    )
+    return [{"actividad": actividad, "exacto": True, "distancia_km": km} for actividad, km in cercanas]
+
+
+def formatear_actividades(actividades: list, cabecera: str, dia_semana: int = None) -> str:
+    """Con `dia_semana` (0 = lunes) se añade el horario de ese día a cada actividad."""
+    lineas = [cabecera]
+    for posicion, propuesta in enumerate(actividades, 1):
+        actividad = propuesta["actividad"]
+        detalles = [actividad["tipo"], actividad["poblacion"]]
+        tramos = tramos_del_dia(actividad.get("horario"), dia_semana) if dia_semana is not None else []
+        if tramos:
+            detalles.append(f"🕒 {', '.join(tramos)}")
+        if propuesta["distancia_km"] is not None:
+            detalles.append(f"📍 {propuesta['distancia_km']:.1f} km")
+        etiquetas = ", ".join(actividad.get("etiquetas") or [])
+        lineas.append(
+            f"{posicion}. *{actividad['nombre']}* — {' · '.join(detalles)}"
+            + (f" ({etiquetas})" if etiquetas else "")
+        )
+    return "\n".join(lineas)
+
+
+def proponer_actividades(datos_categoria: dict, texto: str, origen, idioma: str = "es", ahora=None) -> tuple:
+    """
+    Con los slots completos, las mejores actividades para ese día y grupo (ver
+    `app/ranking_actividades.py`) y el texto para el huésped. Sin LLM. `ahora` (hora
+    local del apartamento) resuelve días relativos como "mañana".
+    """
+    textos = TEXTOS.get(idioma, TEXTOS["es"])
+    criterios = criterios_desde_slots(datos_categoria, texto, ahora or fechas.ahora_local())
+    sugeridas = ya_sugeridos(datos_categoria, "sugeridas", [datos_categoria.get(slot) for slot in SLOTS])
+    propuestas = buscar_actividades(criterios, origen, MAX_ACTIVIDADES, sugeridas)
+    if not propuestas:
+        return propuestas, textos["ninguna"]
+    fecha = criterios["fecha"]
+    if fecha is None:
+        cabecera = textos["sin_fecha"]
+    else:
+        clave = "exactas" if propuestas[0]["exacto"] else "parecidas"
+        cabecera = textos[clave].format(fecha=fechas.describir_fecha(fecha.isoformat(), idioma))
+    dia_semana = fecha.weekday() if fecha is not None else None
+    return propuestas, formatear_actividades(propuestas, cabecera, dia_semana)
 
-# Cargar la API Key de OpenAI
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
 
-def handle_actividades_ocio(numero_telefono, user_message):
+async def handle_actividades_ocio(conv_state: ConversationState, user_message, nombre_apartamento=None):
     """
     Maneja solicitudes de recomendación de actividades de ocio utilizando memoria dinámica.
     """
 
-    # 🔹 **1️⃣ Obtener estado del usuario (Memoria Dinámica - Supabase)**
-    conv_state = get_dynamic_state(numero_telefono)
+    # 🔹 **1️⃣ El estado del usuario (Memoria Dinámica - Supabase) llega desde la sesión de `/chat`**
+
+    # ⚡ **"¿Qué hay abierto cerca?" se contesta con el índice geográfico, sin OpenAI**
+    origen = catalogo_apartamentos.coordenadas(nombre_apartamento)
+    apartamento = catalogo_apartamentos.obtener(nombre_apartamento) or {}
+    ahora = fechas.ahora_local(apartamento.get("zona_horaria"))
+    if origen is not None and geo.es_consulta_cercania(user_message):
+        textos = TEXTOS.get(conv_state.idioma, TEXTOS["es"])
+        cercanas = actividades_cercanas(user_message, origen, ahora)
+        log.info("Actividades cercanas", categoria="recomendaciones", etapa="actividades",
+                 ids=[a["actividad"]["id"] for a in cercanas], origen=origen)
+        if not cercanas:
+            return textos["sin_cercanas"].format(radio=geo.RADIO_CERCANIA_KM)
+        return formatear_actividades(cercanas, textos["cercanas"])
 
     # 🔹 **2️⃣ Construcción de memoria híbrida (Supabase + Ventana de tokens)**
-    historial = []
-    for msg in conv_state.historial[-10:]:  # ✅ Corregido: Usar `conv_state.historial`
-        if isinstance(msg, dict) and "usuario" in msg and "bot" in msg:
-            historial.append({"role": "user", "content": str(msg["usuario"])})  # ✅ Asegurar que sea string
-            bot_response = msg["bot"]
-            if isinstance(bot_response, dict):  # ✅ Si es un JSON, convertirlo a string
-                bot_response = json.dumps(bot_response, ensure_ascii=False)  
-            historial.append({"role": "assistant", "content": str(bot_response)})  # ✅ Asegurar string
+    historial = get_token_window(conv_state, "actividades")
 
     # 📌 **3️⃣ Generar el prompt para OpenAI**
-    info_prompt = f"""
-    Eres un asistente especializado en recomendaciones de actividades de ocio.  
-    📌 **Todas las actividades recomendadas deben ser en Segur de Calafell, Calafell, Cunit o Comarruga.**  
-    📌 **Si el usuario menciona otra ciudad, infórmale que solo puedes recomendar en esa zona.**  
-
-    Tu tarea es analizar el mensaje del usuario y verificar si ya tiene todos los datos necesarios.  
-    📌 **Reglas Clave:**
-    🔹 **Si ya tiene el día y el tipo de grupo, devuelve un JSON con `"respuesta_al_cliente": null`.**  
-    🔹 **Si falta algún dato, devuelve un JSON con `"respuesta_al_cliente"` conteniendo la pregunta necesaria.**  
-    🔹 **NO devuelvas texto plano, siempre responde en formato JSON sin backticks.**  
-
-    📌 **Estructura de respuesta esperada:**
-    {{
-        "dia": "<día o 'No definido'>",
-        "tipo_grupo": "<familia / amigos / pareja o 'No definido'>",
-        "mas_informacion": "<información extra o 'No definido'>",
-        "respuesta_al_cliente": "<pregunta para el usuario o null>"
-    }}
-
-    📌 **Datos actuales en memoria:**  
-    - **Día de la actividad:** {conv_state.datos_categoria.get("dia", "No definido")}
-    - **Tipo de grupo:** {conv_state.datos_categoria.get("tipo_grupo", "No definido")}
-    - **Información adicional:** {conv_state.datos_categoria.get("mas_informacion", "No definido")}
-
-    📌 **Conversación Reciente (Ventana de Tokens)**:
-    {json.dumps(historial, ensure_ascii=False, indent=2)}
-
-    📌 **Mensaje del usuario**:
-    "{user_message}"
-    """
-
-    # 🔹 **4️⃣ Llamada a OpenAI**
-    info_response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "system", "content": info_prompt}],
-        max_tokens=100,
-        temperature=0
+    mensajes = prompts.mensajes(
+        "actividades",
+        dia=conv_state.datos_categoria.get("dia", "No definido"),
+        tipo_grupo=conv_state.datos_categoria.get("tipo_grupo", "No definido"),
+        mas_informacion=conv_state.datos_categoria.get("mas_informacion", "No definido"),
+        historial=historial,
+        mensaje_usuario=user_message,
     )
+    log.prompt("actividades", mensajes)
 
-    print("📌 Prompt enviado a OpenAI:\n", info_prompt)
-    response_text = info_response.choices[0].message.content.strip()
-    print("📌 Respuesta completa de OpenAI:", response_text)
+    # 🔹 **4️⃣ Llamada a OpenAI**
+    response_text = await llm.completar("actividades", mensajes)
 
-    # 🔹 **5️⃣ Eliminar backticks antes de parsear JSON**
-    if response_text.startswith("```json"):
-        response_text = response_text[7:].strip()  # Elimina ```json
-    if response_text.endswith("```"):
-        response_text = response_text[:-3].strip()  # Elimina ```
+    log.debug("Respuesta de OpenAI", categoria="respuesta_llm", etapa="actividades", texto=response_text)
 
     # 🔹 **6️⃣ Validar si la respuesta es realmente un JSON**
     try:
-        result = json.loads(response_text)  # Intentar parsear JSON
+        result = llm.parsear_json(response_text)  # Intentar parsear JSON
     except json.JSONDecodeError:
-        print("❌ OpenAI no devolvió un JSON válido. Usando respuesta normal.")
+        log.warning("OpenAI no devolvió un JSON válido; se usa la respuesta en texto", categoria="respuesta_llm", etapa="actividades")
         return response_text  # Devolver texto plano si OpenAI falló
 
-    # 🔹 **7️⃣ Actualizar y guardar la información en `dinamic`**
+    # 🔹 **7️⃣ Actualizar la información en `dinamic`**
     if isinstance(result, dict):  # Verificar que result sea un diccionario
         conv_state.datos_categoria["dia"] = result.get("dia", conv_state.datos_categoria.get("dia", "No definido"))
         conv_state.datos_categoria["tipo_grupo"] = result.get("tipo_grupo", conv_state.datos_categoria.get("tipo_grupo", "No definido"))
         conv_state.datos_categoria["mas_informacion"] = result.get("mas_informacion", conv_state.datos_categoria.get("mas_informacion", "No definido"))
 
-        # 📌 Debugging: Verificar si se actualiza correctamente
-        print("📌 datos_categoria actualizado antes de guardar:", json.dumps(conv_state.datos_categoria, indent=4, ensure_ascii=False))
+        log.debug("datos_categoria actualizado", categoria="estado", etapa="actividades", datos_categoria=dict(conv_state.datos_categoria))
 
-        # Guardamos la nueva información en Supabase
-        save_dynamic_state(conv_state.to_dict())
+        # La sesión de `/chat` guarda la nueva información en Supabase al terminar
     else:
-        print("⚠️ La respuesta de OpenAI no contiene datos válidos para actualizar `datos_categoria`.")
+        log.warning("La respuesta de OpenAI no contiene datos para `datos_categoria`", categoria="estado", etapa="actividades")
 
     # 🔹 **8️⃣ Si `"respuesta_al_cliente"` es `null`, significa que ya tiene toda la información**
     if result.get("respuesta_al_cliente") is None:
-        print("✅ Ya tiene toda la información necesaria, no se hacen más preguntas.")
-        return "Ya tengo toda la información necesaria. Te mostraré las mejores actividades en breve."
+        log.info("Información completa, no se hacen más preguntas", categoria="estado", etapa="actividades")
+        propuestas, texto = proponer_actividades(conv_state.datos_categoria, user_message, origen, conv_state.idioma, ahora)
+        ids = [p["actividad"]["id"] for p in propuestas]
+        # Las ya sugeridas no se repiten si el huésped pide más planes; agotadas, se vuelve a empezar
+        if ids:
+            anotar_sugeridos(conv_state.datos_categoria, "sugeridas", ids)
+        else:
+            conv_state.datos_categoria["sugeridas"] = []
+        log.info("Actividades recomendadas", categoria="recomendaciones", etapa="actividades", ids=ids)
+        return texto
 
     # 🔹 **9️⃣ Si falta información, devolver la pregunta al usuario**
     return result["respuesta_al_cliente"]
\ No newline at end of file
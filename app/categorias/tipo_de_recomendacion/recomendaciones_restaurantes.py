@@ -1,110 +1,155 @@
-import json
-from openai import OpenAI
-from app.database import get_dynamic_state, save_dynamic_state
 import os
+import json
+from app.database import ConversationState
+from app import fechas, geo, llm, prompts, registro
+from app.catalogo_apartamentos import catalogo_apartamentos
+from app.catalogo_locales import catalogo_restaurantes
+from app.ranking_restaurantes import obtener_ranking, preferencias_desde_slots
+from app.memory import anotar_sugeridos, get_token_window, ya_sugeridos
+
+log = registro.obtener(__name__)
+
+MAX_RECOMENDACIONES = int(os.getenv("RECOMENDACIONES_MAX", 3))
+# Si cambia alguno, los restaurantes ya sugeridos vuelven a valer
+SLOTS = ("tipo_cocina", "budget", "mas_informacion")
+
+TEXTOS = {
+    "es": {
+        "exactos": "🍽️ Te recomiendo:",
+        "parecidos": "🍽️ No he encontrado exactamente lo que buscas, pero estos se parecen mucho:",
+        "ninguno": "😕 No me quedan más restaurantes que encajen con lo que buscas. ¿Quieres probar con otro tipo de comida o presupuesto?",
+        "cercanos": "📍 Abiertos ahora cerca de tu apartamento:",
+        "sin_cercanos": "😕 Ahora mismo no hay ningún restaurante abierto a menos de {radio:g} km. ¿Te busco uno para más tarde?",
+    },
+    "en": {
+        "exactos": "🍽️ I recommend:",
+        "parecidos": "🍽️ I couldn't find an exact match, but these are very close:",
+        "ninguno": "😕 I have no more restaurants matching what you are looking for. Would you like to try another cuisine or budget?",
+        "cercanos": "📍 Open now near your apartment:",
+        "sin_cercanos": "😕 There are no restaurants open right now within {radio:g} km. Shall I look for one for later?",
+    },
+}
+
+
+def restaurantes_cercanos(texto: str, origen, ahora=None) -> list:
+    """
+    Los restaurantes abiertos `ahora` (hora local del apartamento) más cercanos a él (con
+    la cocina del mensaje, si nombra alguna), en el mismo formato que `buscar_restaurantes`. Sin LLM.
+    """
+    cercanos = catalogo_restaurantes.cercanos(
+        origen,
+        n=geo.MAX_CERCANOS,
+        radio_km=geo.RADIO_CERCANIA_KM,
+        abierto_en=ahora or fechas.ahora_local(),
+        tipo_cocina=catalogo_restaurantes.valores_en("tipo_cocina", texto),
+    )
+    return [{"local": local, "puntuacion": None, "exacto": True, "distancia_km": km} for local, km in cercanos]
+
 
-# Cargar la API Key de OpenAI
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+def buscar_restaurantes(datos_categoria: dict, texto: str = "", origen=None) -> list:
+    """
+    Puntúa todo el catálogo con los slots completos y devuelve los mejores (con
+    diversidad), sin repetir los ya sugeridos. Ver `app/ranking_restaurantes.py`.
+    """
+    preferencias = preferencias_desde_slots(datos_categoria, texto, origen)
+    return obtener_ranking().rankear(
+        k=MAX_RECOMENDACIONES,
+        excluir_ids=ya_sugeridos(datos_categoria, "sugeridos", [datos_categoria.get(slot) for slot in SLOTS]),
+        **preferencias,
+    )
 
-from datetime import datetime
 
-def handle_recomendaciones(numero, user_message,):
+def formatear_restaurantes(recomendados: list, idioma: str = "es", cabecera: str = None) -> str:
+    textos = TEXTOS.get(idioma, TEXTOS["es"])
+    if not recomendados:
+        return textos["ninguno"]
+    lineas = [cabecera or textos["exactos" if recomendados[0]["exacto"] else "parecidos"]]
+    for posicion, recomendado in enumerate(recomendados, 1):
+        local = recomendado["local"]
+        detalles = [f"{local['tipo_cocina']}, {local['budget']} · {local['poblacion']}"]
+        if local.get("valoracion"):
+            detalles.append(f"⭐ {local['valoracion']}")
+        if recomendado["distancia_km"] is not None:
+            detalles.append(f"📍 {recomendado['distancia_km']:.1f} km")
+        etiquetas = ", ".join(local.get("etiquetas") or [])
+        lineas.append(
+            f"{posicion}. *{local['nombre']}* — {' · '.join(detalles)}"
+            + (f" ({etiquetas})" if etiquetas else "")
+        )
+    return "\n".join(lineas)
+
+
+async def handle_recomendaciones(conv_state: ConversationState, user_message, nombre_apartamento=None):
     """
     Maneja solicitudes de recomendación de restaurantes utilizando memoria híbrida.
     """
 
-    # 🔹 **1️⃣ Obtener estado del usuario (Memoria a Largo Plazo - Supabase)**
-    conv_state = get_dynamic_state(numero)
+    # 🔹 **1️⃣ El estado del usuario (Memoria a Largo Plazo - Supabase) llega desde la sesión de `/chat`**
+
+    # ⚡ **"¿Qué hay abierto cerca?" se contesta con el índice geográfico, sin OpenAI**
+    origen = catalogo_apartamentos.coordenadas(nombre_apartamento)
+    if origen is not None and geo.es_consulta_cercania(user_message):
+        textos = TEXTOS.get(conv_state.idioma, TEXTOS["es"])
+        apartamento = catalogo_apartamentos.obtener(nombre_apartamento) or {}
+        cercanos = restaurantes_cercanos(user_message, origen, fechas.ahora_local(apartamento.get("zona_horaria")))
+        log.info("Restaurantes cercanos", categoria="recomendaciones", etapa="restaurantes",
+                 ids=[r["local"]["id"] for r in cercanos], origen=origen)
+        if not cercanos:
+            return textos["sin_cercanos"].format(radio=geo.RADIO_CERCANIA_KM)
+        return formatear_restaurantes(cercanos, conv_state.idioma, cabecera=textos["cercanos"])
 
     # 🔹 **2️⃣ Construcción de memoria híbrida (Supabase + Ventana de tokens)**
-    historial = []
-    for msg in conv_state.historial[-10:]:  
-        if isinstance(msg, dict) and "usuario" in msg and "bot" in msg:
-            historial.append({"role": "user", "content": str(msg["usuario"])})  # ✅ Asegurar que sea string
-            bot_response = msg["bot"]
-            if isinstance(bot_response, dict):  # ✅ Si es un JSON, convertirlo a string
-                bot_response = json.dumps(bot_response, ensure_ascii=False)  
-            historial.append({"role": "assistant", "content": str(bot_response)})  # ✅ Asegurar string
+    historial = get_token_window(conv_state, "restaurantes")
 
     # 📌 **3️⃣ Generar el prompt para OpenAI**
-    info_prompt = f"""
-    Eres un asistente especializado en recomendaciones de restaurantes.  
-    📌 **Todas las recomendaciones deben estar en Segur de Calafell, Calafell, Cunit o Comarruga.**  
-    📌 **Si el usuario menciona otra ciudad, infórmale que solo puedes recomendar en esa zona.**  
-
-    Tu tarea es analizar el mensaje del usuario y verificar si ya tiene todos los datos necesarios.  
-    📌 **Reglas Clave:**
-    🔹 **Si ya tiene tipo de comida y presupuesto, devuelve un JSON con `"respuesta_al_cliente": null`.**  
-    🔹 **Si falta algún dato, devuelve un JSON con `"respuesta_al_cliente"` conteniendo la pregunta necesaria.**  
-    🔹 **NO devuelvas texto plano, siempre responde en formato JSON sin backticks.**  
-
-    📌 **Estructura de respuesta esperada:**
-    {{
-        "tipo_cocina": "<tipo de comida o 'No definido'>",
-        "budget": "<presupuesto o 'No definido'>",
-        "mas_informacion": "<información extra o 'No definido'>",
-        "respuesta_al_cliente": "<pregunta para el usuario o null>"
-    }}
-
-    📌 **Datos actuales en memoria:**  
-    - **Tipo de comida:** {conv_state.datos_categoria.get("tipo_cocina", "No definido")}
-    - **Presupuesto:** {conv_state.datos_categoria.get("budget", "No definido")}
-    - **Información adicional:** {conv_state.datos_categoria.get("mas_informacion", "No definido")}
-
-    📌 **Conversación Reciente (Ventana de Tokens)**:
-    {json.dumps(historial, ensure_ascii=False, indent=2)}
-
-    📌 **Mensaje del usuario**:
-    "{user_message}"
-    """
-
-    # 🔹 **4️⃣ Llamada a OpenAI**
-    info_response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "system", "content": info_prompt}],
-        max_tokens=100,
-        temperature=0
+    mensajes = prompts.mensajes(
+        "restaurantes",
+        tipo_cocina=conv_state.datos_categoria.get("tipo_cocina", "No definido"),
+        budget=conv_state.datos_categoria.get("budget", "No definido"),
+        mas_informacion=conv_state.datos_categoria.get("mas_informacion", "No definido"),
+        historial=historial,
+        mensaje_usuario=user_message,
     )
+    log.prompt("restaurantes", mensajes)
 
-    print("📌 Prompt enviado a OpenAI:\n", info_prompt)
-    response_text = info_response.choices[0].message.content.strip()
-    print("📌 Respuesta completa de OpenAI:", response_text)
+    # 🔹 **4️⃣ Llamada a OpenAI**
+    response_text = await llm.completar("restaurantes", mensajes)
 
-    # 🔹 **5️⃣ Eliminar backticks antes de parsear JSON**
-    if response_text.startswith("```json"):
-        response_text = response_text[7:].strip()  # Elimina ```json
-    if response_text.endswith("```"):
-        response_text = response_text[:-3].strip()  # Elimina ```
+    log.debug("Respuesta de OpenAI", categoria="respuesta_llm", etapa="restaurantes", texto=response_text)
 
     # 🔹 **6️⃣ Validar si la respuesta es realmente un JSON**
     try:
-        result = json.loads(response_text)  # Intentar parsear JSON
+        result = llm.parsear_json(response_text)  # Intentar parsear JSON
     except json.JSONDecodeError:
-        print("❌ OpenAI no devolvió un JSON válido. Usando respuesta normal.")
+        log.warning("OpenAI no devolvió un JSON válido; se usa la respuesta en texto", categoria="respuesta_llm", etapa="restaurantes")
         return response_text  # Devolver texto plano si OpenAI falló
 
-    # 🔹 **7️⃣ Actualizar y guardar la información en memoria híbrida**
+    # 🔹 **7️⃣ Actualizar la información en memoria híbrida**
     if isinstance(result, dict):  # Verificar que result sea un diccionario
         conv_state.datos_categoria["tipo_cocina"] = result.get("tipo_cocina", conv_state.datos_categoria.get("tipo_cocina", "No definido"))
         conv_state.datos_categoria["budget"] = result.get("budget", conv_state.datos_categoria.get("budget", "No definido"))
         conv_state.datos_categoria["mas_informacion"] = result.get("mas_informacion", conv_state.datos_categoria.get("mas_informacion", "No definido"))
         
 
-        # 📌 Debugging: Verificar si se actualiza correctamente
-        print("📌 datos_categoria actualizado antes de guardar ya te he pillado:", json.dumps(conv_state.datos_categoria, indent=4, ensure_ascii=False))
-        conversation_data = conv_state.to_dict()
-        print("📌 Datos que se van a guardar en Supabase:", json.dumps(conversation_data, indent=4, ensure_ascii=False))
-        
-        # Guardamos la nueva información en Supabase
-        save_dynamic_state(conv_state.to_dict())
+        log.debug("datos_categoria actualizado", categoria="estado", etapa="restaurantes", datos_categoria=dict(conv_state.datos_categoria))
+
+        # La sesión de `/chat` guarda la nueva información en Supabase al terminar
     else:
-        print("⚠️ La respuesta de OpenAI no contiene datos válidos para actualizar `datos_categoria`.")
+        log.warning("La respuesta de OpenAI no contiene datos para `datos_categoria`", categoria="estado", etapa="restaurantes")
 
     # 🔹 **8️⃣ Si `"respuesta_al_cliente"` es `null`, significa que ya tiene toda la información**
     if result.get("respuesta_al_cliente") is None:
-        print("✅ Ya tiene toda la información necesaria, no se hacen más preguntas.")
-        return "Ya tengo toda la información necesaria. Te mostraré los mejores restaurantes en breve."
+        log.info("Información completa, no se hacen más preguntas", categoria="estado", etapa="restaurantes")
+        recomendados = buscar_restaurantes(conv_state.datos_categoria, user_message, origen)
+        ids = [r["local"]["id"] for r in recomendados]
+        # Los ya sugeridos no se repiten si el huésped pide más opciones; agotados, se vuelve a empezar
+        if ids:
+            anotar_sugeridos(conv_state.datos_categoria, "sugeridos", ids)
+        else:
+            conv_state.datos_categoria["sugeridos"] = []
+        log.info("Restaurantes recomendados", categoria="recomendaciones", etapa="restaurantes",
+                 ids=ids, puntuaciones=[r["puntuacion"] for r in recomendados])
+        return formatear_restaurantes(recomendados, conv_state.idioma)
 
     # 🔹 **9️⃣ Si falta información, devolver la pregunta al usuario**
     return result["respuesta_al_cliente"]
\ No newline at end of file
@@ -1,69 +1,50 @@
-import os
+import asyncio
 import json
-from dotenv import load_dotenv
-from app.database import get_dynamic_state, save_dynamic_state,supabase
-# 🔹 Cargar variables de entorno
-load_dotenv()
+from app.database import ConversationSession
+from app.catalogo_apartamentos import catalogo_apartamentos
+from app import llm, prompts, registro
+from app.cache_respuestas import cache_respuestas, huella_instalaciones
 
-def handle_apartment_info(numero, user_message, nombre_apartamento):
+log = registro.obtener(__name__)
+
+async def handle_apartment_info(conv_state, user_message, nombre_apartamento):
     """
     Recupera la información del apartamento directamente desde Supabase 
     y responde con los detalles solicitados de las instalaciones.
     """
 
-    # 🔹 **1️⃣ Recuperar datos del apartamento desde Supabase**
-    response = supabase.table("apartamentos").select("instalaciones").eq("nombre", nombre_apartamento).execute()
-    
-    if not response.data:
+    # 🔹 **1️⃣ Recuperar datos del apartamento del catálogo en memoria (sin ir a Supabase)**
+    apartamento = await catalogo_apartamentos.buscar(nombre_apartamento)
+
+    if apartamento is None:
         return f"❌ No hemos encontrado información sobre el apartamento '{nombre_apartamento}' en nuestra base de datos."
 
     # 🔹 **2️⃣ Extraer las instalaciones del apartamento**
-    instalaciones = response.data[0].get("instalaciones", {})
+    instalaciones = apartamento.get("instalaciones", {})
     if not instalaciones:
         return f"❌ No hay detalles de las instalaciones disponibles para el apartamento '{nombre_apartamento}'."
 
-    # 🔹 **3️⃣ Generar el prompt para OpenAI**
-    info_prompt = f"""
-   Eres un asistente de apartamentos turísticos.  
-📌 **Responde SOLO con información del apartamento basada en la pregunta del usuario.**  
-📌 **Usa exclusivamente los datos del JSON de instalaciones proporcionado.**  
-📌 **Si la información no está en el JSON, responde que no tienes datos sobre eso.**  
-📌 **NO inventes información ni asumas nada.**  
-
-🔹 **Apartamento asignado:** {nombre_apartamento}  
-🔹 **Lista de instalaciones del apartamento:**  
-
-El siguiente JSON contiene TODAS las instalaciones disponibles en el apartamento. Usa esta información para responder la pregunta del usuario. Si la instalación no está en la lista, responde que no está disponible.
-
-📌 **Instalaciones del apartamento en JSON:**  
-{json.dumps(instalaciones, ensure_ascii=False, indent=2)}
-
-🔹 **Pregunta del usuario:**  
-"{user_message}"
+    # 🔹 **Caché de respuestas: misma pregunta (o muy parecida) en el mismo apartamento**
+    huella = huella_instalaciones(instalaciones)
+    respuesta_cacheada = cache_respuestas.buscar(nombre_apartamento, "instalaciones", user_message, huella, conv_state.idioma)
+    if respuesta_cacheada is not None:
+        log.info("Respuesta servida desde la caché", categoria="cache", etapa="instalaciones", apartamento=nombre_apartamento)
+        return respuesta_cacheada
 
-🔹 **Ejemplo de respuesta esperada:**  
-- Usuario: "¿Hay secador de pelo?"  
-- Respuesta: "Sí, este apartamento dispone de secador de pelo en el baño."  
-- Usuario: "¿Tiene piscina?"  
-- Respuesta: "No, este apartamento no dispone de piscina."  
-
-🔹 **IMPORTANTE:** Devuelve una respuesta directa y breve sin explicaciones adicionales.
-"""
-    print(f"Open ia respuestaaaaaaa:{info_prompt}")
-    # 🔹 **4️⃣ Llamada a OpenAI para generar la respuesta**
-    from openai import OpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[{"role": "system", "content": info_prompt}],
-        max_tokens=200,
-        temperature=0
+    # 🔹 **3️⃣ Generar el prompt para OpenAI**
+    mensajes = prompts.mensajes(
+        "instalaciones",
+        nombre_apartamento=nombre_apartamento,
+        instalaciones=json.dumps(instalaciones, ensure_ascii=False, separators=(",", ":")),
+        mensaje_usuario=user_message,
     )
+    log.prompt("instalaciones", mensajes)
+    # 🔹 **4️⃣ Llamada a OpenAI para generar la respuesta**
+    response_text, segundos, tokens = await llm.completar_medido("instalaciones", mensajes)
+    log.debug("Respuesta de OpenAI", categoria="respuesta_llm", etapa="instalaciones", texto=response_text)
 
-    response_text = response.choices[0].message.content.strip()
-    print(f"📌 Respuesta generada por OpenAI: {response_text}")
+    cache_respuestas.guardar(nombre_apartamento, "instalaciones", user_message, response_text, huella,
+                             segundos=segundos, tokens=tokens, idioma=conv_state.idioma)
 
     return response_text
 
@@ -73,5 +54,9 @@ if __name__ == "__main__":
     nombre_apartamento = "Apartamento Sol"  # Nombre del apartamento asignado
     user_message = "¿El apartamento tiene aire acondicionado y WiFi?"  # Pregunta de ejemplo
 
-    response = handle_apartment_info(numero, user_message, nombre_apartamento)
+    async def _ejemplo():
+        async with ConversationSession(numero) as conv_state:
+            return await handle_apartment_info(conv_state, user_message, nombre_apartamento)
+
+    response = asyncio.run(_ejemplo())
     print(response)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+###############################################################################
+# Comprobación del arranque en frío
+###############################################################################
+#
+# Importar `app.main` tiene que ser rápido y sin efectos secundarios: nada de red,
+# ni clientes de OpenAI / Supabase / Redis / Google construidos al importar. Este
+# script importa la app en un proceso limpio con los sockets bloqueados y falla
+# (código de salida 1) si hay conexiones, si se cargan esos paquetes o si se pasa
+# del presupuesto de tiempo. Pensado para ejecutarse en CI antes de desplegar:
+#
+#     python -m app.comprobar_arranque
+#     ARRANQUE_PRESUPUESTO_SEGUNDOS=0.8 python -m app.comprobar_arranque --repeticiones 5
+
+PRESUPUESTO_SEGUNDOS = float(os.getenv("ARRANQUE_PRESUPUESTO_SEGUNDOS", 1.0))
+
+# 🔹 Paquetes que solo deben cargarse con la primera petición que los use
+MODULOS_PEREZOSOS = ("openai", "httpx", "supabase", "postgrest", "redis", "googleapiclient", "google.oauth2")
+
+# 🔹 Código del proceso hijo: bloquea la red, importa la app y devuelve un JSON con lo observado
+_CODIGO_HIJO = """
+import json, socket, sys, time
+
+conexiones = []
+
+def _bloqueado(*args, **kwargs):
+    conexiones.append(repr(args[1:] if args and isinstance(args[0], socket.socket) else args))
+    raise OSError("red bloqueada durante el arranque")
+
+socket.socket.connect = _bloqueado
+socket.socket.connect_ex = _bloqueado
+socket.create_connection = _bloqueado
+socket.getaddrinfo = _bloqueado
+
+inicio = time.perf_counter()
+import app.main
+segundos = time.perf_counter() - inicio
+
+from app import llm, database
+print(json.dumps({
+    "segundos": segundos,
+    "conexiones": conexiones,
+    "modulos": sorted(m for m in sys.modules if m.split(".")[0] in {m.split(".")[0] for m in MODULOS}),
+    "clientes": {"openai": llm._cliente is not None, "supabase": database._supabase is not None,
+                 "redis": database.almacen_redis._redis is not None},
+}))
+"""
+
+
+def medir_arranque() -> dict:
+    """Importa `app.main` en un intérprete nuevo y devuelve lo que pasó durante la importación."""
+    codigo = f"MODULOS = {MODULOS_PEREZOSOS!r}\n" + _CODIGO_HIJO
+    resultado = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if resultado.returncode != 0:
+        raise RuntimeError(f"❌ Importar app.main ha fallado:\n{resultado.stderr}")
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def comprobar(repeticiones: int = 3, presupuesto: float = PRESUPUESTO_SEGUNDOS) -> list:
+    """Devuelve la lista de problemas encontrados (vacía si el arranque es correcto)."""
+    medidas = [medir_arranque() for _ in range(repeticiones)]
+    problemas = []
+
+    # Nos quedamos con la mejor medida: el resto es ruido de la máquina
+    mejor = min(m["segundos"] for m in medidas)
+    print(f"📌 Importar app.main: {mejor * 1000:.0f} ms (mejor de {repeticiones}, presupuesto {presupuesto * 1000:.0f} ms)")
+    if mejor > presupuesto:
+        problemas.append(f"el arranque tarda {mejor:.3f}s y el presupuesto es {presupuesto:.3f}s")
+
+    ultima = medidas[-1]
+    if ultima["conexiones"]:
+        problemas.append(f"conexiones de red al importar: {ultima['conexiones']}")
+    if ultima["modulos"]:
+        problemas.append(f"paquetes de clientes cargados al importar: {', '.join(ultima['modulos'])}")
+    creados = [nombre for nombre, creado in ultima["clientes"].items() if creado]
+    if creados:
+        problemas.append(f"clientes construidos al importar: {', '.join(creados)}")
+    return problemas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comprueba que el arranque de la app es rápido y no hace I/O de red.")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--presupuesto", type=float, default=PRESUPUESTO_SEGUNDOS,
+                        help="segundos máximos para importar app.main")
+    args = parser.parse_args()
+
+    problemas = comprobar(args.repeticiones, args.presupuesto)
+    for problema in problemas:
+        print(f"❌ {problema}")
+    if problemas:
+        sys.exit(1)
+    print("✅ Arranque sin I/O de red y dentro del presupuesto.")
@@ -1,20 +1,46 @@
-from supabase import create_client, Client
 import os
+import copy
+import time
+import asyncio
 import json
 from datetime import datetime
-from dotenv import load_dotenv
+from app import registro, trazas
 
-load_dotenv()
+log = registro.obtener(__name__)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Verificar si las credenciales están configuradas correctamente
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("❌ ERROR: Las variables de entorno SUPABASE_URL y SUPABASE_KEY no están configuradas correctamente.")
+# 🔹 Dónde vive el estado caliente de las conversaciones: "supabase" (por defecto) o "redis"
+STORAGE_MODE = os.getenv("STORAGE_MODE", "supabase").lower()
 
-# Crear la conexión a Supabase
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# 🔹 Cómo se guarda el historial: "columna" (JSON dentro de `dinamicos`, por defecto)
+# o "mensajes" (una fila por turno en la tabla `mensajes`, solo se añade)
+HISTORIAL_MODE = os.getenv("HISTORIAL_MODE", "columna").lower()
+
+# 🔹 Turnos de conversación que se mantienen en memoria
+MAX_TURNOS_HISTORIAL = 10
+
+# Cliente asíncrono de Supabase: se crea en la primera petición (requiere un event loop).
+# El paquete `supabase` también se importa entonces, así arrancar no cuesta nada.
+_supabase = None
+_supabase_lock = asyncio.Lock()
+
+async def obtener_supabase():
+    """
+    Devuelve el cliente asíncrono de Supabase compartido por todo el proceso.
+    Todas las consultas se hacen con `await`, sin bloquear el event loop.
+    """
+    global _supabase
+    if _supabase is None:
+        async with _supabase_lock:
+            if _supabase is None:
+                # Verificar si las credenciales están configuradas correctamente
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise ValueError("❌ ERROR: Las variables de entorno SUPABASE_URL y SUPABASE_KEY no están configuradas correctamente.")
+                from supabase import acreate_client
+                _supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
 
 ###############################################################################
 # Clase para representar el estado de conversación
@@ -44,7 +70,34 @@ class ConversationState:
             except (json.JSONDecodeError, TypeError):
                 self.datos_categoria = {}
 
-                
+        # Turnos añadidos en esta petición (los que hay que insertar en `mensajes`)
+        self.turnos_nuevos = []
+
+    def agregar_turno(self, usuario, bot):
+        """Añade un turno al historial, manteniendo solo los últimos `MAX_TURNOS_HISTORIAL`."""
+        if not isinstance(self.historial, list):
+            self.historial = []
+        turno = {"usuario": usuario, "bot": bot}
+        self.historial.append(turno)
+        self.historial = self.historial[-MAX_TURNOS_HISTORIAL:]
+        self.turnos_nuevos.append(turno)
+
+    def copia(self):
+        """
+        Copia independiente para procesar una intención en paralelo: `datos_categoria`
+        se copia en profundidad y el historial (que los manejadores solo leen) en superficie.
+        """
+        copia = ConversationState(
+            self.numero_telefono,
+            categoria_activa=self.categoria_activa,
+            is_closed=self.is_closed,
+            idioma=self.idioma,
+            created_at=self.created_at,
+            historial=list(self.historial) if isinstance(self.historial, list) else [],
+            datos_categoria=copy.deepcopy(self.datos_categoria) if isinstance(self.datos_categoria, dict) else {},
+        )
+        return copia
+
     def to_dict(self):
         """Convierte el objeto en un diccionario para guardarlo en la base de datos."""
         return {
@@ -60,16 +113,56 @@ class ConversationState:
 ###############################################################################
 # Función para obtener el estado de conversación desde Supabase
 ###############################################################################
-def get_dynamic_state(numero_telefono: str) -> ConversationState:
+def _fila_dinamicos(fila: dict) -> dict:
+    """Fila para `dinamicos`: en modo "mensajes" el historial no se guarda en la columna."""
+    if HISTORIAL_MODE == "mensajes":
+        return {campo: valor for campo, valor in fila.items() if campo != "historial"}
+    return fila
+
+def _fila_mensaje(numero_telefono: str, turno: dict) -> dict:
+    bot = turno.get("bot")
+    return {
+        "numero_telefono": numero_telefono,
+        "usuario": str(turno.get("usuario", "")),
+        "bot": bot if isinstance(bot, str) else json.dumps(bot, ensure_ascii=False),
+    }
+
+async def _leer_mensajes(numero_telefono: str) -> list:
     """
-    Obtiene solo los datos dinámicos del usuario desde `dinamicos`.
-    Si no existe, lo crea con valores predeterminados.
+    Últimos `MAX_TURNOS_HISTORIAL` turnos del usuario desde `mensajes`, del más antiguo
+    al más reciente. Una sola consulta sobre el índice (numero_telefono, id desc).
     """
-    response = supabase.table("dinamicos").select("*").eq("numero_telefono", numero_telefono).execute()
-    
+    supabase = await obtener_supabase()
+    response = await supabase.table("mensajes").select("usuario,bot") \
+        .eq("numero_telefono", numero_telefono).order("id", desc=True).limit(MAX_TURNOS_HISTORIAL).execute()
+    turnos = [{"usuario": fila["usuario"], "bot": fila["bot"]} for fila in reversed(response.data or [])]
+
+    # 🔹 Turnos todavía en el buffer de escritura
+    turnos += [{"usuario": fila["usuario"], "bot": fila["bot"]} for fila in buffer_escritura.mensajes_pendientes(numero_telefono)]
+    return turnos[-MAX_TURNOS_HISTORIAL:]
+
+async def _leer_estado(numero_telefono: str):
+    """
+    Lee la fila de `dinamicos` del usuario y la convierte en `ConversationState`.
+    Devuelve `None` si el usuario todavía no tiene datos dinámicos.
+    En modo "mensajes" el historial se lee a la vez de la tabla `mensajes`.
+    """
+    supabase = await obtener_supabase()
+    consulta = supabase.table("dinamicos").select("*").eq("numero_telefono", numero_telefono).execute()
+    if HISTORIAL_MODE == "mensajes":
+        response, turnos = await asyncio.gather(consulta, _leer_mensajes(numero_telefono))
+    else:
+        response, turnos = await consulta, None
+
+    # 🔹 Cambios todavía en el buffer de escritura: se aplican encima de lo leído
+    pendiente = buffer_escritura.pendiente(numero_telefono)
+    if pendiente:
+        fila = response.data[0] if response.data else {}
+        response.data = [{**fila, **pendiente}]
+
     if response.data and len(response.data) > 0:
         data = response.data[0]
-        print(f"📌 Usuario {numero_telefono} encontrado en `dinamicos`. Datos cargados.")
+        log.debug("Usuario encontrado en `dinamicos`", categoria="estado", numero_telefono=numero_telefono)
 
         # 🔹 Convertir historial a lista si es un string JSON
         if isinstance(data.get("historial"), str):
@@ -80,14 +173,28 @@ def get_dynamic_state(numero_telefono: str) -> ConversationState:
         elif not isinstance(data.get("historial"), list):
             data["historial"] = []
 
-        return ConversationState(numero_telefono, data=data)  
+        if turnos is not None:
+            data["historial"] = turnos
+
+        return ConversationState(numero_telefono, data=data)
+
+    return None
+
+async def get_dynamic_state(numero_telefono: str) -> ConversationState:
+    """
+    Obtiene solo los datos dinámicos del usuario desde `dinamicos`.
+    Si no existe, lo crea con valores predeterminados.
+    """
+    state = await _leer_estado(numero_telefono)
+    if state is not None:
+        return state
 
     # 🔹 Si el usuario no existe, creamos una nueva entrada **pero solo si es necesario**
-    print(f"⚠️ Usuario {numero_telefono} no tiene datos dinámicos. Creando nuevo estado...")
+    log.info("Usuario sin datos dinámicos; se crea un estado nuevo", categoria="estado", numero_telefono=numero_telefono)
     new_state = ConversationState(numero_telefono)
 
     # **Solo guardamos si el usuario NO existe**
-    save_dynamic_state(new_state)
+    await save_dynamic_state(new_state)
 
     return new_state
 
@@ -95,26 +202,23 @@ def get_dynamic_state(numero_telefono: str) -> ConversationState:
 # Función para guardar el estado de conversación en Supabase
 ###############################################################################
 
-def save_dynamic_state(state):
+async def save_dynamic_state(state):
     """
     Guarda o actualiza el estado del usuario en `dinamicos` en Supabase.
     """
     try:
         if not isinstance(state, ConversationState):
-            print("⚠️ `save_dynamic_state` recibió un diccionario en lugar de un `ConversationState`. Convirtiendo...")
-            print("📌 Diccionario recibido antes de conversión:", json.dumps(state, indent=4, ensure_ascii=False))
+            log.debug("`save_dynamic_state` recibió un diccionario en lugar de un `ConversationState`", categoria="estado",
+                      claves=sorted(state) if isinstance(state, dict) else None)
 
             if isinstance(state, dict):
                 expected_keys = {"numero_telefono", "categoria_activa", "is_closed", "idioma", "created_at", "historial", "datos_categoria"}
                 received_keys = set(state.keys())
 
-                print(f"📌 Claves esperadas: {expected_keys}")
-                print(f"📌 Claves recibidas: {received_keys}")
-
                 # Si hay claves extra, eliminarlas antes de la conversión
                 extra_keys = received_keys - expected_keys
                 if extra_keys:
-                    print(f"⚠️ Eliminando claves inesperadas: {extra_keys}")
+                    log.warning("Se eliminan claves inesperadas del estado", categoria="estado", claves=sorted(extra_keys))
                     for key in extra_keys:
                         del state[key]
 
@@ -135,50 +239,473 @@ def save_dynamic_state(state):
                 state = ConversationState(**state)  # Ahora debe convertirse sin error
 
         # 📌 Continuar con el guardado en Supabase
-        print(f"📌 Guardando datos en `dinamicos` para usuario {state.numero_telefono}...")
+        if buffer_escritura.activo:
+            buffer_escritura.encolar(_fila_dinamicos(state.to_dict()))
+            return True
 
-        response = supabase.table("dinamicos").upsert(state.to_dict(), on_conflict=["numero_telefono"]).execute()
+        supabase = await obtener_supabase()
+        response = await supabase.table("dinamicos").upsert(_fila_dinamicos(state.to_dict()), on_conflict=["numero_telefono"]).execute()
 
         if response.data:
-            print(f"✅ Datos actualizados correctamente en `dinamicos` para usuario {state.numero_telefono}.")
+            log.debug("Datos actualizados en `dinamicos`", categoria="estado", numero_telefono=state.numero_telefono)
             return True
 
     except Exception as e:
-        print(f"❌ Error en `save_dynamic_state`: {e}")
+        log.error("Error en `save_dynamic_state`", categoria="estado", error=str(e))
 
     return False
 ###############################################################################
-# Base de datos simulada de restaurantes
+# Buffer de escritura: upserts agrupados y fusionados
 ###############################################################################
+#
+# En vez de un `upsert(...).execute()` por guardado, las filas se acumulan aquí.
+# Varios guardados del mismo `numero_telefono` se fusionan en la última versión y
+# el buffer se vuelca en un único upsert masivo cuando llega a
+# `BUFFER_ESCRITURA_MAX_FILAS` filas o cada `BUFFER_ESCRITURA_INTERVALO` segundos,
+# y por completo al apagar el servidor. Las lecturas (`_leer_estado`) ven los
+# cambios pendientes. Es opcional (`BUFFER_ESCRITURA=1`): por defecto cada guardado va
+# directo a Supabase. Con el buffer, una caída pierde hasta `BUFFER_ESCRITURA_INTERVALO`
+# segundos de `dinamicos` y otros workers pueden leer estado atrasado, así que solo
+# conviene con un único worker.
+# En modo "mensajes" los turnos nuevos también se acumulan y se insertan juntos.
+
+class BufferEscritura:
+    def __init__(self, max_filas=None, intervalo=None, activo=None):
+        self.max_filas = int(max_filas or os.getenv("BUFFER_ESCRITURA_MAX_FILAS", 100))
+        self.intervalo = float(intervalo or os.getenv("BUFFER_ESCRITURA_INTERVALO", 1))
+        self.activo = activo if activo is not None else os.getenv("BUFFER_ESCRITURA", "0") != "0"
+        self._pendientes = {}           # numero_telefono -> campos a guardar (ya serializados)
+        self._en_vuelo = {}             # lote que se está enviando ahora mismo
+        self._mensajes = []             # filas pendientes para la tabla `mensajes`
+        self._mensajes_en_vuelo = []
+        self._lock = asyncio.Lock()     # un volcado cada vez
+        self._tarea = None
+        self._volcados_lanzados = set()
+
+        self.guardados = 0
+        self.fusionados = 0
+        self.volcados = 0
+        self.filas_volcadas = 0
+        self.mensajes_insertados = 0
+        self.errores = 0
+        self.lote_max = 0
+        self.ultimo_lote = 0
+        self.segundos_total = 0.0
+        self.segundos_max = 0.0
+        self.segundos_ultimo = 0.0
+
+    def encolar(self, fila: dict):
+        """Añade (o fusiona) la fila de un usuario. Si el buffer se llena, lanza un volcado."""
+        numero = fila["numero_telefono"]
+        self.guardados += 1
+        anterior = self._pendientes.get(numero)
+        if anterior is not None:
+            self.fusionados += 1
+            fila = {**anterior, **fila}
+        self._pendientes[numero] = fila
+        self._comprobar_tamano()
+
+    def encolar_mensajes(self, filas: list):
+        """Añade turnos para insertar en `mensajes` (nunca se fusionan: la tabla solo crece)."""
+        self._mensajes.extend(filas)
+        self._comprobar_tamano()
+
+    def _comprobar_tamano(self):
+        if len(self._pendientes) + len(self._mensajes) >= self.max_filas:
+            tarea = asyncio.create_task(self.volcar())
+            self._volcados_lanzados.add(tarea)
+            tarea.add_done_callback(self._volcados_lanzados.discard)
+
+    def pendiente(self, numero_telefono: str):
+        """Campos del usuario que aún no han llegado a Supabase, o `None`."""
+        en_vuelo = self._en_vuelo.get(numero_telefono)
+        pendiente = self._pendientes.get(numero_telefono)
+        if en_vuelo is None and pendiente is None:
+            return None
+        return {**(en_vuelo or {}), **(pendiente or {})}
+
+    def mensajes_pendientes(self, numero_telefono: str) -> list:
+        """Turnos del usuario que aún no se han insertado en `mensajes`, en orden."""
+        return [f for f in self._mensajes_en_vuelo + self._mensajes if f["numero_telefono"] == numero_telefono]
+
+    async def volcar(self) -> int:
+        """
+        Envía todas las filas pendientes. Las filas se agrupan por columnas para que cada
+        upsert masivo sea homogéneo (PostgREST rellenaría con NULL las columnas que falten).
+        """
+        async with self._lock:
+            if not self._pendientes and not self._mensajes:
+                return 0
+            lote, self._pendientes = self._pendientes, {}
+            mensajes, self._mensajes = self._mensajes, []
+            self._en_vuelo = lote
+            self._mensajes_en_vuelo = mensajes
+
+            grupos = {}
+            for fila in lote.values():
+                grupos.setdefault(tuple(sorted(fila)), []).append(fila)
+
+            inicio = time.perf_counter()
+            try:
+                with trazas.span("almacen.volcar", etapa="buffer"):
+                    supabase = await obtener_supabase()
+                    for filas in grupos.values():
+                        await supabase.table("dinamicos").upsert(filas, on_conflict=["numero_telefono"]).execute()
+                    if mensajes:
+                        await supabase.table("mensajes").insert(mensajes).execute()
+            except Exception as e:
+                # Se devuelven al buffer sin pisar los guardados que hayan llegado mientras tanto
+                for numero, fila in lote.items():
+                    self._pendientes[numero] = {**fila, **self._pendientes.get(numero, {})}
+                self._mensajes = mensajes + self._mensajes
+                self.errores += 1
+                log.error("Error al volcar el buffer de escritura", categoria="persistencia", filas=len(lote), mensajes=len(mensajes), error=str(e))
+                return 0
+            finally:
+                self._en_vuelo = {}
+                self._mensajes_en_vuelo = []
+
+            segundos = time.perf_counter() - inicio
+            self.volcados += 1
+            self.filas_volcadas += len(lote)
+            self.mensajes_insertados += len(mensajes)
+            self.ultimo_lote = len(lote) + len(mensajes)
+            self.lote_max = max(self.lote_max, self.ultimo_lote)
+            self.segundos_ultimo = segundos
+            self.segundos_total += segundos
+            self.segundos_max = max(self.segundos_max, segundos)
+            return self.ultimo_lote
+
+    async def _volcar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await self.volcar()
+            except Exception as e:
+                log.error("Error en el volcado periódico del buffer de escritura", categoria="persistencia", error=str(e))
+
+    async def iniciar(self):
+        if self.activo and self._tarea is None:
+            self._tarea = asyncio.create_task(self._volcar_periodicamente())
+
+    async def detener(self):
+        """Para la tarea periódica y vuelca todo lo pendiente."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+        if self._volcados_lanzados:
+            await asyncio.gather(*self._volcados_lanzados, return_exceptions=True)
+        await self.volcar()
+
+    def estadisticas(self) -> dict:
+        return {
+            "activo": self.activo,
+            "pendientes": len(self._pendientes),
+            "mensajes_pendientes": len(self._mensajes),
+            "guardados": self.guardados,
+            "fusionados": self.fusionados,
+            "volcados": self.volcados,
+            "filas_volcadas": self.filas_volcadas,
+            "mensajes_insertados": self.mensajes_insertados,
+            "errores": self.errores,
+            "lote_medio": round((self.filas_volcadas + self.mensajes_insertados) / self.volcados, 2) if self.volcados else 0.0,
+            "lote_max": self.lote_max,
+            "ultimo_lote": self.ultimo_lote,
+            "segundos_volcado_medio": round(self.segundos_total / self.volcados, 4) if self.volcados else 0.0,
+            "segundos_volcado_max": round(self.segundos_max, 4),
+            "segundos_ultimo_volcado": round(self.segundos_ultimo, 4),
+        }
 
-RESTAURANTES_FAKE = [
-    {"id": 1, "nombre": "Mamma Mia", "tipo_cocina": "italiano", "budget": "barato"},
-    {"id": 2, "nombre": "La Tagliatella", "tipo_cocina": "italiano", "budget": "medio"},
-    {"id": 3, "nombre": "Sushi Lowcost", "tipo_cocina": "japones", "budget": "barato"},
-    {"id": 4, "nombre": "Kyoto Deluxe", "tipo_cocina": "japones", "budget": "caro"},
-]
 
-def query_restaurantes(tipo_cocina=None, budget=None, exclude_id=None):
-    restaurantes = [
-        r for r in RESTAURANTES_FAKE
-        if (not tipo_cocina or r["tipo_cocina"] == tipo_cocina)
-        and (not budget or r["budget"] == budget)
-    ]
-    
-    if exclude_id is not None:
-        restaurantes = [r for r in restaurantes if r["id"] != exclude_id]
+# 🔹 Instancia compartida por `save_dynamic_state` y `ConversationSession`
+buffer_escritura = BufferEscritura()
+
+###############################################################################
+# Almacén caliente en Redis con escritura diferida a Supabase
+###############################################################################
+#
+# Con `STORAGE_MODE=redis` el estado de cada conversación se lee y se escribe en
+# Redis (con TTL) y los números modificados se apuntan en un conjunto de "sucios".
+# Una tarea en segundo plano los vuelca a `dinamicos` en lotes cada
+# `REDIS_VENTANA_DURABILIDAD` segundos: ese es el máximo de cambios que se pueden
+# perder si se cae Redis. Si una conversación no está en Redis se recarga de Supabase.
+
+class AlmacenRedis:
+    PREFIJO = "conversacion:"
+    CLAVE_SUCIOS = "conversacion:sucios"
+
+    def __init__(self, url=None, ttl=None, ventana=None, lote=None):
+        self.url = url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        self.ttl = int(ttl or os.getenv("REDIS_TTL", 24 * 3600))
+        self.ventana = float(ventana or os.getenv("REDIS_VENTANA_DURABILIDAD", 5))
+        self.lote = int(lote or os.getenv("REDIS_LOTE_VOLCADO", 500))
+        self._redis = None
+        self._tarea = None
+
+        self.lecturas = 0
+        self.fallos_cache = 0
+        self.volcados = 0
+        self.filas_volcadas = 0
+        self.errores_volcado = 0
+        self.segundos_ultimo_volcado = 0.0
+
+    def obtener_redis(self):
+        """Cliente `redis.asyncio` compartido; se crea en el primer uso."""
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.url, decode_responses=True)
+        return self._redis
+
+    def _clave(self, numero_telefono: str) -> str:
+        return f"{self.PREFIJO}{numero_telefono}"
+
+    async def leer(self, numero_telefono: str):
+        """Estado desde Redis; si no está, se recarga de Supabase y se deja en Redis. `None` si no existe."""
+        self.lecturas += 1
+        redis = self.obtener_redis()
+        guardado = await redis.get(self._clave(numero_telefono))
+        if guardado is not None:
+            await redis.expire(self._clave(numero_telefono), self.ttl)
+            return ConversationState(numero_telefono, data=json.loads(guardado))
+
+        self.fallos_cache += 1
+        state = await _leer_estado(numero_telefono)
+        if state is not None:
+            await redis.set(self._clave(numero_telefono), json.dumps(state.to_dict(), ensure_ascii=False), ex=self.ttl)
+        return state
+
+    async def escribir(self, state: ConversationState):
+        """Guarda el estado completo en Redis y lo marca como pendiente de volcar a Supabase."""
+        redis = self.obtener_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._clave(state.numero_telefono), json.dumps(state.to_dict(), ensure_ascii=False), ex=self.ttl)
+            pipe.sadd(self.CLAVE_SUCIOS, state.numero_telefono)
+            await pipe.execute()
+
+    async def volcar(self) -> int:
+        """
+        Vuelca a `dinamicos` los estados modificados, en lotes de `REDIS_LOTE_VOLCADO`
+        filas por upsert. Si un lote falla, sus números vuelven al conjunto de sucios.
+        """
+        redis = self.obtener_redis()
+        inicio = time.perf_counter()
+        total = 0
+        while True:
+            numeros = await redis.spop(self.CLAVE_SUCIOS, self.lote)
+            if not numeros:
+                break
+            valores = await redis.mget([self._clave(n) for n in numeros])
+            filas = [_fila_dinamicos(json.loads(v)) for v in valores if v is not None]
+            if not filas:
+                continue
+            try:
+                with trazas.span("almacen.volcar", etapa="redis"):
+                    supabase = await obtener_supabase()
+                    await supabase.table("dinamicos").upsert(filas, on_conflict=["numero_telefono"]).execute()
+            except Exception as e:
+                self.errores_volcado += 1
+                await redis.sadd(self.CLAVE_SUCIOS, *numeros)
+                log.error("Error al volcar conversaciones de Redis a Supabase", categoria="persistencia", filas=len(filas), error=str(e))
+                break
+            total += len(filas)
+
+        if total:
+            self.volcados += 1
+            self.filas_volcadas += total
+            self.segundos_ultimo_volcado = time.perf_counter() - inicio
+            log.info("Conversaciones volcadas de Redis a `dinamicos`", categoria="persistencia", filas=total, segundos=round(self.segundos_ultimo_volcado, 3))
+        return total
+
+    async def _volcar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.ventana)
+            try:
+                await self.volcar()
+            except Exception as e:
+                log.error("Error en el volcado periódico de Redis", categoria="persistencia", error=str(e))
+
+    async def iniciar(self):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._volcar_periodicamente())
+
+    async def detener(self):
+        """Para la tarea periódica y hace un último volcado para no perder cambios."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+        try:
+            await self.volcar()
+        except Exception as e:
+            log.error("Error en el volcado final de Redis", categoria="persistencia", error=str(e))
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def estadisticas(self) -> dict:
+        pendientes = await self.obtener_redis().scard(self.CLAVE_SUCIOS)
+        return {
+            "lecturas": self.lecturas,
+            "fallos_cache": self.fallos_cache,
+            "pendientes": pendientes,
+            "volcados": self.volcados,
+            "filas_volcadas": self.filas_volcadas,
+            "errores_volcado": self.errores_volcado,
+            "segundos_ultimo_volcado": round(self.segundos_ultimo_volcado, 4),
+        }
+
+
+# 🔹 Instancia compartida (solo se usa con `STORAGE_MODE=redis`)
+almacen_redis = AlmacenRedis()
+
+###############################################################################
+# Sesión de conversación por petición (unidad de trabajo)
+###############################################################################
+
+class ConversationSession:
+    """
+    Unidad de trabajo de una petición `/chat`.
+
+    Carga la fila de `dinamicos` una sola vez, comparte el mismo `ConversationState`
+    con toda la cadena de `dispatch_intent` y, al terminar, hace un único upsert
+    solo con los campos que han cambiado (a través de `buffer_escritura`).
+
+    Con `STORAGE_MODE=redis` lee y escribe en `almacen_redis` y Supabase se
+    actualiza después, en el volcado periódico.
+
+    Con `HISTORIAL_MODE=mensajes` el historial no viaja en la fila de `dinamicos`:
+    cada turno nuevo (`ConversationState.agregar_turno`) se inserta en `mensajes`,
+    así que lo que se escribe por turno no crece con la conversación.
+    """
+
+    def __init__(self, numero_telefono: str):
+        self.numero_telefono = numero_telefono
+        self.state = None
+        self.es_nuevo = False
+        self._original = {}
+
+    async def cargar(self) -> ConversationState:
+        """Lee el estado del usuario (o crea uno nuevo en memoria, sin guardarlo todavía)."""
+        if STORAGE_MODE == "redis":
+            self.state = await almacen_redis.leer(self.numero_telefono)
+        else:
+            self.state = await _leer_estado(self.numero_telefono)
+        self.es_nuevo = self.state is None
+        if self.es_nuevo:
+            log.info("Usuario sin datos dinámicos; se creará al guardar", categoria="estado", numero_telefono=self.numero_telefono)
+            self.state = ConversationState(self.numero_telefono)
+        self._original = self.state.to_dict()
+        return self.state
+
+    def campos_modificados(self) -> dict:
+        """Devuelve los campos serializados que difieren de los cargados."""
+        actual = self.state.to_dict()
+        return {campo: valor for campo, valor in actual.items() if self._original.get(campo) != valor}
+
+    async def _guardar_turnos(self):
+        """Modo "mensajes": inserta los turnos nuevos de esta petición."""
+        if HISTORIAL_MODE != "mensajes" or not self.state.turnos_nuevos:
+            return
+        filas = [_fila_mensaje(self.numero_telefono, turno) for turno in self.state.turnos_nuevos]
+        if buffer_escritura.activo:
+            buffer_escritura.encolar_mensajes(filas)
+        else:
+            supabase = await obtener_supabase()
+            await supabase.table("mensajes").insert(filas).execute()
+        self.state.turnos_nuevos = []
+
+    async def guardar(self) -> bool:
+        """
+        Persiste los cambios con un único upsert. Si el usuario es nuevo se guarda la fila
+        completa; si no, solo los campos modificados. Sin cambios no se hace ninguna llamada.
+        """
+        if self.state is None:
+            return False
+
+        if STORAGE_MODE == "redis":
+            if not self.es_nuevo and not self.campos_modificados():
+                return True
+            try:
+                await almacen_redis.escribir(self.state)
+                await self._guardar_turnos()
+            except Exception as e:
+                log.error("Error al guardar la sesión en Redis", categoria="persistencia", numero_telefono=self.numero_telefono, error=str(e))
+                return False
+            self._original = self.state.to_dict()
+            self.es_nuevo = False
+            return True
+
+        if self.es_nuevo:
+            fila = _fila_dinamicos(self.state.to_dict())
+        else:
+            cambios = _fila_dinamicos(self.campos_modificados())
+            if not cambios:
+                # En modo "mensajes" puede que solo haya turnos nuevos
+                try:
+                    await self._guardar_turnos()
+                except Exception as e:
+                    log.error("Error al guardar los mensajes", categoria="persistencia", numero_telefono=self.numero_telefono, error=str(e))
+                    return False
+                self._original = self.state.to_dict()
+                return True
+            fila = {"numero_telefono": self.numero_telefono, **cambios}
+
+        if buffer_escritura.activo:
+            buffer_escritura.encolar(fila)
+            await self._guardar_turnos()
+            self._original = self.state.to_dict()
+            self.es_nuevo = False
+            return True
+
+        try:
+            supabase = await obtener_supabase()
+            response = await supabase.table("dinamicos").upsert(fila, on_conflict=["numero_telefono"]).execute()
+            await self._guardar_turnos()
+        except Exception as e:
+            log.error("Error al guardar la sesión", categoria="persistencia", numero_telefono=self.numero_telefono, error=str(e))
+            return False
+
+        if response.data:
+            self._original = self.state.to_dict()
+            self.es_nuevo = False
+            return True
+        return False
+
+    async def __aenter__(self) -> ConversationState:
+        with trazas.span("almacen.cargar", etapa=STORAGE_MODE):
+            return await self.cargar()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Solo persistimos si la petición terminó sin errores
+        if exc_type is None:
+            with trazas.span("almacen.guardar", etapa=STORAGE_MODE):
+                await self.guardar()
+        return False
+
+###############################################################################
+# Catálogo de restaurantes
+###############################################################################
+
+def query_restaurantes(tipo_cocina=None, budget=None, exclude_id=None, poblacion=None, etiquetas=None):
+    """Consulta el catálogo de restaurantes en memoria (`app/catalogo_locales.py`)."""
+    from app.catalogo_locales import catalogo_restaurantes
 
-    return restaurantes
+    return catalogo_restaurantes.buscar(
+        tipo_cocina=tipo_cocina,
+        budget=budget,
+        poblacion=poblacion,
+        etiquetas=etiquetas,
+        excluir_ids=[exclude_id] if exclude_id is not None else None,
+    )
 
 ###############################################################################
 # Función para obtener el historial del usuario
 ###############################################################################
 
-def obtener_historial_usuario(numero_telefono: str):
+async def obtener_historial_usuario(numero_telefono: str):
     """
     Obtiene el estado de conversación del usuario y construye su historial reciente.
     """
-    conv_state = get_dynamic_state(numero_telefono)
+    conv_state = await get_dynamic_state(numero_telefono)
     
     historial = "\n".join([
         f'Usuario: "{msg["usuario"]}"\nBot: "{msg["bot"]}"' 
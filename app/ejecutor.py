@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+from app import trazas
+
+###############################################################################
+# Ejecutor por clave: turnos en orden para cada huésped
+###############################################################################
+#
+# Si un huésped manda dos mensajes seguidos, sus dos turnos leerían el mismo estado
+# de `dinamicos` y el último en guardar pisaría los datos del otro (p. ej. la hora de
+# `handle_limpieza`). Un lock global lo evitaría, pero pondría en fila a todos los
+# huéspedes. Este ejecutor serializa los turnos de un mismo `numero_telefono` (en orden
+# de llegada) y deja que los de huéspedes distintos corran en paralelo:
+#
+#     respuesta = await ejecutor_turnos.ejecutar(numero_telefono, funcion, *args)
+#
+#   - Cada clave tiene una cola acotada (`COLA_HUESPED_MAX` turnos contando el que está
+#     en marcha). Si está llena se lanza `ColaLlena` y `/chat` responde 429.
+#   - Las colas vacías se eliminan, así que la memoria depende de los huéspedes activos.
+#   - El orden solo se garantiza dentro de un proceso: con varios workers, el balanceador
+#     debe enviar cada número siempre al mismo. `STORAGE_MODE=redis` no lo resuelve: el
+#     almacén no bloquea por `numero_telefono` y el último turno en guardar gana.
+
+MAX_POR_CLAVE = int(os.getenv("COLA_HUESPED_MAX", 5))
+
+
+class ColaLlena(Exception):
+    """La cola de turnos de un huésped ya tiene el máximo de mensajes pendientes."""
+
+
+class _ColaClave:
+    __slots__ = ("lock", "pendientes")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()      # FIFO: los turnos se ejecutan en orden de llegada
+        self.pendientes = 0             # en marcha + esperando
+
+
+class EjecutorPorClave:
+    def __init__(self, max_por_clave: int = None):
+        self.max_por_clave = max_por_clave or MAX_POR_CLAVE
+        self._colas = {}
+
+        # Métricas
+        self.ejecutados = 0
+        self.rechazados = 0
+        self.encolados = 0              # turnos que tuvieron que esperar a otro del mismo huésped
+        self.profundidad_max = 0
+        self.segundos_espera_total = 0.0
+        self.segundos_espera_max = 0.0
+
+    async def ejecutar(self, clave, funcion, *args, **kwargs):
+        """Ejecuta `await funcion(*args, **kwargs)` cuando terminen los turnos anteriores de `clave`."""
+        cola = self._colas.get(clave)
+        if cola is None:
+            cola = self._colas[clave] = _ColaClave()
+        if cola.pendientes >= self.max_por_clave:
+            self.rechazados += 1
+            raise ColaLlena(f"Demasiados mensajes pendientes para {clave} ({cola.pendientes}).")
+
+        cola.pendientes += 1
+        self.profundidad_max = max(self.profundidad_max, cola.pendientes)
+        if cola.pendientes > 1:
+            self.encolados += 1
+        try:
+            inicio = time.perf_counter()
+            with trazas.span("cola"):
+                await cola.lock.acquire()
+            try:
+                espera = time.perf_counter() - inicio
+                self.segundos_espera_total += espera
+                self.segundos_espera_max = max(self.segundos_espera_max, espera)
+                self.ejecutados += 1
+                return await funcion(*args, **kwargs)
+            finally:
+                cola.lock.release()
+        finally:
+            cola.pendientes -= 1
+            if cola.pendientes == 0 and self._colas.get(clave) is cola:
+                del self._colas[clave]
+
+    def profundidad(self, clave) -> int:
+        cola = self._colas.get(clave)
+        return cola.pendientes if cola is not None else 0
+
+    def estadisticas(self) -> dict:
+        profundidades = [cola.pendientes for cola in self._colas.values()]
+        return {
+            "max_por_clave": self.max_por_clave,
+            "claves_activas": len(profundidades),
+            "turnos_en_marcha": sum(1 for cola in self._colas.values() if cola.lock.locked()),
+            "turnos_esperando": sum(profundidades) - sum(1 for cola in self._colas.values() if cola.lock.locked()),
+            "profundidad_actual_max": max(profundidades, default=0),
+            "profundidad_max": self.profundidad_max,
+            "ejecutados": self.ejecutados,
+            "encolados": self.encolados,
+            "rechazados": self.rechazados,
+            "segundos_espera_medio": round(self.segundos_espera_total / self.ejecutados, 4) if self.ejecutados else 0.0,
+            "segundos_espera_max": round(self.segundos_espera_max, 4),
+        }
+
+    def exportar_prometheus(self) -> str:
+        """Profundidad de las colas y contadores en el formato de texto de Prometheus."""
+        e = self.estadisticas()
+        metricas = [
+            ("chatbot_cola_claves_activas", "gauge", "Huéspedes con algún turno en marcha o en cola.", e["claves_activas"]),
+            ("chatbot_cola_turnos_esperando", "gauge", "Turnos esperando a que termine otro del mismo huésped.", e["turnos_esperando"]),
+            ("chatbot_cola_profundidad_actual_max", "gauge", "Cola más larga de un huésped en este momento.", e["profundidad_actual_max"]),
+            ("chatbot_cola_encolados_total", "counter", "Turnos que tuvieron que esperar a otro del mismo huésped.", e["encolados"]),
+            ("chatbot_cola_rechazados_total", "counter", "Turnos rechazados por cola llena.", e["rechazados"]),
+        ]
+        lineas = []
+        for nombre, tipo, ayuda, valor in metricas:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}", f"{nombre} {valor}"]
+        return "\n".join(lineas) + "\n"
+
+
+# 🔹 Instancia compartida por todo el proceso: una cola por `numero_telefono`
+ejecutor_turnos = EjecutorPorClave()
@@ -0,0 +1,359 @@
+import os
+import re
+import json
+import argparse
+import unicodedata
+from datetime import date, datetime, timedelta
+
+###############################################################################
+# Intérprete local de fechas y horas (vía rápida antes de OpenAI)
+###############################################################################
+#
+# Convierte expresiones como "el próximo lunes a las 10 de la mañana", "mañana a las
+# diez y media" o "tomorrow at 5pm" en una fecha ISO (`AAAA-MM-DD`) y una hora
+# `HH:MM` de 24 horas, con reglas deterministas en español e inglés. `handle_limpieza`
+# lo llama antes que al LLM y solo pregunta a gpt-4-turbo lo que no sabe resolver.
+#
+#   - Días relativos ("hoy", "pasado mañana", "en 3 días", "tomorrow"), días de la
+#     semana ("el lunes", "el martes que viene", "next friday") y fechas explícitas
+#     ("el 15 de julio", "15/07", "el día 3", "july 15th").
+#   - Horas con número ("a las 10", "10:30", "a las 17h", "5pm") o con palabras ("a las
+#     diez y media", "menos cuarto", "half past ten"), más "mediodía" y "medianoche".
+#   - "de la mañana/tarde/noche" (o am/pm) decide entre 10:00 y 22:00. Sin franja, de la
+#     1 a las 7 se entiende por la tarde: nadie pide una limpieza a las 4 de la madrugada.
+#     "por la tarde" sin hora concreta no fija la hora.
+#   - Las fechas se calculan en la zona horaria del apartamento (`zona_horaria` en la
+#     tabla `apartamentos`) o, si no la tiene, en `ZONA_HORARIA` (Europe/Madrid).
+#   - Si el mensaje niega o cancela ("no puedo el lunes", "cancela la limpieza"), no
+#     se interpreta nada: el contexto lo tiene que entender el LLM.
+#
+# El corpus `datos/corpus_fechas.json` recoge mensajes con la fecha y hora esperadas;
+# `python -m app.fechas` informa de cuántos resuelve sin LLM y con qué precisión.
+
+RUTA_CORPUS = os.path.join(os.path.dirname(__file__), "datos", "corpus_fechas.json")
+
+ZONA_HORARIA_POR_DEFECTO = "Europe/Madrid"
+
+DIAS_SEMANA = {
+    "lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3, "viernes": 4, "sabado": 5, "domingo": 6,
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+}
+
+MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+}
+
+NUMEROS = {
+    "una": 1, "uno": 1, "un": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12,
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+MINUTOS = {
+    "cinco": 5, "diez": 10, "cuarto": 15, "veinte": 20, "veinticinco": 25, "media": 30,
+    "five": 5, "ten": 10, "quarter": 15, "a quarter": 15, "twenty": 20, "twenty five": 25, "half": 30,
+    "fifteen": 15, "thirty": 30, "forty five": 45,
+}
+
+# Palabras que cambian el sentido del mensaje: mejor que decida el LLM
+_NEGACIONES = re.compile(
+    r"\b(no|ni|nunca|cancela\w*|anula\w*|not|dont|don t|cant|can t|cannot|never|cancel\w*|instead)\b"
+)
+# Exclusiones ("cualquier día menos el lunes") y alternativas ("el lunes o el martes"):
+# el mensaje nombra fechas u horas que no son la elegida. "menos cuarto" y "o clock" no cuentan.
+_AMBIGUEDADES = re.compile(
+    r"\b(?:excepto|salvo|except|apart from|other than|but not|either|or|u)\b"
+    r"|\bmenos\b(?! (?:cuarto|cinco|diez|veinte|veinticinco|media|\d))"
+    r"|\bo\b(?! ?clock\b)"
+)
+
+_NUMERO = r"(\d{1,2}|" + "|".join(sorted(NUMEROS, key=len, reverse=True)) + r")"
+_MINUTO = r"(\d{1,2}|" + "|".join(sorted(MINUTOS, key=len, reverse=True)) + r")"
+_DIA_SEMANA = "(" + "|".join(DIAS_SEMANA) + ")"
+_MES = "(" + "|".join(sorted(MESES, key=len, reverse=True)) + ")"
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+# Unidades tras un número que no es un día del mes ("el 2 personas", "the 3 towels")
+_NO_ES_DIA = r"(?!\s*(?:personas?|persons?|people|of us|toallas?|towels?|euros?|minutos?|minutes?|horas?|hours?|h\b|:|\.\d|/))"
+
+_PATRONES_FECHA = [
+    ("pasado", re.compile(r"\bpasado manana\b|\bday after tomorrow\b")),
+    ("hoy", re.compile(r"\bhoy\b|\btoday\b|\btonight\b|\besta (?:manana|tarde|noche)\b|\bthis (?:morning|afternoon|evening)\b")),
+    ("manana", re.compile(r"(?<!la )(?<!pasado )\bmanana\b|\btomorrow\b")),
+    ("dentro", re.compile(r"\b(?:dentro de|en|in) " + _NUMERO + r" (?:dias?|days?)\b")),
+    ("numerica", re.compile(r"\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2,4}))?\b")),
+    ("dia_mes", re.compile(r"\b(\d{1,2})" + _ORDINAL + r" (?:de |of )?" + _MES + r"(?: (?:de |del )?(\d{4}))?\b")),
+    ("mes_dia", re.compile(r"\b" + _MES + r" (?:the )?(\d{1,2})" + _ORDINAL + r"\b")),
+    ("semana_dia", re.compile(r"\b" + _DIA_SEMANA + r" (?:dia |the )?(\d{1,2})" + _ORDINAL + r"\b" + _NO_ES_DIA)),
+    ("dia", re.compile(r"\b(?:el dia|dia|el|the|on the)\s+(\d{1,2})" + _ORDINAL + r"\b" + _NO_ES_DIA)),
+    ("semana", re.compile(r"\b(?:(este|this|el proximo|proximo|next|el|on)\s+)?" + _DIA_SEMANA + r"\b")),
+]
+
+_ANCLA_HORA = r"(?:a las|a la|sobre las|sobre la|hacia las|hacia la|para las|para la|at|around|about|by)"
+
+_PATRONES_HORA = [
+    ("mediodia", re.compile(r"\b(?:mediodia|medio dia|noon|midday)\b")),
+    ("medianoche", re.compile(r"\b(?:medianoche|midnight)\b")),
+    ("digitos", re.compile(r"\b(\d{1,2})(?::|h|\.(?=\d{2}\b))(\d{2})\b")),
+    ("en_pasado", re.compile(r"\b" + _MINUTO + r" (past|to) " + _NUMERO + r"\b")),
+    ("palabras", re.compile(
+        r"\b" + _ANCLA_HORA + r" " + _NUMERO + r"(?: ?(?:h|hs|horas|o clock|oclock)\b)?"
+        r"(?: (y|menos) " + _MINUTO + r"\b| " + _MINUTO + r"\b(?! de\b| del\b| (?:dias|days|personas|people)\b))?"
+    )),
+    ("am_pm", re.compile(r"\b(\d{1,2}) ?(am|pm)\b")),
+]
+
+_FRANJA_AM = re.compile(r"\b(?:de|por|en) la manana\b|\b(?:esta|this|in the) (?:manana|morning)\b|\bmorning\b|\b(?:de|por) la madrugada\b|\bam\b")
+_FRANJA_PM = re.compile(r"\b(?:de|por|en) la (?:tarde|noche)\b|\besta (?:tarde|noche)\b|\b(?:afternoon|evening|tonight|night)\b|\bpm\b")
+_NOCHE = re.compile(r"\b(?:de|por) la noche\b|\bat night\b")
+
+
+def normalizar(texto: str) -> str:
+    """
+    Minúsculas y sin tildes, como `preclasificador.normalizar_texto`, pero conservando
+    `:`, `/`, `-` y `.` entre cifras para las horas y las fechas numéricas.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"\b([ap])\.m\.?(?=\W|$)", r"\1m", texto)
+    texto = re.sub(r"(\d)([ap]m)\b", r"\1 \2", texto)      # "11:30pm" -> "11:30 pm"
+    texto = re.sub(r"[^a-z0-9ñ:/.\- ]+", " ", texto)
+    texto = re.sub(r"(?<!\d)[:/.\-]|[:/.\-](?!\d)", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def _numero(valor: str) -> int:
+    return int(valor) if valor.isdigit() else NUMEROS.get(valor, MINUTOS.get(valor, -1))
+
+
+def zona_horaria(nombre: str = None):
+    """`ZoneInfo` del apartamento (o de `ZONA_HORARIA`); `None` si el sistema no tiene esa zona."""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(nombre or os.getenv("ZONA_HORARIA", ZONA_HORARIA_POR_DEFECTO))
+    except Exception:
+        return None
+
+
+def ahora_local(nombre_zona: str = None) -> datetime:
+    """Fecha y hora actuales en la zona horaria del huésped."""
+    return datetime.now(zona_horaria(nombre_zona))
+
+
+def _fecha_valida(anio: int, mes: int, dia: int):
+    try:
+        return date(anio, mes, dia)
+    except ValueError:
+        return None
+
+
+def _proxima(hoy: date, mes: int, dia: int, anio: int = None):
+    """Fecha con ese día y mes; sin año, la próxima que no haya pasado."""
+    if anio is not None:
+        return _fecha_valida(anio + 2000 if anio < 100 else anio, mes, dia)
+    candidata = _fecha_valida(hoy.year, mes, dia)
+    if candidata is not None and candidata < hoy:
+        candidata = _fecha_valida(hoy.year + 1, mes, dia)
+    return candidata
+
+
+def _interpretar_fecha(texto: str, hoy: date):
+    for tipo, patron in _PATRONES_FECHA:
+        encontrado = patron.search(texto)
+        if encontrado is None:
+            continue
+        if tipo == "pasado":
+            return hoy + timedelta(days=2)
+        if tipo == "hoy":
+            return hoy
+        if tipo == "manana":
+            return hoy + timedelta(days=1)
+        if tipo == "dentro":
+            dias = _numero(encontrado.group(1))
+            return hoy + timedelta(days=dias) if dias >= 0 else None
+        if tipo == "numerica":
+            anio = encontrado.group(3)
+            return _proxima(hoy, int(encontrado.group(2)), int(encontrado.group(1)), int(anio) if anio else None)
+        if tipo == "dia_mes":
+            anio = encontrado.group(3)
+            return _proxima(hoy, MESES[encontrado.group(2)], int(encontrado.group(1)), int(anio) if anio else None)
+        if tipo == "mes_dia":
+            return _proxima(hoy, MESES[encontrado.group(1)], int(encontrado.group(2)))
+        if tipo in ("semana_dia", "dia"):
+            dia = int(encontrado.group(encontrado.lastindex))
+            if not 1 <= dia <= 31:
+                continue
+            mes, anio = hoy.month, hoy.year
+            if dia < hoy.day:
+                mes, anio = (1, anio + 1) if mes == 12 else (mes + 1, anio)
+            fecha = _fecha_valida(anio, mes, dia)
+            # "el lunes 20" cuando el 20 es martes: que lo aclare el LLM
+            if tipo == "semana_dia" and fecha is not None and fecha.weekday() != DIAS_SEMANA[encontrado.group(1)]:
+                return None
+            return fecha
+        if tipo == "semana":
+            # "este lunes" puede ser hoy; "el lunes" / "next monday" es el siguiente
+            dias = (DIAS_SEMANA[encontrado.group(2)] - hoy.weekday()) % 7
+            if dias == 0 and encontrado.group(1) not in ("este", "this"):
+                dias = 7
+            return hoy + timedelta(days=dias)
+    return None
+
+
+def _interpretar_hora(texto: str):
+    for tipo, patron in _PATRONES_HORA:
+        encontrado = patron.search(texto)
+        if encontrado is None:
+            continue
+        if tipo == "mediodia":
+            return 12, 0
+        if tipo == "medianoche":
+            return 0, 0
+        if tipo == "digitos":
+            hora, minutos = int(encontrado.group(1)), int(encontrado.group(2))
+        elif tipo == "en_pasado":
+            minutos, hora = _numero(encontrado.group(1)), _numero(encontrado.group(3))
+            if encontrado.group(2) == "to":
+                hora, minutos = hora - 1, 60 - minutos
+        elif tipo == "palabras":
+            hora = _numero(encontrado.group(1))
+            if encontrado.group(3):
+                minutos = _numero(encontrado.group(3))
+                if encontrado.group(2) == "menos":
+                    hora, minutos = hora - 1, 60 - minutos
+            elif encontrado.group(4):
+                minutos = _numero(encontrado.group(4))
+            else:
+                minutos = 0
+        else:  # am_pm
+            hora, minutos = int(encontrado.group(1)), 0
+        return hora, minutos
+    return None
+
+
+def _aplicar_franja(texto: str, hora: int, minutos: int):
+    """Pasa a 24 horas según "de la tarde"/pm o, si no se indica, con la regla de la 1 a las 7."""
+    if hora > 12:
+        return hora, minutos
+    if _FRANJA_PM.search(texto):
+        if hora == 12 and _NOCHE.search(texto):
+            return 0, minutos
+        return (hora + 12 if hora < 12 else hora), minutos
+    if _FRANJA_AM.search(texto):
+        return (0 if hora == 12 else hora), minutos
+    if 1 <= hora <= 7:
+        return hora + 12, minutos
+    return hora, minutos
+
+
+def interpretar(texto: str, ahora: datetime = None) -> dict:
+    """
+    Devuelve `{"fecha": "AAAA-MM-DD" | None, "hora": "HH:MM" | None}` con lo que se
+    pueda deducir del mensaje sin ambigüedad. `ahora` es la referencia para "mañana",
+    "el lunes"... (por defecto, la hora actual en `ZONA_HORARIA`).
+    """
+    resultado = {"fecha": None, "hora": None}
+    normalizado = normalizar(texto or "")
+    if not normalizado or _NEGACIONES.search(normalizado) or _AMBIGUEDADES.search(normalizado):
+        return resultado
+
+    ahora = ahora or ahora_local()
+    fecha = _interpretar_fecha(normalizado, ahora.date())
+    if fecha is not None:
+        resultado["fecha"] = fecha.isoformat()
+
+    hora = _interpretar_hora(normalizado)
+    if hora is not None:
+        horas, minutos = _aplicar_franja(normalizado, *hora)
+        if 0 <= horas <= 23 and 0 <= minutos <= 59:
+            resultado["hora"] = f"{horas:02d}:{minutos:02d}"
+    return resultado
+
+
+_NOMBRES_DIA = {
+    "es": ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"],
+    "en": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+}
+
+
+def describir_fecha(fecha: str, idioma: str = "es") -> str:
+    """"2026-10-19" -> "lunes 19/10"; cualquier otro texto (p. ej. del LLM) se devuelve igual."""
+    try:
+        dia = date.fromisoformat(fecha)
+    except (TypeError, ValueError):
+        return fecha
+    return f"{_NOMBRES_DIA.get(idioma, _NOMBRES_DIA['es'])[dia.weekday()]} {dia.day:02d}/{dia.month:02d}"
+
+
+# 🔹 Contadores de la vía rápida en `handle_limpieza` (se exponen en `/estadisticas`)
+_contadores = {"turnos": 0, "resueltos_localmente": 0}
+
+
+def registrar_turno(resultado: dict):
+    """Apunta si el turno de limpieza se resolvió sin LLM (el intérprete sacó la fecha, la hora o ambas)."""
+    _contadores["turnos"] += 1
+    if resultado["fecha"] or resultado["hora"]:
+        _contadores["resueltos_localmente"] += 1
+
+
+def estadisticas() -> dict:
+    turnos = _contadores["turnos"]
+    return {
+        **_contadores,
+        "enviados_al_llm": turnos - _contadores["resueltos_localmente"],
+        "tasa_local": round(_contadores["resueltos_localmente"] / turnos, 3) if turnos else 0.0,
+    }
+
+
+def evaluar(corpus) -> dict:
+    """
+    Pasa el corpus por el intérprete. Cada caso trae `texto`, `ahora` (ISO) y los
+    valores esperados de `fecha` y `hora` (`null` si el mensaje no los da o si debe
+    decidirlos el LLM). Un caso se resuelve localmente si se obtiene algún valor.
+    """
+    resueltos = correctos_resueltos = correctos = 0
+    fallos = []
+    for caso in corpus:
+        obtenido = interpretar(caso["texto"], datetime.fromisoformat(caso["ahora"]))
+        esperado = {"fecha": caso.get("fecha"), "hora": caso.get("hora")}
+        acierto = obtenido == esperado
+        correctos += acierto
+        if obtenido["fecha"] or obtenido["hora"]:
+            resueltos += 1
+            correctos_resueltos += acierto
+        if not acierto:
+            fallos.append({"texto": caso["texto"], "esperado": esperado, "obtenido": obtenido})
+
+    total = len(corpus)
+    return {
+        "total": total,
+        "precision": correctos / total if total else 0.0,
+        "tasa_local": resueltos / total if total else 0.0,
+        "precision_local": correctos_resueltos / resueltos if resueltos else 0.0,
+        "fallos": fallos,
+    }
+
+
+# 🔹 **Evaluación offline**: python -m app.fechas [--fichero corpus.json] [--texto "mañana a las 10"]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evalúa el intérprete local de fechas y horas.")
+    parser.add_argument("--fichero", default=RUTA_CORPUS, help="Corpus JSON con los valores esperados")
+    parser.add_argument("--texto", default=None, help="Interpreta solo este mensaje (con la hora actual)")
+    args = parser.parse_args()
+
+    if args.texto:
+        print(json.dumps(interpretar(args.texto), ensure_ascii=False))
+    else:
+        with open(args.fichero, encoding="utf-8") as f:
+            corpus = json.load(f)
+        resultado = evaluar(corpus)
+        for fallo in resultado["fallos"]:
+            print(f"❌ {fallo['texto']!r}: esperado {fallo['esperado']}, obtenido {fallo['obtenido']}")
+        print(f"📌 Mensajes evaluados: {resultado['total']}")
+        print(f"✅ Precisión global: {resultado['precision']:.1%}")
+        print(f"⚡ Resueltos sin LLM: {resultado['tasa_local']:.1%}")
+        print(f"🎯 Precisión de lo resuelto sin LLM: {resultado['precision_local']:.1%}")
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import numpy as np
+from app.preclasificador import normalizar_texto
+
+###############################################################################
+# Índice geográfico en rejilla y distancias
+###############################################################################
+#
+# Los locales y actividades con `latitud`/`longitud` se reparten en celdas de
+# `GEO_CELDA_KM` km. Para "los N más cercanos a menos de X km del apartamento" solo se
+# miran las celdas del cuadrado que rodea el círculo (una búsqueda binaria por fila de
+# celdas), se calcula la distancia de esos puntos y se quedan los N más próximos. El índice se construye al cargar cada catálogo.
+#
+#   - Las distancias son equirectangulares: a la escala de unas pocas poblaciones el
+#     error frente a haversine es de metros. `distancias_km` (haversine) queda para comparar.
+#   - Las coordenadas de un apartamento salen de su fila (`latitud`/`longitud`) o, si no
+#     las tiene, del centro de su `poblacion` (`datos/poblaciones.json`).
+#   - `python -m benchmarks.geo` compara la rejilla con calcular todas las distancias.
+
+RUTA_POBLACIONES = os.path.join(os.path.dirname(__file__), "datos", "poblaciones.json")
+
+RADIO_TIERRA_KM = 6371.0
+KM_POR_GRADO = 111.32
+CELDA_KM = float(os.getenv("GEO_CELDA_KM", 1.0))
+RADIO_CERCANIA_KM = float(os.getenv("CERCANIA_RADIO_KM", 5.0))
+MAX_CERCANOS = int(os.getenv("CERCANIA_MAX", 5))
+
+# 🔹 Preguntas que se contestan solo con el índice ("¿qué hay abierto cerca?")
+_CERCANIA = re.compile(
+    r"\b(cerca|cercanos?|cercanas?|al lado|a mano|alrededor|near|nearby|nearest|closest|around here|close by|walking distance)\b"
+)
+
+
+def distancias_km(latitudes: np.ndarray, longitudes: np.ndarray, origen) -> np.ndarray:
+    """Distancia haversine (km) de cada punto al `origen` `(latitud, longitud)`; NaN si falta alguna coordenada."""
+    lat0, lon0 = np.radians(origen[0]), np.radians(origen[1])
+    lat, lon = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def es_consulta_cercania(texto: str) -> bool:
+    return _CERCANIA.search(normalizar_texto(texto or "")) is not None
+
+
+class IndiceGeo:
+    """Rejilla sobre un conjunto fijo de puntos (posición i = i-ésimo local del catálogo)."""
+
+    def __init__(self, latitudes, longitudes, celda_km: float = None):
+        self.celda_km = celda_km or CELDA_KM
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.n = len(latitudes)
+        validos = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        self.con_coordenadas = int(validos.sum())
+
+        # Escala de las longitudes con la latitud media: celdas casi cuadradas
+        self.latitud_referencia = float(np.mean(latitudes[validos])) if self.con_coordenadas else 0.0
+        self._coseno = np.cos(np.radians(self.latitud_referencia))
+        self.grados_lat = self.celda_km / KM_POR_GRADO
+        self.grados_lon = self.celda_km / (KM_POR_GRADO * self._coseno)
+
+        self._latitud_rad = np.radians(latitudes).astype(np.float32)
+        self._longitud_rad = np.radians(longitudes).astype(np.float32)
+
+        # 🔹 Posiciones ordenadas por celda (fila, columna): las celdas de una fila que toca
+        # el círculo son un único tramo contiguo de `_orden`, que se localiza con `searchsorted`
+        posiciones = np.flatnonzero(validos)
+        filas = np.floor(latitudes[posiciones] / self.grados_lat).astype(np.int64)
+        columnas = np.floor(longitudes[posiciones] / self.grados_lon).astype(np.int64)
+        claves = filas * (1 << 32) + columnas
+        orden = np.argsort(claves, kind="stable")
+        self._orden = posiciones[orden]
+        self._claves = claves[orden]
+
+    def __len__(self):
+        return self.con_coordenadas
+
+    def distancias(self, origen, posiciones=None) -> np.ndarray:
+        """Km (equirectangular) desde `origen` a todos los puntos o a `posiciones`; NaN sin coordenadas."""
+        lat0, lon0 = np.float32(np.radians(origen[0])), np.float32(np.radians(origen[1]))
+        latitudes = self._latitud_rad if posiciones is None else self._latitud_rad[posiciones]
+        longitudes = self._longitud_rad if posiciones is None else self._longitud_rad[posiciones]
+        dlat = latitudes - lat0
+        dlon = (longitudes - lon0) * np.float32(np.cos(lat0))
+        return np.float32(RADIO_TIERRA_KM) * np.sqrt(dlat * dlat + dlon * dlon)
+
+    def en_radio(self, origen, radio_km: float):
+        """`(posiciones, distancias)` de los puntos a menos de `radio_km`, sin ordenar."""
+        latitud, longitud = origen
+        fila0 = int(np.floor((latitud - radio_km / KM_POR_GRADO) / self.grados_lat))
+        fila1 = int(np.floor((latitud + radio_km / KM_POR_GRADO) / self.grados_lat))
+        margen_lon = radio_km / (KM_POR_GRADO * self._coseno)
+        columna0 = int(np.floor((longitud - margen_lon) / self.grados_lon))
+        columna1 = int(np.floor((longitud + margen_lon) / self.grados_lon))
+
+        filas = np.arange(fila0, fila1 + 1, dtype=np.int64) * (1 << 32)
+        inicios = np.searchsorted(self._claves, filas + columna0).tolist()
+        finales = np.searchsorted(self._claves, filas + columna1, side="right").tolist()
+        tramos = [self._orden[i:f] for i, f in zip(inicios, finales) if f > i]
+        if not tramos:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        candidatos = np.concatenate(tramos)
+        distancias = self.distancias(origen, candidatos)
+        dentro = distancias <= radio_km
+        return candidatos[dentro], distancias[dentro]
+
+    def cercanos(self, origen, n: int, radio_km: float, permitidos: np.ndarray = None, filtro=None):
+        """
+        Los `n` puntos más cercanos a menos de `radio_km`, ordenados por distancia:
+        `(posiciones, distancias)`. Antes de ordenar se descartan los que no estén en
+        `permitidos` (vector booleano por posición) o para los que `filtro(posiciones)`
+        (vectorizado, solo sobre los del radio) devuelva False.
+        """
+        posiciones, distancias = self.en_radio(origen, radio_km)
+        if permitidos is not None and len(posiciones):
+            validos = permitidos[posiciones]
+            posiciones, distancias = posiciones[validos], distancias[validos]
+        if filtro is not None and len(posiciones):
+            validos = filtro(posiciones)
+            posiciones, distancias = posiciones[validos], distancias[validos]
+        if len(posiciones) > n:
+            mejores = np.argpartition(distancias, n - 1)[:n]
+            posiciones, distancias = posiciones[mejores], distancias[mejores]
+        orden = np.argsort(distancias, kind="stable")
+        return posiciones[orden], distancias[orden]
+
+
+_centros_poblacion = None
+
+
+def centro_poblacion(poblacion: str):
+    """Coordenadas del centro de una población conocida (`datos/poblaciones.json`) o `None`."""
+    global _centros_poblacion
+    if _centros_poblacion is None:
+        with open(RUTA_POBLACIONES, encoding="utf-8") as f:
+            _centros_poblacion = {normalizar_texto(nombre): tuple(c) for nombre, c in json.load(f).items()}
+    return _centros_poblacion.get(normalizar_texto(poblacion or ""))
@@ -0,0 +1,127 @@
+import re
+import numpy as np
+
+###############################################################################
+# Horarios semanales de locales y actividades
+###############################################################################
+#
+# En los JSON de catálogos el horario es un diccionario de días -> tramos:
+#
+#     "horario": {"lun-vie": ["13:00-16:00", "20:00-23:30"], "sab,dom": ["12:00-01:00"]}
+#
+#   - Días: lun mar mie jue vie sab dom, sueltos, con comas o en rangos ("vie-lun" da la vuelta).
+#   - Un tramo que termina antes de empezar ("20:00-01:00") sigue el día siguiente.
+#   - Sin `horario` el local se considera siempre abierto.
+#   - `temporada` (opcional) limita los meses: "jun-sep", "abr-oct", "nov-mar" (da la vuelta)
+#     o "jul,ago". Fuera de temporada el local está cerrado aunque el horario diga otra cosa.
+#
+# Cada horario se convierte en 672 franjas de 15 minutos (una semana) empaquetadas en
+# 84 bytes, así que "¿está abierto el martes a las 21:30?" para miles de locales es
+# leer un bit por fila con NumPy.
+
+DIAS = ["lun", "mar", "mie", "jue", "vie", "sab", "dom"]
+MESES = ["ene", "feb", "mar", "abr", "may", "jun", "jul", "ago", "sep", "oct", "nov", "dic"]
+MINUTOS_FRANJA = 15
+FRANJAS_DIA = 24 * 60 // MINUTOS_FRANJA
+FRANJAS_SEMANA = 7 * FRANJAS_DIA
+
+_TRAMO = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$")
+
+
+def _rangos(clave: str, nombres: list) -> list:
+    indices = []
+    for parte in clave.lower().replace("é", "e").replace("á", "a").split(","):
+        inicio, _, fin = parte.strip().partition("-")
+        a = nombres.index(inicio[:3])
+        b = nombres.index(fin[:3]) if fin else a
+        indices += [(a + i) % len(nombres) for i in range((b - a) % len(nombres) + 1)]
+    return indices
+
+
+def dias_de(clave: str) -> list:
+    """"lun-vie" -> [0..4], "sab,dom" -> [5, 6], "vie-lun" -> [4, 5, 6, 0]."""
+    return _rangos(clave, DIAS)
+
+
+def meses_de(temporada: str) -> list:
+    """"jun-sep" -> [5..8], "nov-mar" -> [10, 11, 0, 1, 2] (0 = enero)."""
+    return _rangos(temporada, MESES)
+
+
+def franjas_semana(horario: dict) -> np.ndarray:
+    """Vector booleano de 672 franjas (lunes 00:00 ... domingo 23:45) con el local abierto."""
+    abierto = np.zeros(FRANJAS_SEMANA, dtype=bool)
+    for clave, tramos in horario.items():
+        for dia in dias_de(clave):
+            for tramo in tramos:
+                encontrado = _TRAMO.match(tramo)
+                if encontrado is None:
+                    raise ValueError(f"❌ Tramo de horario no válido: {tramo!r}")
+                h0, m0, h1, m1 = (int(x) for x in encontrado.groups())
+                inicio = dia * FRANJAS_DIA + (h0 * 60 + m0) // MINUTOS_FRANJA
+                fin = dia * FRANJAS_DIA + (h1 * 60 + m1) // MINUTOS_FRANJA
+                if fin <= inicio:
+                    fin += FRANJAS_DIA          # pasa de medianoche
+                indices = np.arange(inicio, fin) % FRANJAS_SEMANA
+                abierto[indices] = True
+    return abierto
+
+
+def tramos_del_dia(horario: dict, dia_semana: int) -> list:
+    """Tramos de un horario para ese día de la semana, p. ej. `["10:00-14:00", "16:00-19:00"]`."""
+    tramos = []
+    for clave, lista in (horario or {}).items():
+        if dia_semana in dias_de(clave):
+            tramos += [t for t in lista if t not in tramos]
+    return sorted(tramos)
+
+
+def franja(momento) -> int:
+    """Franja de la semana de un `datetime`."""
+    return momento.weekday() * FRANJAS_DIA + (momento.hour * 60 + momento.minute) // MINUTOS_FRANJA
+
+
+class HorariosSemanales:
+    """Horarios de todos los locales de un catálogo: una fila de 84 bytes por local y sus meses abiertos."""
+
+    def __init__(self, locales):
+        n = len(locales)
+        self.bits = np.full((n, FRANJAS_SEMANA // 8), 0xFF, dtype=np.uint8)
+        self.dias = np.ones((n, 7), dtype=bool)            # días en que empieza algún tramo
+        self.meses = np.ones((n, 12), dtype=bool)
+        self.con_horario = 0
+        self.con_temporada = 0
+        cache = {}
+        for posicion, local in enumerate(locales):
+            if local.get("temporada"):
+                self.meses[posicion] = False
+                self.meses[posicion, meses_de(local["temporada"])] = True
+                self.con_temporada += 1
+            horario = local.get("horario")
+            if not horario:
+                continue
+            clave = repr(sorted(horario.items()))
+            fila = cache.get(clave)
+            if fila is None:
+                fila = cache[clave] = np.packbits(franjas_semana(horario), bitorder="little")
+            self.bits[posicion] = fila
+            self.dias[posicion] = False
+            self.dias[posicion, [d for clave, tramos in horario.items() if tramos for d in dias_de(clave)]] = True
+            self.con_horario += 1
+
+    def abiertos(self, momento, posiciones=None) -> np.ndarray:
+        """Vector booleano: qué locales (todos o `posiciones`) están abiertos en `momento`."""
+        f = franja(momento)
+        columna = self.bits[:, f // 8] if posiciones is None else self.bits[posiciones, f // 8]
+        return ((columna >> (f % 8)) & 1 == 1) & self.en_temporada(momento.month, posiciones)
+
+    def abiertos_dia(self, dia_semana: int, posiciones=None) -> np.ndarray:
+        """
+        Qué locales abren ese día de la semana (0 = lunes), sin mirar la temporada. Cuenta
+        el día en que empieza el tramo: la discoteca de "sab 23:30-05:00" no abre el domingo.
+        """
+        return self.dias[:, dia_semana] if posiciones is None else self.dias[posiciones, dia_semana]
+
+    def en_temporada(self, mes: int, posiciones=None) -> np.ndarray:
+        """Qué locales abren ese mes (1 = enero)."""
+        return self.meses[:, mes - 1] if posiciones is None else self.meses[posiciones, mes - 1]
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+from contextvars import ContextVar
+from app import registro, trazas
+
+log = registro.obtener(__name__)
+
+###############################################################################
+# Pasarela única hacia OpenAI
+###############################################################################
+#
+# Todos los manejadores llaman a `completar(etapa, messages)` en lugar de crear su
+# propio cliente. Aquí vive el único `AsyncOpenAI` del proceso (con un pool HTTP
+# keep-alive compartido), la configuración de modelo/tokens/timeout de cada etapa,
+# la limpieza de las respuestas ```json y la telemetría de latencia y tokens.
+#
+# Si la petición llega por `/chat/stream`, las etapas con `emitir` se piden en modo
+# streaming y cada fragmento se entrega al emisor de la petición según se genera.
+
+MODELO_POR_DEFECTO = os.getenv("LLM_MODELO", "gpt-4-turbo")
+TIMEOUT_POR_DEFECTO = float(os.getenv("LLM_TIMEOUT", 20))
+
+# 🔹 Configuración de cada etapa del pipeline
+# `emitir`: "texto" si la respuesta del modelo va tal cual al cliente, o el nombre del
+# campo del JSON de respuesta que contiene el texto para el cliente.
+ETAPAS = {
+    "clasificacion": {"max_tokens": 200, "temperature": 0, "timeout": 15},
+    "categorizacion": {"max_tokens": 50, "temperature": 0, "timeout": 10},
+    "averia": {"max_tokens": 150, "temperature": 0},
+    "limpieza": {"max_tokens": 100, "temperature": 0},
+    "transporte_privado": {"max_tokens": 100, "temperature": 0},
+    "restaurantes": {"max_tokens": 100, "temperature": 0},
+    "actividades": {"max_tokens": 100, "temperature": 0},
+    "transporte_movilidad": {"max_tokens": 200, "temperature": 0, "emitir": "respuesta_al_cliente"},
+    "instalaciones": {"max_tokens": 200, "temperature": 0, "emitir": "texto"},
+    "normas": {"max_tokens": 200, "temperature": 0, "emitir": "texto"},
+    "penalizaciones": {"max_tokens": 200, "temperature": 0, "emitir": "texto"},
+}
+
+# 🔹 Emisor de la petición en curso: función `(evento, datos)` o `None` si no hay streaming
+emisor_actual = ContextVar("emisor_actual", default=None)
+
+_cliente = None
+
+
+def obtener_cliente():
+    """
+    Cliente compartido; se crea en la primera llamada con un pool de conexiones keep-alive.
+    `openai` y `httpx` se importan aquí para que importar la app no los cargue.
+    """
+    global _cliente
+    if _cliente is None:
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONEXIONES", 100)),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", 20)),
+            ),
+            timeout=TIMEOUT_POR_DEFECTO,
+        )
+        _cliente = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            max_retries=int(os.getenv("LLM_REINTENTOS", 1)),
+        )
+    return _cliente
+
+
+def configuracion_etapa(etapa: str) -> dict:
+    """Modelo y parámetros de una etapa, con los valores por defecto aplicados."""
+    config = {"model": MODELO_POR_DEFECTO, "max_tokens": 200, "temperature": 0, "timeout": TIMEOUT_POR_DEFECTO, "emitir": None}
+    config.update(ETAPAS.get(etapa, {}))
+    return config
+
+
+###############################################################################
+# Telemetría por etapa
+###############################################################################
+
+class _Telemetria:
+    def __init__(self):
+        self.etapas = {}
+
+    def registrar(self, etapa, segundos, usage=None, error=False, primer_token=None):
+        datos = self.etapas.setdefault(etapa, {
+            "llamadas": 0, "errores": 0, "segundos_total": 0.0, "segundos_max": 0.0,
+            "tokens_prompt": 0, "tokens_respuesta": 0,
+            "llamadas_streaming": 0, "segundos_primer_token_total": 0.0,
+        })
+        datos["llamadas"] += 1
+        datos["errores"] += int(error)
+        datos["segundos_total"] += segundos
+        datos["segundos_max"] = max(datos["segundos_max"], segundos)
+        if primer_token is not None:
+            datos["llamadas_streaming"] += 1
+            datos["segundos_primer_token_total"] += primer_token
+        if usage is not None:
+            datos["tokens_prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+            datos["tokens_respuesta"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def estadisticas(self) -> dict:
+        resultado = {}
+        for etapa, datos in self.etapas.items():
+            resultado[etapa] = dict(datos)
+            resultado[etapa]["segundos_medio"] = round(datos["segundos_total"] / datos["llamadas"], 4) if datos["llamadas"] else 0.0
+            resultado[etapa]["segundos_total"] = round(datos["segundos_total"], 4)
+            resultado[etapa]["segundos_max"] = round(datos["segundos_max"], 4)
+            resultado[etapa]["segundos_primer_token_medio"] = (
+                round(datos["segundos_primer_token_total"] / datos["llamadas_streaming"], 4) if datos["llamadas_streaming"] else None
+            )
+            del resultado[etapa]["segundos_primer_token_total"]
+        return resultado
+
+
+telemetria = _Telemetria()
+
+
+def estadisticas() -> dict:
+    return telemetria.estadisticas()
+
+
+###############################################################################
+# Llamadas
+###############################################################################
+
+def limpiar_json(texto: str) -> str:
+    """Quita las marcas ```json ... ``` que a veces añade el modelo."""
+    texto = texto.strip()
+    if texto.startswith("```json"):
+        texto = texto[7:].strip()
+    elif texto.startswith("```"):
+        texto = texto[3:].strip()
+    if texto.endswith("```"):
+        texto = texto[:-3].strip()
+    return texto
+
+
+def parsear_json(texto: str):
+    """`json.loads` tras limpiar las backticks. Lanza `json.JSONDecodeError` si no es JSON."""
+    return json.loads(limpiar_json(texto))
+
+
+class ExtractorCampoJSON:
+    """
+    Extrae de forma incremental el valor (cadena) de un campo de un JSON que llega por
+    fragmentos, p. ej. `"respuesta_al_cliente": "..."`, resolviendo los escapes.
+    `alimentar(fragmento)` devuelve el texto nuevo del campo que se puede emitir ya.
+    """
+
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self, campo: str):
+        self.patron = f'"{campo}"'
+        self.buffer = ""
+        self.posicion = None      # índice del primer carácter del valor dentro de `buffer`
+        self.terminado = False
+
+    def alimentar(self, fragmento: str) -> str:
+        self.buffer += fragmento
+        if self.terminado:
+            return ""
+
+        if self.posicion is None:
+            inicio = self.buffer.find(self.patron)
+            if inicio < 0:
+                return ""
+            resto = self.buffer[inicio + len(self.patron):]
+            dos_puntos = resto.lstrip()
+            if not dos_puntos.startswith(":"):
+                return ""
+            valor = dos_puntos[1:].lstrip()
+            if not valor:
+                return ""
+            if not valor.startswith('"'):
+                self.terminado = True  # El campo no es una cadena: no hay nada que emitir
+                return ""
+            self.posicion = len(self.buffer) - len(valor) + 1
+
+        salida = []
+        i = self.posicion
+        while i < len(self.buffer):
+            caracter = self.buffer[i]
+            if caracter == '"':
+                self.terminado = True
+                i += 1
+                break
+            if caracter == "\\":
+                if i + 1 >= len(self.buffer):
+                    break                           # Escape incompleto: esperar al siguiente fragmento
+                siguiente = self.buffer[i + 1]
+                if siguiente == "u":
+                    if i + 6 > len(self.buffer):
+                        break
+                    salida.append(chr(int(self.buffer[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                salida.append(self.ESCAPES.get(siguiente, siguiente))
+                i += 2
+                continue
+            salida.append(caracter)
+            i += 1
+        self.posicion = i
+        return "".join(salida)
+
+
+async def _llamar_streaming(config: dict, messages: list, emitir: str, emisor):
+    """Pide la respuesta por fragmentos y entrega al emisor el texto destinado al cliente."""
+    extractor = None if emitir == "texto" else ExtractorCampoJSON(emitir)
+    inicio = time.perf_counter()
+    primer_token = None
+    partes = []
+    usage = None
+
+    stream = await obtener_cliente().chat.completions.create(
+        messages=messages, stream=True, stream_options={"include_usage": True}, **config
+    )
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        if not delta:
+            continue
+        partes.append(delta)
+        texto = delta if extractor is None else extractor.alimentar(delta)
+        if texto:
+            if primer_token is None:
+                primer_token = time.perf_counter() - inicio
+            emisor("delta", {"texto": texto})
+
+    return "".join(partes), usage, primer_token
+
+
+async def _llamar(etapa: str, messages: list, **opciones):
+    config = configuracion_etapa(etapa)
+    config.update(opciones)
+    emitir = config.pop("emitir")
+    emisor = emisor_actual.get()
+
+    inicio = time.perf_counter()
+    primer_token = None
+    try:
+        with trazas.span("llm", etapa=etapa):
+            if emitir and emisor is not None:
+                texto, usage, primer_token = await _llamar_streaming(config, messages, emitir, emisor)
+            else:
+                completion = await obtener_cliente().chat.completions.create(messages=messages, **config)
+                texto = completion.choices[0].message.content or ""
+                usage = getattr(completion, "usage", None)
+    except Exception:
+        telemetria.registrar(etapa, time.perf_counter() - inicio, error=True)
+        raise
+
+    segundos = time.perf_counter() - inicio
+    telemetria.registrar(etapa, segundos, usage, primer_token=primer_token)
+    tokens = getattr(usage, "total_tokens", 0) or 0
+    log.info("Llamada al LLM", categoria="llm", etapa=etapa, modelo=config["model"], segundos=round(segundos, 3),
+             primer_token=round(primer_token, 3) if primer_token is not None else None, tokens=tokens)
+
+    return texto.strip(), segundos, tokens
+
+
+async def completar(etapa: str, messages: list, **opciones) -> str:
+    """
+    Llama al modelo configurado para `etapa` y devuelve el texto de la respuesta.
+    Registra latencia y tokens de cada llamada (también de las fallidas).
+    Dentro de `/chat/stream` las etapas con `emitir` además envían el texto al cliente
+    mientras se genera; el valor devuelto es el mismo en ambos casos.
+    """
+    texto, _, _ = await _llamar(etapa, messages, **opciones)
+    return texto
+
+
+async def completar_medido(etapa: str, messages: list, **opciones):
+    """Como `completar`, pero devuelve `(texto, segundos, tokens)` para quien necesite el coste."""
+    return await _llamar(etapa, messages, **opciones)
@@ -1,54 +1,215 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from app.database import get_dynamic_state
-from openai import OpenAI
+from app.database import ConversationSession, STORAGE_MODE, almacen_redis, buffer_escritura
 from app.nlu import analyze_message
 from app.business_logic import handle_intents  # Usamos la versión centralizada
+from app.cache_respuestas import cache_respuestas
+from app.catalogo_apartamentos import catalogo_apartamentos
+from app.catalogo_locales import catalogo_actividades, catalogo_restaurantes
+from app.ejecutor import ColaLlena, ejecutor_turnos
+from app.rafagas import AgrupadorRafagas
+from app import fechas, llm, registro, trazas
 import json
 
 app = FastAPI(title="Chatbot de Ejemplo", version="1.0.0")
+log = registro.obtener(__name__)
+
+@app.on_event("startup")
+async def startup():
+    # 🔹 Cola y hilo escritor del registro estructurado
+    registro.configurar()
+    # 🔹 Precargamos el catálogo de apartamentos y arrancamos su recarga periódica
+    await catalogo_apartamentos.iniciar()
+    # 🔹 Catálogos de restaurantes y actividades con sus índices (geográfico y horarios): de Supabase si hay tabla, si no del JSON
+    await catalogo_restaurantes.iniciar()
+    await catalogo_actividades.iniciar()
+    # 🔹 Volcado periódico del buffer de escritura de `dinamicos`
+    await buffer_escritura.iniciar()
+    # 🔹 En modo Redis, arrancamos el volcado periódico de conversaciones a Supabase
+    if STORAGE_MODE == "redis":
+        await almacen_redis.iniciar()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await catalogo_apartamentos.detener()
+    if STORAGE_MODE == "redis":
+        await almacen_redis.detener()
+    # 🔹 Lo último: escribir en Supabase todo lo que quede pendiente
+    await buffer_escritura.detener()
+    registro.detener()
 
 class ChatRequest(BaseModel):
     numero_telefono: str
     message: str
     nombre_apartamento: str
 
+async def atender_mensaje(chat_request: ChatRequest) -> str:
+    """
+    Punto de entrada de `/chat` y `/chat/stream`. Con `RAFAGA_VENTANA_MS` activado, los
+    mensajes seguidos de un mismo huésped se agrupan en un solo turno con una sola respuesta.
+    """
+    if agrupador_rafagas.activo:
+        return await agrupador_rafagas.enviar(chat_request.numero_telefono, chat_request.message,
+                                              chat_request.nombre_apartamento)
+    return await procesar_turno(chat_request.numero_telefono, chat_request.message, chat_request.nombre_apartamento)
+
+async def procesar_turno(numero_telefono: str, user_message: str, nombre_apartamento: str) -> str:
+    """
+    Un turno completo de conversación: analiza la intención, consulta la memoria,
+    genera la respuesta y guarda el estado.
+    """
+    # 🔹 Todos los spans del turno llevan la etiqueta del apartamento
+    with trazas.span("turno", apartamento=nombre_apartamento):
+        # Los turnos de un mismo huésped se ejecutan de uno en uno y en orden de llegada
+        # (así ninguno pisa el estado que guarda otro); los de huéspedes distintos, en paralelo
+        return await ejecutor_turnos.ejecutar(numero_telefono, _procesar_turno,
+                                              numero_telefono, user_message, nombre_apartamento)
+
+# 🔹 Ráfagas de mensajes de un mismo huésped (desactivado salvo con `RAFAGA_VENTANA_MS`)
+agrupador_rafagas = AgrupadorRafagas(procesar_turno)
+
+async def _procesar_turno(numero_telefono, user_message, nombre_apartamento) -> str:
+    # 🔹 1️⃣ Recuperamos o creamos el estado de conversación del usuario (una sola lectura)
+    # La sesión comparte el mismo estado con toda la cadena y guarda una sola vez al salir
+    async with ConversationSession(numero_telefono) as conv_state:
+
+        # 🔹 2️⃣ Analizamos el mensaje con NLU
+        with trazas.span("nlu"):
+            analysis_result = await analyze_message(user_message, conv_state)
+        log.info("Mensaje clasificado", categoria="clasificacion", numero_telefono=numero_telefono,
+                 idioma=analysis_result.get("idioma"), intenciones=analysis_result.get("intenciones"))
+
+        conv_state.idioma = analysis_result["idioma"]  # ✅ Ahora accedemos correctamente al atributo
+
+        emisor = llm.emisor_actual.get()
+        if emisor is not None:
+            emisor("clasificacion", {"idioma": conv_state.idioma, "intenciones": analysis_result.get("intenciones", [])})
+
+        # 🔹 3️⃣ Procesamos la intención detectada
+        with trazas.span("despacho"):
+            reply = await handle_intents(numero_telefono, analysis_result, user_message, conv_state, nombre_apartamento)
+
+        # 🔹 4️⃣ Guardar el turno en el historial (se mantienen los últimos 10 en memoria)
+        conv_state.agregar_turno(user_message, reply)
+
+    return reply
+
 @app.post("/chat")
-def chat_endpoint(chat_request: ChatRequest):
+async def chat_endpoint(chat_request: ChatRequest, response: Response):
     """
     Endpoint que recibe un mensaje del usuario, analiza la intención,
     consulta la memoria y genera una respuesta contextualizada.
+    Con `METRICAS_CABECERA_TIEMPOS=1` devuelve el desglose de tiempos en `Server-Timing`.
+    """
+    with trazas.traza() as traza:
+        try:
+            reply = await atender_mensaje(chat_request)
+        except ColaLlena:
+            raise HTTPException(status_code=429, detail="Hay demasiados mensajes pendientes; espera a la respuesta anterior.")
+    if trazas.CABECERA_TIEMPOS:
+        response.headers["Server-Timing"] = traza.server_timing()
+    return {"reply": reply}
+
+def _evento_sse(evento: str, datos: dict) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat_request: ChatRequest):
     """
-    numero_telefono = chat_request.numero_telefono
-    user_message = chat_request.message
-    nombre_apartamento = chat_request.nombre_apartamento
+    Igual que `/chat`, pero responde con Server-Sent Events para que el widget muestre
+    la respuesta mientras se genera:
+
+    - `clasificacion`: idioma e intenciones detectadas.
+    - `delta`: fragmento de texto de la respuesta (`{"texto": ...}`).
+    - `fin`: respuesta completa (`{"reply": ...}`), enviada cuando el estado ya está guardado.
+      Si hay varias intenciones o la respuesta no viene del LLM, `fin` es la referencia.
+      Con `METRICAS_CABECERA_TIEMPOS=1` incluye también el desglose de tiempos (`tiempos`).
+    - `error`: el turno ha fallado.
+    """
+    cola = asyncio.Queue()
+
+    traza = trazas.Traza()
 
-    # 🔹 1️⃣ Recuperamos o creamos el estado de conversación del usuario
-    conv_state = get_dynamic_state(numero_telefono)
+    async def _turno():
+        # El emisor solo existe en el contexto de esta tarea: el resto de peticiones no se ven afectadas
+        llm.emisor_actual.set(lambda evento, datos: cola.put_nowait((evento, datos)))
+        with trazas.traza(traza):
+            return await atender_mensaje(chat_request)
 
-    # 🔹 2️⃣ Analizamos el mensaje con NLU
-    analysis_result = analyze_message(user_message, numero_telefono)
-    print(f"🔍 analysis_result: {analysis_result}")
+    async def _eventos():
+        # La tarea sigue hasta el final aunque el cliente se desconecte, para que el estado se guarde
+        tarea = asyncio.create_task(_turno())
+        deltas = 0
+        while True:
+            siguiente = asyncio.ensure_future(cola.get())
+            hechos, _ = await asyncio.wait({siguiente, tarea}, return_when=asyncio.FIRST_COMPLETED)
+            if siguiente not in hechos:
+                siguiente.cancel()
+                break
+            evento, datos = siguiente.result()
+            deltas += evento == "delta"
+            yield _evento_sse(evento, datos)
 
-    conv_state.idioma = analysis_result["idioma"]  # ✅ Ahora accedemos correctamente al atributo
+        while not cola.empty():
+            evento, datos = cola.get_nowait()
+            deltas += evento == "delta"
+            yield _evento_sse(evento, datos)
 
-    # 🔹 3️⃣ Procesamos la intención detectada
-    reply = handle_intents(numero_telefono, analysis_result, user_message, conv_state, nombre_apartamento)
+        try:
+            reply = tarea.result()
+        except ColaLlena:
+            yield _evento_sse("error", {"detalle": "Hay demasiados mensajes pendientes; espera a la respuesta anterior."})
+            return
+        except Exception as e:
+            log.error("Error en /chat/stream", categoria="http", exc_info=e, error=str(e))
+            yield _evento_sse("error", {"detalle": "No se ha podido procesar el mensaje."})
+            return
 
-    # 🔹 **4️⃣ Validar y convertir `historial` en una lista antes de `append()`**
-    # 🔹 5️⃣ Asegurar que historial sea una lista antes de agregar el mensaje
-    if isinstance(conv_state.historial, str):
-       try:
-        conv_state.historial = json.loads(conv_state.historial)  # Convertir a lista si es string
-       except json.JSONDecodeError:
-        conv_state.historial = []  # Si hay error, inicializar como lista vacía
-    elif not isinstance(conv_state.historial, list):
-       conv_state.historial = []  # Si no es lista, inicializar como lista vacía
+        # Respuestas sin streaming (caché, mensajes fijos...): se envían en un único fragmento
+        if not deltas:
+            yield _evento_sse("delta", {"texto": reply})
+        fin = {"reply": reply}
+        if trazas.CABECERA_TIEMPOS:
+            fin["tiempos"] = traza.desglose()
+        yield _evento_sse("fin", fin)
 
-    # 🔹 **5️⃣ Guardar el mensaje en el historial**
-    conv_state.historial.append({"usuario": user_message, "bot": reply})
+    return StreamingResponse(_eventos(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
-    # 🔹 6️⃣ Mantener solo los últimos 10 mensajes en memoria y Supabase
-    conv_state.historial = conv_state.historial[-10:]
+@app.get("/estadisticas")
+async def estadisticas_endpoint():
+    """
+    Contadores internos del servicio (aciertos de la caché de respuestas, ahorro de LLM...).
+    """
+    resultado = {
+        "cache_respuestas": cache_respuestas.estadisticas(),
+        "llm": llm.estadisticas(),
+        "buffer_escritura": buffer_escritura.estadisticas(),
+        "registro": registro.estadisticas(),
+        "ejecutor_turnos": ejecutor_turnos.estadisticas(),
+        "rafagas": agrupador_rafagas.estadisticas(),
+        "fechas_limpieza": fechas.estadisticas(),
+        "catalogo_apartamentos": {"apartamentos": len(catalogo_apartamentos), "cargado_en": catalogo_apartamentos.cargado_en},
+        "catalogo_restaurantes": catalogo_restaurantes.estadisticas(),
+        "catalogo_actividades": catalogo_actividades.estadisticas(),
+    }
+    if STORAGE_MODE == "redis":
+        resultado["almacen_redis"] = await almacen_redis.estadisticas()
+    return resultado
 
-    return {"reply": reply}
\ No newline at end of file
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Histogramas de latencia por etapa (turno, cola, nlu, despacho, manejador, llm, almacen.*)
+    y profundidad de las colas por huésped, en el formato de texto de Prometheus.
+    """
+    return PlainTextResponse(trazas.exportar_prometheus() + ejecutor_turnos.exportar_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/apartamentos/recargar")
+async def recargar_apartamentos_endpoint(nombre_apartamento: str | None = None):
+    """
+    Invalida el catálogo en memoria: recarga un apartamento concreto o la tabla completa.
+    """
+    await catalogo_apartamentos.invalidar(nombre_apartamento)
+    return {"apartamentos": len(catalogo_apartamentos), "cargado_en": catalogo_apartamentos.cargado_en}
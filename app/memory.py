@@ -1,15 +1,131 @@
-def get_token_window(conv_state, max_messages=10):
+import os
+import json
+
+###############################################################################
+# Ventana de conversación con presupuesto de tokens
+###############################################################################
+#
+# Todos los prompts incluyen la conversación reciente. En vez de meter siempre los
+# últimos 10 mensajes con `json.dumps(..., indent=2)`, la ventana se construye una
+# vez por petición en un formato compacto ("Usuario: ..." / "Bot: ...") y cada etapa
+# toma los turnos más recientes que caben en su presupuesto de tokens.
+
+# 🔹 Tokens de historial que puede usar cada etapa (mismos nombres que `app.llm.ETAPAS`)
+PRESUPUESTO_TOKENS = {
+    "clasificacion": 600,
+    "categorizacion": 300,
+    "limpieza": 300,
+    "transporte_privado": 500,
+    "restaurantes": 500,
+    "actividades": 500,
+    "transporte_movilidad": 600,
+}
+PRESUPUESTO_POR_DEFECTO = int(os.getenv("MEMORIA_PRESUPUESTO_TOKENS", 500))
+
+# Tokens fijos por turno (saltos de línea y prefijos "Usuario:"/"Bot:")
+TOKENS_POR_TURNO = 4
+
+SIN_HISTORIAL = "(sin mensajes anteriores)"
+
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimación offline del número de tokens: ~4 bytes UTF-8 por token, que se ajusta
+    bien al tokenizador de los modelos GPT para español e inglés.
+    """
+    return (len(texto.encode("utf-8")) + 3) // 4
+
+
+def _compactar(valor) -> str:
+    """Texto de un mensaje en una sola línea; los dicts se serializan sin espacios."""
+    if not isinstance(valor, str):
+        valor = json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+    return " ".join(valor.split())
+
+
+class VentanaConversacion:
+    """
+    Historial ya renderizado de un usuario. Cada turno se formatea y se mide una sola
+    vez; `texto(etapa)` solo elige cuántos turnos recientes caben en el presupuesto.
+    """
+
+    def __init__(self, historial):
+        self.turnos = []        # [(texto del turno, tokens estimados)] del más antiguo al más reciente
+        for msg in historial if isinstance(historial, list) else []:
+            if isinstance(msg, dict) and "usuario" in msg and "bot" in msg:
+                texto = f"Usuario: {_compactar(msg['usuario'])}\nBot: {_compactar(msg['bot'])}"
+                self.turnos.append((texto, estimar_tokens(texto) + TOKENS_POR_TURNO))
+        self._renderizados = {}
+
+    def texto(self, etapa: str = None, presupuesto: int = None) -> str:
+        """Los turnos más recientes que caben en el presupuesto de la etapa, en orden cronológico."""
+        if presupuesto is None:
+            presupuesto = PRESUPUESTO_TOKENS.get(etapa, PRESUPUESTO_POR_DEFECTO)
+        if presupuesto in self._renderizados:
+            return self._renderizados[presupuesto]
+
+        seleccion = []
+        usados = 0
+        for texto, tokens in reversed(self.turnos):
+            if usados + tokens > presupuesto:
+                break
+            seleccion.append(texto)
+            usados += tokens
+
+        resultado = "\n".join(reversed(seleccion)) if seleccion else SIN_HISTORIAL
+        self._renderizados[presupuesto] = resultado
+        return resultado
+
+
+def ventana_conversacion(conv_state) -> VentanaConversacion:
+    """
+    Ventana del estado de la petición. Se construye la primera vez que se pide y se
+    reutiliza mientras el historial no cambie (todos los manejadores comparten el estado).
+    """
+    firma = (id(conv_state.historial), len(conv_state.historial) if isinstance(conv_state.historial, list) else 0)
+    ventana = getattr(conv_state, "_ventana", None)
+    if ventana is None or conv_state._ventana_firma != firma:
+        ventana = VentanaConversacion(conv_state.historial)
+        conv_state._ventana = ventana
+        conv_state._ventana_firma = firma
+    return ventana
+
+
+def get_token_window(conv_state, etapa=None):
     """
-    Devuelve los últimos 'max_messages' mensajes en formato de ventana de token.
+    Devuelve la conversación reciente en formato de ventana de tokens para `etapa`.
     """
-    return "\n".join([
-        f'Usuario: "{msg["usuario"]}"\nBot: "{msg["bot"]}"' 
-        for msg in conv_state.historial[-max_messages:]
-    ])
+    return ventana_conversacion(conv_state).texto(etapa)
+
 
 def add_message_to_memory(conv_state, user_message, bot_response):
     """
     Agrega un mensaje al historial y lo mantiene limitado a la ventana de tokens.
     """
-    conv_state.historial.append({"usuario": user_message, "bot": bot_response})
-    conv_state.historial = conv_state.historial[-10:]  # Mantiene solo los últimos 10 mensajes
\ No newline at end of file
+    conv_state.agregar_turno(user_message, bot_response)
+
+
+###############################################################################
+# Recomendaciones ya sugeridas
+###############################################################################
+#
+# Para no repetir restaurantes o actividades cuando el huésped pide "más opciones", los
+# ids sugeridos se guardan en `datos_categoria` (se persiste en `dinamicos`). La lista
+# vale para unos slots concretos: si el huésped cambia de cocina, presupuesto, día...
+# se empieza de cero, y solo se recuerdan los últimos `SUGERIDOS_MAX`.
+
+SUGERIDOS_MAX = int(os.getenv("SUGERIDOS_MAX", 20))
+
+
+def ya_sugeridos(datos_categoria: dict, clave: str, slots) -> list:
+    """Ids sugeridos antes para estos mismos `slots`; si los slots cambiaron, la lista se vacía."""
+    slots = list(slots)
+    if datos_categoria.get(f"{clave}_para") != slots:
+        datos_categoria[clave] = []
+        datos_categoria[f"{clave}_para"] = slots
+    return datos_categoria.get(clave) or []
+
+
+def anotar_sugeridos(datos_categoria: dict, clave: str, ids: list):
+    """Añade los ids recién sugeridos y se queda con los últimos `SUGERIDOS_MAX`."""
+    datos_categoria[clave] = ((datos_categoria.get(clave) or []) + list(ids))[-SUGERIDOS_MAX:]
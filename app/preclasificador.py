@@ -0,0 +1,322 @@
+import os
+import json
+import re
+import zlib
+import argparse
+import unicodedata
+import numpy as np
+from app.categorias.arbol import es_categoria_valida
+
+###############################################################################
+# Preclasificador local de intenciones (vía rápida antes de OpenAI)
+###############################################################################
+#
+# Compara el mensaje con un banco de ejemplos etiquetados usando n-gramas de
+# caracteres y palabras proyectados (hashing) en vectores de NumPy. Si la
+# confianza supera `PRECLASIFICADOR_UMBRAL` se devuelve la hoja del árbol de
+# categorías sin llamar al LLM; si no, `analyze_message` sigue con gpt-4-turbo.
+# Los mensajes con varias cláusulas ("...y...", "¿...? ¿...?") se clasifican trozo a
+# trozo para no perder intenciones: o todas son seguras o decide el LLM.
+
+RUTA_EJEMPLOS = os.path.join(os.path.dirname(__file__), "datos", "ejemplos_intenciones.json")
+
+DIMENSIONES = 2 ** 13
+NGRAMAS = (3, 4)
+SIMILITUD_MINIMA = 0.2       # Por debajo de esto el mensaje no se parece a ninguna categoría
+UMBRAL_POR_DEFECTO = 0.1     # Margen mínimo entre la mejor categoría y la segunda; > 1 desactiva la vía rápida
+
+# Categorías que siempre necesitan el contexto del LLM (saludos, "sí", "vale"...)
+CATEGORIAS_SIN_VIA_RAPIDA = {"indeterminado"}
+MIN_PALABRAS = 2             # Mensajes de una sola palabra suelen ser respuestas a la pregunta anterior
+
+# Separadores de cláusulas: "la nevera no enfría y quiero una limpieza", "...? ...?"
+_SEPARADOR_PREGUNTAS = re.compile(r"[?;]+")
+_CONECTORES = re.compile(r"\b(?:y|e|and|ademas|tambien|also|plus|luego|then)\b")
+
+_PALABRAS_EN = {"the", "is", "are", "there", "can", "do", "you", "what", "how", "where", "i", "we", "my", "any", "to", "a"}
+_PALABRAS_ES = {"el", "la", "los", "las", "hay", "se", "que", "qué", "de", "en", "mi", "un", "una", "puedo", "dónde", "cómo", "es"}
+
+
+def obtener_umbral() -> float:
+    """Umbral de confianza configurable con `PRECLASIFICADOR_UMBRAL`."""
+    try:
+        return float(os.getenv("PRECLASIFICADOR_UMBRAL", UMBRAL_POR_DEFECTO))
+    except ValueError:
+        return UMBRAL_POR_DEFECTO
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin tildes ni signos de puntuación y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^a-z0-9ñ ]+", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def _indices_ngramas(texto: str) -> np.ndarray:
+    """Índices (hashing estable con crc32) de los n-gramas de caracteres y de las palabras."""
+    normalizado = normalizar_texto(texto)
+    relleno = f" {normalizado} "
+    piezas = [relleno[i:i + n] for n in NGRAMAS for i in range(len(relleno) - n + 1)]
+    piezas.extend(f"w:{palabra}" for palabra in normalizado.split())
+    return np.fromiter((zlib.crc32(p.encode("utf-8")) % DIMENSIONES for p in piezas), dtype=np.int64, count=len(piezas))
+
+
+def vectorizar(textos) -> np.ndarray:
+    """
+    Convierte una lista de textos en una matriz (n_textos x DIMENSIONES) de float32
+    con frecuencias sublineales y normalización L2 por fila.
+    """
+    matriz = np.zeros((len(textos), DIMENSIONES), dtype=np.float32)
+    for fila, texto in enumerate(textos):
+        matriz[fila] = np.bincount(_indices_ngramas(texto), minlength=DIMENSIONES)
+    np.log1p(matriz, out=matriz)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def detectar_idioma(texto: str, por_defecto: str = "es") -> str:
+    """Detección mínima es/en por palabras frecuentes; si empata, se mantiene el idioma actual."""
+    palabras = set(normalizar_texto(texto).split()) | set(texto.lower().split())
+    en = len(palabras & _PALABRAS_EN)
+    es = len(palabras & _PALABRAS_ES)
+    if en > es:
+        return "en"
+    if es > en:
+        return "es"
+    return por_defecto
+
+
+class Preclasificador:
+    """
+    Clasificador por similitud coseno contra el centroide de cada categoría.
+    Los vectores se ponderan con IDF calculado sobre el banco de ejemplos y la
+    confianza es la diferencia de similitud entre la mejor categoría y la segunda.
+    """
+
+    def __init__(self, ejemplos):
+        self.textos = [e["texto"] for e in ejemplos]
+        etiquetas = [e["categoria"] for e in ejemplos]
+        self.categorias = sorted(set(etiquetas))
+        indice = {c: i for i, c in enumerate(self.categorias)}
+        self.etiquetas = np.array([indice[c] for c in etiquetas], dtype=np.int64)
+
+        base = vectorizar(self.textos)
+        frecuencia_documental = (base > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(self.textos)) / (1 + frecuencia_documental)) + 1).astype(np.float32)
+        self.matriz = self._ponderar(base)
+
+        # Suma de los vectores de cada categoría (one-hot de etiquetas x matriz)
+        one_hot = np.zeros((len(self.categorias), len(self.textos)), dtype=np.float32)
+        one_hot[self.etiquetas, np.arange(len(self.textos))] = 1.0
+        self.sumas = one_hot @ self.matriz
+        normas = np.linalg.norm(self.sumas, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        self.centroides = self.sumas / normas
+
+    @classmethod
+    def desde_fichero(cls, ruta: str = RUTA_EJEMPLOS) -> "Preclasificador":
+        with open(ruta, encoding="utf-8") as f:
+            ejemplos = json.load(f)
+        for ejemplo in ejemplos:
+            if ejemplo["categoria"] not in CATEGORIAS_SIN_VIA_RAPIDA and not es_categoria_valida(ejemplo["categoria"]):
+                raise ValueError(f"❌ Categoría desconocida en el banco de ejemplos: {ejemplo['categoria']}")
+        return cls(ejemplos)
+
+    def _ponderar(self, matriz: np.ndarray) -> np.ndarray:
+        """Aplica los pesos IDF y vuelve a normalizar cada fila."""
+        ponderada = matriz * self.idf
+        normas = np.linalg.norm(ponderada, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return ponderada / normas
+
+    @staticmethod
+    def _decidir(puntuaciones: np.ndarray):
+        """Devuelve (índices de categoría, confianzas) para cada fila de puntuaciones."""
+        orden = np.argsort(-puntuaciones, axis=1)
+        filas = np.arange(puntuaciones.shape[0])
+        mejor = puntuaciones[filas, orden[:, 0]]
+        segunda = puntuaciones[filas, orden[:, 1]] if puntuaciones.shape[1] > 1 else np.zeros_like(mejor)
+        confianzas = np.clip(mejor - segunda, 0.0, 1.0)
+        confianzas[mejor < SIMILITUD_MINIMA] = 0.0
+        return orden[:, 0], confianzas
+
+    def _puntuar(self, textos, excluir: int = None) -> np.ndarray:
+        """
+        Similitud de cada texto con los centroides. Con `excluir` (posición en el banco)
+        el centroide de su categoría se calcula sin ese ejemplo, para dejar uno fuera.
+        """
+        vectores = self._ponderar(vectorizar(textos))
+        if excluir is None:
+            return vectores @ self.centroides.T
+        sumas = self.sumas.copy()
+        sumas[self.etiquetas[excluir]] -= self.matriz[excluir]
+        normas = np.linalg.norm(sumas, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        return vectores @ (sumas / normas).T
+
+    def clasificar(self, texto: str):
+        """Devuelve `(categoria, confianza)` para un mensaje."""
+        mejores, confianzas = self._decidir(self._puntuar([texto]))
+        return self.categorias[mejores[0]], float(confianzas[0])
+
+    def decidir(self, texto: str, umbral: float = None, bot_pregunto: bool = False, excluir: int = None):
+        """
+        Decisión de la vía rápida, la misma en `preclasificar` y en `evaluar`. Devuelve
+        `(intenciones, confianza)` o `None` si decide el LLM: el bot acaba de preguntar,
+        el mensaje es de una palabra o alguna cláusula es dudosa o no admite vía rápida.
+        """
+        umbral = obtener_umbral() if umbral is None else umbral
+        if umbral > 1 or bot_pregunto:
+            return None
+        if len(normalizar_texto(texto).split()) < MIN_PALABRAS:
+            return None
+
+        # 🔹 Con varias cláusulas se clasifica cada una: si todas son seguras, salen todas las
+        # intenciones distintas (despacho en paralelo de `/chat`); si alguna duda, decide el LLM
+        trozos = clausulas(texto)
+        mejores, confianzas = self._decidir(self._puntuar(trozos if len(trozos) > 1 else [texto], excluir))
+        intenciones = []
+        for mejor, confianza in zip(mejores.tolist(), confianzas.tolist()):
+            categoria = self.categorias[mejor]
+            if categoria in CATEGORIAS_SIN_VIA_RAPIDA or confianza < umbral:
+                return None
+            if categoria not in intenciones:
+                intenciones.append(categoria)
+        return intenciones, float(confianzas.min())
+
+    def _puntuaciones_dejando_uno_fuera(self) -> np.ndarray:
+        """
+        Similitud de cada ejemplo con los centroides calculados sin él mismo,
+        en una sola pasada matricial.
+        """
+        productos = self.matriz @ self.sumas.T                      # x_i · S_c
+        normas2 = (self.sumas ** 2).sum(axis=1)                     # ||S_c||²
+        filas = np.arange(len(self.textos))
+        propios = productos[filas, self.etiquetas]
+        normas = np.tile(np.sqrt(normas2), (len(self.textos), 1))
+        # ||S_c - x_i||² = ||S_c||² - 2 x_i·S_c + 1 para la categoría del propio ejemplo
+        normas[filas, self.etiquetas] = np.sqrt(np.maximum(normas2[self.etiquetas] - 2 * propios + 1, 1e-12))
+        productos[filas, self.etiquetas] = propios - 1
+        return productos / np.maximum(normas, 1e-12)
+
+    def evaluar(self, ejemplos=None, umbral: float = None) -> dict:
+        """
+        Evalúa el clasificador. Sin `ejemplos` hace validación dejando uno fuera sobre el
+        propio banco. La vía rápida se mide con `decidir`, como en producción (cláusulas y
+        salvaguardas); un ejemplo puede traer `bot_anterior` (último mensaje del bot) y, si
+        tiene varias intenciones, `categorias` en vez de `categoria`. Devuelve precisión
+        global, tasa de la vía rápida (mensajes resueltos sin LLM) y precisión dentro de la
+        vía rápida (salen justo las intenciones esperadas).
+        """
+        umbral = obtener_umbral() if umbral is None else umbral
+        if ejemplos is None:
+            ejemplos = [{"texto": t, "categoria": self.categorias[e]} for t, e in zip(self.textos, self.etiquetas.tolist())]
+            excluidos = list(range(len(ejemplos)))
+            puntuaciones = self._puntuaciones_dejando_uno_fuera()
+        else:
+            excluidos = [None] * len(ejemplos)
+            puntuaciones = self._puntuar([e["texto"] for e in ejemplos])
+
+        esperadas = [e.get("categorias") or [e["categoria"]] for e in ejemplos]
+        mejores, _ = self._decidir(puntuaciones)
+        correctas = [self.categorias[m] in esperada for m, esperada in zip(mejores.tolist(), esperadas)]
+        aceptadas = aciertos = 0
+        for ejemplo, esperada, excluir in zip(ejemplos, esperadas, excluidos):
+            decision = self.decidir(ejemplo["texto"], umbral, _es_pregunta(ejemplo.get("bot_anterior")), excluir)
+            if decision is not None:
+                aceptadas += 1
+                aciertos += sorted(decision[0]) == sorted(esperada)
+
+        total = len(ejemplos)
+        return {
+            "total": total,
+            "umbral": umbral,
+            "precision": sum(correctas) / total if total else 0.0,
+            "tasa_via_rapida": aceptadas / total if total else 0.0,
+            "precision_via_rapida": aciertos / aceptadas if aceptadas else 0.0,
+        }
+
+
+_preclasificador = None
+
+
+def obtener_preclasificador() -> Preclasificador:
+    """Carga el banco de ejemplos la primera vez que se necesita."""
+    global _preclasificador
+    if _preclasificador is None:
+        _preclasificador = Preclasificador.desde_fichero()
+    return _preclasificador
+
+
+def _es_pregunta(mensaje_bot) -> bool:
+    return isinstance(mensaje_bot, str) and mensaje_bot.strip().endswith("?")
+
+
+def _ultimo_bot_pregunta(conv_state) -> bool:
+    """True si el último mensaje del bot fue una pregunta: la respuesta del usuario necesita contexto."""
+    for msg in reversed(conv_state.historial):
+        if isinstance(msg, dict) and isinstance(msg.get("bot"), str):
+            return _es_pregunta(msg["bot"])
+    return False
+
+
+def clausulas(texto: str) -> list:
+    """
+    Trozos del mensaje separados por "?" / ";" y por conectores ("y", "and", "además"...).
+    Los trozos de menos de `MIN_PALABRAS` palabras se unen al anterior ("wifi y aire").
+    """
+    trozos = []
+    for frase in _SEPARADOR_PREGUNTAS.split(texto):
+        for trozo in _CONECTORES.split(normalizar_texto(frase)):
+            trozo = trozo.strip()
+            if not trozo:
+                continue
+            if trozos and len(trozo.split()) < MIN_PALABRAS:
+                trozos[-1] = f"{trozos[-1]} {trozo}"
+            else:
+                trozos.append(trozo)
+    return trozos
+
+
+def preclasificar(user_message: str, conv_state):
+    """
+    Intenta resolver la intención sin LLM. Devuelve un resultado con el mismo formato
+    que `analyze_message` o `None` si hay que preguntar a OpenAI.
+    """
+    umbral = obtener_umbral()
+    if umbral > 1:
+        return None  # Vía rápida desactivada: ni siquiera se carga el banco de ejemplos
+    decision = obtener_preclasificador().decidir(user_message, umbral, _ultimo_bot_pregunta(conv_state))
+    if decision is None:
+        return None
+
+    intenciones, confianza = decision
+    return {
+        "idioma": detectar_idioma(user_message, conv_state.idioma if conv_state.idioma in ["es", "en"] else "es"),
+        "intenciones": intenciones,
+        "confidence": round(confianza, 3),
+        "original_text": user_message,
+        "origen": "preclasificador",
+    }
+
+
+# 🔹 **Evaluación offline**: python -m app.preclasificador [--umbral 0.1] [--fichero ejemplos.json]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evalúa el preclasificador local de intenciones.")
+    parser.add_argument("--umbral", type=float, default=None, help="Umbral de confianza (por defecto PRECLASIFICADOR_UMBRAL)")
+    parser.add_argument("--fichero", default=None, help="JSON con ejemplos etiquetados; si no, validación dejando uno fuera")
+    args = parser.parse_args()
+
+    clasificador = obtener_preclasificador()
+    ejemplos = None
+    if args.fichero:
+        with open(args.fichero, encoding="utf-8") as f:
+            ejemplos = json.load(f)
+
+    resultado = clasificador.evaluar(ejemplos, args.umbral)
+    print(f"📌 Ejemplos evaluados: {resultado['total']} (umbral {resultado['umbral']})")
+    print(f"✅ Precisión global: {resultado['precision']:.1%}")
+    print(f"⚡ Tasa de vía rápida (sin LLM): {resultado['tasa_via_rapida']:.1%}")
+    print(f"🎯 Precisión en la vía rápida: {resultado['precision_via_rapida']:.1%}")
@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+from app import llm
+
+###############################################################################
+# Agrupación de ráfagas de mensajes por huésped (debounce)
+###############################################################################
+#
+# Por WhatsApp es normal recibir "hola", "una pregunta" y "¿hay parking?" en dos
+# segundos. Sin agrupar, cada mensaje pasa por toda la cadena de LLM y genera su propia
+# respuesta. Con `RAFAGA_VENTANA_MS` > 0 los mensajes de un mismo `numero_telefono` se
+# acumulan mientras sigan llegando con menos de esa separación; al cerrarse la ráfaga
+# se procesa un único turno con el texto concatenado y todas las peticiones que
+# esperaban reciben la misma respuesta.
+#
+#   - `RAFAGA_VENTANA_MS`: silencio que cierra la ráfaga (0 = desactivado, por defecto).
+#   - `RAFAGA_MAX_MS`: espera máxima desde el primer mensaje, aunque sigan llegando.
+#   - `RAFAGA_MAX_MENSAJES`: al llegar a este número de mensajes se cierra en el acto.
+
+VENTANA_MS = float(os.getenv("RAFAGA_VENTANA_MS", 0))
+MAX_MS = float(os.getenv("RAFAGA_MAX_MS", 5000))
+MAX_MENSAJES = int(os.getenv("RAFAGA_MAX_MENSAJES", 10))
+
+
+class _Rafaga:
+    __slots__ = ("mensajes", "nombre_apartamento", "futuro", "temporizador", "inicio")
+
+    def __init__(self, futuro):
+        self.mensajes = []
+        self.nombre_apartamento = None
+        self.futuro = futuro
+        self.temporizador = None
+        self.inicio = time.monotonic()
+
+
+class AgrupadorRafagas:
+    """
+    `procesar(numero_telefono, texto, nombre_apartamento)` es la corrutina que ejecuta
+    el turno completo (en la app, `procesar_turno`).
+    """
+
+    def __init__(self, procesar, ventana_ms: float = None, max_ms: float = None, max_mensajes: int = None):
+        self.procesar = procesar
+        self.ventana = (VENTANA_MS if ventana_ms is None else ventana_ms) / 1000
+        self.maximo = (MAX_MS if max_ms is None else max_ms) / 1000
+        self.max_mensajes = max_mensajes or MAX_MENSAJES
+        self._rafagas = {}
+        self._tareas = set()
+
+        # Métricas
+        self.mensajes = 0
+        self.rafagas = 0
+        self.mensajes_por_rafaga_max = 0
+
+    @property
+    def activo(self) -> bool:
+        return self.ventana > 0
+
+    async def enviar(self, numero_telefono: str, mensaje: str, nombre_apartamento: str) -> str:
+        """Añade el mensaje a la ráfaga abierta del huésped (o abre una) y espera la respuesta común."""
+        loop = asyncio.get_running_loop()
+        rafaga = self._rafagas.get(numero_telefono)
+        if rafaga is None:
+            rafaga = self._rafagas[numero_telefono] = _Rafaga(loop.create_future())
+        else:
+            rafaga.temporizador.cancel()
+
+        rafaga.mensajes.append(mensaje)
+        rafaga.nombre_apartamento = nombre_apartamento
+        self.mensajes += 1
+
+        if len(rafaga.mensajes) >= self.max_mensajes:
+            espera = 0
+        else:
+            espera = max(min(self.ventana, rafaga.inicio + self.maximo - time.monotonic()), 0)
+        rafaga.temporizador = loop.call_later(espera, self._cerrar, numero_telefono, rafaga)
+
+        # `shield`: si un cliente se desconecta, el turno sigue para el resto de peticiones
+        return await asyncio.shield(rafaga.futuro)
+
+    def _cerrar(self, numero_telefono: str, rafaga: _Rafaga):
+        # Los mensajes que lleguen a partir de ahora abren una ráfaga nueva
+        if self._rafagas.get(numero_telefono) is rafaga:
+            del self._rafagas[numero_telefono]
+        self.rafagas += 1
+        self.mensajes_por_rafaga_max = max(self.mensajes_por_rafaga_max, len(rafaga.mensajes))
+        tarea = asyncio.create_task(self._procesar(numero_telefono, rafaga))
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    async def _procesar(self, numero_telefono: str, rafaga: _Rafaga):
+        # El turno es de todas las peticiones de la ráfaga: no emite por el `/chat/stream` de ninguna
+        llm.emisor_actual.set(None)
+        try:
+            respuesta = await self.procesar(numero_telefono, "\n".join(rafaga.mensajes), rafaga.nombre_apartamento)
+        except Exception as e:
+            rafaga.futuro.set_exception(e)
+        else:
+            rafaga.futuro.set_result(respuesta)
+
+    def estadisticas(self) -> dict:
+        abiertos = sum(len(r.mensajes) for r in self._rafagas.values())
+        cerrados = self.mensajes - abiertos
+        return {
+            "activo": self.activo,
+            "ventana_ms": self.ventana * 1000,
+            "mensajes": self.mensajes,
+            "rafagas": self.rafagas,
+            "turnos_ahorrados": cerrados - self.rafagas,
+            "rafagas_abiertas": len(self._rafagas),
+            "mensajes_por_rafaga_medio": round(cerrados / self.rafagas, 2) if self.rafagas else 0.0,
+            "mensajes_por_rafaga_max": self.mensajes_por_rafaga_max,
+        }
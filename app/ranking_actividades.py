@@ -0,0 +1,105 @@
+from datetime import date
+import numpy as np
+from app import fechas
+from app.catalogo_locales import catalogo_actividades
+from app.ranking_restaurantes import valor_slot
+
+###############################################################################
+# Actividades de ocio para los slots de `handle_actividades_ocio`
+###############################################################################
+#
+# Con `dia`, `tipo_grupo` y `mas_informacion` completos la respuesta sale del catálogo
+# de actividades (`app/datos/actividades.json`) sin volver a llamar al LLM:
+#
+#   1. Obligatorio: abrir algún rato ese día (día de la semana + temporada, mapas de
+#      bits precalculados) y ser apta para el grupo (familia / amigos / pareja).
+#   2. Preferencias que se relajan si no queda nada: tipo de actividad y población
+#      nombrados en `mas_informacion` o en el mensaje.
+#   3. Orden: más etiquetas pedidas ("gratis", "niños", "lluvia"...), más cerca del
+#      apartamento y, a igualdad, por id.
+
+def fecha_del_slot(dia, ahora=None):
+    """`dia` tal como lo dejó el LLM ("sábado", "mañana", "24/10", "2026-10-24") -> `date` o `None`."""
+    dia = valor_slot(dia)
+    if dia is None:
+        return None
+    try:
+        return date.fromisoformat(dia.strip())
+    except ValueError:
+        pass
+    fecha = fechas.interpretar(dia, ahora)["fecha"]
+    return date.fromisoformat(fecha) if fecha else None
+
+
+def criterios_desde_slots(datos_categoria: dict, texto: str = "", ahora=None) -> dict:
+    """Traduce los slots a valores del catálogo: fecha, grupos, tipos, etiquetas y poblaciones."""
+    catalogo = catalogo_actividades
+    libre = f"{datos_categoria.get('mas_informacion') or ''} {texto}"
+    grupo = valor_slot(datos_categoria.get("tipo_grupo"))
+    return {
+        "fecha": fecha_del_slot(datos_categoria.get("dia"), ahora),
+        "grupos": catalogo.valores_en("grupos", grupo) if grupo else [],
+        "tipos": catalogo.valores_en("tipo", libre),
+        "etiquetas": catalogo.etiquetas_en(libre),
+        "poblaciones": catalogo.valores_en("poblacion", libre),
+    }
+
+
+def _primeras(k: int, coincidencias: np.ndarray, distancias: np.ndarray, posiciones: np.ndarray) -> list:
+    """
+    Índices de las `k` mejores por (más etiquetas, menos distancia, posición) sin ordenar
+    todas: por cada nivel de etiquetas solo se ordenan las que no superan la k-ésima distancia.
+    """
+    elegidas = []
+    for nivel in np.unique(coincidencias)[::-1]:
+        faltan = k - len(elegidas)
+        en_nivel = np.flatnonzero(coincidencias == nivel)
+        if len(en_nivel) > faltan:
+            umbral = np.partition(distancias[en_nivel], faltan - 1)[faltan - 1]
+            en_nivel = en_nivel[distancias[en_nivel] <= umbral]
+        en_nivel = en_nivel[np.lexsort((posiciones[en_nivel], distancias[en_nivel]))]
+        elegidas += en_nivel[:faltan].tolist()
+        if len(elegidas) >= k:
+            break
+    return elegidas
+
+
+def buscar_actividades(criterios: dict, origen=None, k: int = 3, excluir_ids=None, catalogo=None) -> list:
+    """
+    Las `k` mejores actividades para los criterios de `criterios_desde_slots`:
+    `[{"actividad", "exacto", "distancia_km"}]`. `exacto` es False si hubo que
+    olvidar el tipo o la población pedidos.
+    """
+    catalogo = catalogo or catalogo_actividades
+    base = catalogo.mascara(excluir_ids, abierto_el=criterios["fecha"], grupos=criterios["grupos"])
+
+    # 🔹 Relajación: tipo y población -> solo tipo -> cualquiera que abra ese día
+    exacto, mascara = True, 0
+    for filtros in ({"tipo": criterios["tipos"], "poblacion": criterios["poblaciones"]}, {"tipo": criterios["tipos"]}, {}):
+        mascara = base & catalogo.mascara(**filtros) if filtros else base
+        if mascara:
+            break
+        exacto = False
+    posiciones = np.flatnonzero(catalogo.vector(mascara))
+    if not len(posiciones):
+        return []
+
+    coincidencias = np.zeros(len(posiciones), dtype=np.int64)
+    for etiqueta in criterios["etiquetas"]:
+        etiqueta = catalogo.canonico(catalogo.campo_etiquetas, etiqueta)
+        coincidencias += catalogo.vector_valor(catalogo.campo_etiquetas, etiqueta)[posiciones]
+    if origen is not None:
+        distancias = catalogo.geo.distancias(origen, posiciones).astype(np.float64)
+        distancias[np.isnan(distancias)] = np.inf
+    else:
+        distancias = np.full(len(posiciones), np.inf)
+
+    orden = _primeras(k, coincidencias, distancias, posiciones)
+    return [
+        {
+            "actividad": catalogo.locales[p],
+            "exacto": exacto,
+            "distancia_km": round(float(distancias[i]), 2) if np.isfinite(distancias[i]) else None,
+        }
+        for i, p in zip(orden, posiciones[orden].tolist())
+    ]
@@ -0,0 +1,240 @@
+import os
+import numpy as np
+from app.catalogo_locales import catalogo_restaurantes
+from app.geo import RADIO_TIERRA_KM
+from app.preclasificador import normalizar_texto
+
+###############################################################################
+# Puntuación y ranking de restaurantes con NumPy
+###############################################################################
+#
+# Con los slots de `handle_recomendaciones` completos se puntúan TODOS los locales del
+# catálogo en una sola pasada vectorizada (un array por atributo, en el orden de bits
+# del catálogo):
+#
+#   - cocina: afinidad entre la pedida y la del local (1 si es la misma; las parecidas,
+#     como italiano/mediterráneo, según `afinidades_cocina` de `restaurantes.json`);
+#   - budget: 1 si coincide, 0.5 a un escalón de distancia, 0 a dos;
+#   - etiquetas: fracción de las etiquetas pedidas que tiene el local;
+#   - poblacion: 1 si está en la población que menciona el huésped;
+#   - distancia: exp(-km / `RANKING_ESCALA_KM`) desde el apartamento (si tiene coordenadas);
+#   - valoracion: nota del local / 5.
+#
+# La puntuación es la suma ponderada (`RANKING_PESOS="distancia=2,valoracion=0.5"` cambia
+# los pesos). No hay filtros duros: si nada coincide exactamente, salen los más
+# parecidos. Los ya sugeridos al huésped se excluyen y el top-k se elige con diversidad
+# (se penaliza repetir cocina o población, `RANKING_DIVERSIDAD`).
+#
+#     python -m benchmarks.ranking_restaurantes --locales 1000 10000 100000
+
+PESOS_POR_DEFECTO = {"cocina": 3.0, "budget": 1.5, "etiquetas": 1.0, "poblacion": 1.0, "distancia": 1.0, "valoracion": 1.0}
+CANDIDATOS_POR_RESULTADO = 8    # el reparto con diversidad se hace entre los k * 8 mejores
+
+
+def _leer_pesos(texto: str) -> dict:
+    """`"distancia=2,valoracion=0.5"` -> pesos por defecto con esos cambios (las entradas mal formadas se ignoran)."""
+    pesos = dict(PESOS_POR_DEFECTO)
+    for parte in (texto or "").split(","):
+        clave, _, valor = parte.partition("=")
+        try:
+            if clave.strip() in pesos:
+                pesos[clave.strip()] = float(valor)
+        except ValueError:
+            continue
+    return pesos
+
+
+PESOS = _leer_pesos(os.getenv("RANKING_PESOS", ""))
+ESCALA_KM = float(os.getenv("RANKING_ESCALA_KM", 3.0))
+DIVERSIDAD = float(os.getenv("RANKING_DIVERSIDAD", 0.3))
+
+
+class MatrizRanking:
+    """Atributos de los locales de un catálogo como arrays de NumPy (una fila por local)."""
+
+    def __init__(self, catalogo, pesos: dict = None, escala_km: float = None, diversidad: float = None):
+        self.catalogo = catalogo
+        locales = catalogo.locales
+        self.version = catalogo.cargado_en
+        self.pesos = pesos or PESOS
+        self.escala_km = escala_km or ESCALA_KM
+        self.diversidad = DIVERSIDAD if diversidad is None else diversidad
+        n = len(locales)
+
+        # 🔹 Cocina: código por local y matriz de afinidad entre cocinas
+        self.cocinas = catalogo.valores("tipo_cocina")
+        indice_cocina = {cocina: i for i, cocina in enumerate(self.cocinas)}
+        self.codigo_cocina = np.full(n, -1, dtype=np.int32)
+        for i, cocina in enumerate(self.cocinas):
+            self.codigo_cocina[catalogo.vector_valor("tipo_cocina", cocina)] = i
+        self.afinidad = np.eye(len(self.cocinas) + 1, dtype=np.float32)
+        self.afinidad[-1, -1] = 0.0     # fila/columna extra para locales sin cocina
+        for cocina, parecidas in (catalogo.extras.get("afinidades_cocina") or {}).items():
+            a = indice_cocina.get(normalizar_texto(cocina))
+            for otra, valor in parecidas.items():
+                b = indice_cocina.get(normalizar_texto(otra))
+                if a is not None and b is not None:
+                    self.afinidad[a, b] = self.afinidad[b, a] = valor
+
+        # 🔹 Presupuesto como escalón (barato=0, medio=1, caro=2); -1 si no se sabe
+        self.orden_budget = [normalizar_texto(b) for b in catalogo.extras.get("orden_budget", ["barato", "medio", "caro"])]
+        self.escalon_budget = np.full(n, -1, dtype=np.int8)
+        for escalon, budget in enumerate(self.orden_budget):
+            self.escalon_budget[catalogo.vector_valor("budget", budget)] = escalon
+        self.max_escalon = max(len(self.orden_budget) - 1, 1)
+
+        # 🔹 Etiquetas y población: una columna booleana por valor
+        self.etiquetas = {e: catalogo.vector_valor(catalogo.campo_etiquetas, e) for e in catalogo.valores(catalogo.campo_etiquetas)}
+        self.poblaciones = catalogo.valores("poblacion")
+        self.codigo_poblacion = np.full(n, -1, dtype=np.int32)
+        for i, poblacion in enumerate(self.poblaciones):
+            self.codigo_poblacion[catalogo.vector_valor("poblacion", poblacion)] = i
+
+        # 🔹 Valoración y coordenadas (NaN si faltan)
+        self.valoracion = np.array([l.get("valoracion") or 0.0 for l in locales], dtype=np.float32) / 5
+        self.latitud = np.array([l.get("latitud") if l.get("latitud") is not None else np.nan for l in locales], dtype=np.float64)
+        self.longitud = np.array([l.get("longitud") if l.get("longitud") is not None else np.nan for l in locales], dtype=np.float64)
+        self._latitud_rad = np.radians(self.latitud).astype(np.float32)
+        self._longitud_rad = np.radians(self.longitud).astype(np.float32)
+
+    def distancias_aproximadas(self, origen) -> np.ndarray:
+        """
+        Km desde `origen` con la proyección equirectangular: a la escala de unas pocas
+        poblaciones el error frente a haversine es despreciable y es varias veces más rápida.
+        """
+        lat0, lon0 = np.float32(np.radians(origen[0])), np.float32(np.radians(origen[1]))
+        dlat = self._latitud_rad - lat0
+        dlon = (self._longitud_rad - lon0) * np.float32(np.cos(lat0))
+        return np.float32(RADIO_TIERRA_KM) * np.sqrt(dlat * dlat + dlon * dlon)
+
+    def __len__(self):
+        return len(self.codigo_cocina)
+
+    def puntuar(self, tipo_cocina=None, budget=None, etiquetas=None, poblaciones=None, origen=None):
+        """
+        Puntuación de cada local para unas preferencias. Devuelve `(puntuaciones, exactos, distancias)`:
+        `exactos` marca los locales que cumplen todo lo pedido y `distancias` son km (o `None` sin origen).
+        """
+        n = len(self)
+        puntuaciones = np.zeros(n, dtype=np.float32)
+        exactos = np.ones(n, dtype=bool)
+
+        if tipo_cocina:
+            codigo = self.cocinas.index(tipo_cocina) if tipo_cocina in self.cocinas else len(self.cocinas)
+            afinidad = self.afinidad[codigo][self.codigo_cocina]
+            puntuaciones += self.pesos["cocina"] * afinidad
+            exactos &= afinidad >= 1.0
+
+        if budget in self.orden_budget:
+            pedido = self.orden_budget.index(budget)
+            distancia = np.abs(self.escalon_budget - pedido) / self.max_escalon
+            cercania = np.where(self.escalon_budget >= 0, 1.0 - distancia, 0.5).astype(np.float32)
+            puntuaciones += self.pesos["budget"] * cercania
+            exactos &= self.escalon_budget == pedido
+
+        columnas = [self.etiquetas[e] for e in etiquetas or () if e in self.etiquetas]
+        if etiquetas:
+            tiene = np.sum(columnas, axis=0) if columnas else np.zeros(n)
+            puntuaciones += self.pesos["etiquetas"] * (tiene / len(etiquetas)).astype(np.float32)
+            exactos &= tiene == len(etiquetas)
+
+        if poblaciones:
+            codigos = [self.poblaciones.index(p) for p in poblaciones if p in self.poblaciones]
+            en_poblacion = np.isin(self.codigo_poblacion, codigos)
+            puntuaciones += self.pesos["poblacion"] * en_poblacion
+            exactos &= en_poblacion
+
+        distancias = None
+        if origen is not None:
+            distancias = self.distancias_aproximadas(origen)
+            cercania = np.exp(distancias * np.float32(-1 / self.escala_km))
+            puntuaciones += self.pesos["distancia"] * np.nan_to_num(cercania, nan=0.0)
+
+        puntuaciones += self.pesos["valoracion"] * self.valoracion
+        return puntuaciones, exactos, distancias
+
+    def elegir(self, puntuaciones: np.ndarray, k: int, excluir_posiciones=None) -> list:
+        """
+        Posiciones de los `k` mejores con diversidad: entre los k * 8 mejores se eligen de
+        uno en uno, restando `diversidad` por cada elegido con la misma cocina o población.
+        """
+        excluir = sorted(set(excluir_posiciones or ()))
+        if excluir:
+            puntuaciones = puntuaciones.copy()
+            puntuaciones[excluir] = -np.inf
+        disponibles = len(puntuaciones) - len(excluir)
+        k = min(k, disponibles)
+        if k <= 0:
+            return []
+
+        m = min(k * CANDIDATOS_POR_RESULTADO, disponibles)
+        candidatos = np.argpartition(-puntuaciones, m - 1)[:m]
+        base = puntuaciones[candidatos].astype(np.float64)
+        cocinas = self.codigo_cocina[candidatos]
+        poblaciones = self.codigo_poblacion[candidatos]
+        penalizacion = np.zeros(m)
+        elegidos = []
+        for _ in range(k):
+            j = int(np.argmax(base - penalizacion))
+            elegidos.append(int(candidatos[j]))
+            penalizacion += self.diversidad * ((cocinas == cocinas[j]) + (poblaciones == poblaciones[j]))
+            base[j] = -np.inf
+        return elegidos
+
+    def rankear(self, k: int = 3, excluir_ids=None, **preferencias) -> list:
+        """
+        Los `k` locales recomendados: `[{"local", "puntuacion", "exacto", "distancia_km"}]`.
+        Las preferencias son las de `puntuar` (valores ya canónicos, ver `preferencias_desde_slots`).
+        """
+        puntuaciones, exactos, distancias = self.puntuar(**preferencias)
+        excluir = [p for p in (self.catalogo.posicion(i) for i in excluir_ids or ()) if p is not None]
+        locales = self.catalogo.locales
+        return [
+            {
+                "local": locales[p],
+                "puntuacion": round(float(puntuaciones[p]), 3),
+                "exacto": bool(exactos[p]),
+                "distancia_km": round(float(distancias[p]), 2) if distancias is not None and not np.isnan(distancias[p]) else None,
+            }
+            for p in self.elegir(puntuaciones, k, excluir)
+        ]
+
+
+# 🔹 Respuestas de los slots que no restringen la búsqueda
+SIN_PREFERENCIA = {"no definido", "cualquiera", "me da igual", "da igual", "indiferente", "todos", "any", "anything", "whatever", "no preference"}
+
+
+def valor_slot(valor):
+    """Valor del slot, o `None` si el huésped no tiene preferencia."""
+    if not isinstance(valor, str) or normalizar_texto(valor) in SIN_PREFERENCIA:
+        return None
+    return valor
+
+
+def preferencias_desde_slots(datos_categoria: dict, texto: str = "", origen=None) -> dict:
+    """
+    Traduce los slots de `handle_recomendaciones` a valores del catálogo: cocina y
+    presupuesto por sinónimos; población y etiquetas buscadas en `mas_informacion`
+    y en el último mensaje.
+    """
+    catalogo = catalogo_restaurantes
+    libre = f"{datos_categoria.get('mas_informacion') or ''} {texto}"
+    cocina, budget = valor_slot(datos_categoria.get("tipo_cocina")), valor_slot(datos_categoria.get("budget"))
+    return {
+        "tipo_cocina": catalogo.canonico("tipo_cocina", cocina) if cocina else None,
+        "budget": catalogo.canonico("budget", budget) if budget else None,
+        "etiquetas": catalogo.etiquetas_en(libre),
+        "poblaciones": catalogo.valores_en("poblacion", libre),
+        "origen": origen,
+    }
+
+
+_matriz = None
+
+
+def obtener_ranking() -> MatrizRanking:
+    """Matriz del catálogo de restaurantes; se reconstruye si el catálogo se ha recargado."""
+    global _matriz
+    if _matriz is None or _matriz.version != catalogo_restaurantes.cargado_en or len(_matriz) != len(catalogo_restaurantes):
+        _matriz = MatrizRanking(catalogo_restaurantes)
+    return _matriz
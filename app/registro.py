@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+
+###############################################################################
+# Registro estructurado, muestreado y asíncrono
+###############################################################################
+#
+# Antes cada turno hacía `print` del prompt completo, de la respuesta de OpenAI y del
+# estado serializado con `indent=4`: decenas de KB de stdout síncrono por mensaje. Ahora
+# todos los módulos registran eventos con `registro.obtener(__name__)`:
+#
+#   - Cada evento tiene un nivel, una categoría ("llm", "cache", "estado", "prompt"...) y
+#     campos estructurados que se serializan como JSON (o texto con `LOG_FORMATO=texto`).
+#   - `LOG_NIVEL` (INFO por defecto) filtra por nivel y `LOG_MUESTREO` muestrea por
+#     categoría, p. ej. `LOG_MUESTREO="llm=0.1,clasificacion=0.05"`. Los avisos y los
+#     errores nunca se descartan.
+#   - El hilo de la petición solo mete el registro en una cola acotada; el formateo y la
+#     escritura los hace un hilo en segundo plano (`QueueListener`). Si la cola se llena,
+#     el registro se descarta y se cuenta: el log nunca bloquea una petición.
+#   - Los prompts completos solo se registran con `LOG_PROMPTS=1`.
+
+NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+FORMATO = os.getenv("LOG_FORMATO", "json").lower()
+REGISTRAR_PROMPTS = os.getenv("LOG_PROMPTS", "0").lower() in ("1", "true", "si", "sí")
+TAMANO_COLA = int(os.getenv("LOG_TAMANO_COLA", 10000))
+
+
+def _leer_muestreo(texto: str) -> dict:
+    """`"llm=0.1,cache=0.5"` -> `{"llm": 0.1, "cache": 0.5}` (las entradas mal formadas se ignoran)."""
+    tasas = {}
+    for parte in (texto or "").split(","):
+        categoria, _, tasa = parte.partition("=")
+        try:
+            tasas[categoria.strip()] = min(max(float(tasa), 0.0), 1.0)
+        except ValueError:
+            continue
+    return tasas
+
+
+MUESTREO = _leer_muestreo(os.getenv("LOG_MUESTREO", ""))
+
+
+class _FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro; se ejecuta en el hilo del listener, no en la petición."""
+
+    def format(self, record):
+        evento = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "categoria": getattr(record, "categoria", "general"),
+            "mensaje": record.getMessage(),
+        }
+        evento.update(getattr(record, "campos", None) or {})
+        if record.exc_info:
+            evento["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class _FormatoTexto(logging.Formatter):
+    """Formato legible para desarrollo local: `INFO app.llm [llm] mensaje clave=valor ...`."""
+
+    def format(self, record):
+        campos = getattr(record, "campos", None) or {}
+        extra = " ".join(f"{clave}={json.dumps(valor, ensure_ascii=False, default=str)}" for clave, valor in campos.items())
+        linea = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname} {record.name} " \
+                f"[{getattr(record, 'categoria', 'general')}] {record.getMessage()}"
+        if extra:
+            linea = f"{linea} {extra}"
+        if record.exc_info:
+            linea = f"{linea}\n{self.formatException(record.exc_info)}"
+        return linea
+
+
+class _ManejadorCola(logging.handlers.QueueHandler):
+    """
+    `QueueHandler` que no formatea en el hilo que registra (el `prepare` estándar sí lo
+    hace) y que descarta en vez de esperar cuando la cola está llena.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _contadores["descartados_cola"] += 1
+
+
+_contadores = {"emitidos": 0, "descartados_muestreo": 0, "descartados_cola": 0}
+_listener = None
+_lock = threading.Lock()
+
+
+def configurar():
+    """Instala la cola y el hilo escritor en el logger `app`. Idempotente; se llama en el primer uso."""
+    global _listener
+    if _listener is not None:
+        return
+    with _lock:
+        if _listener is not None:
+            return
+        cola = queue.Queue(maxsize=TAMANO_COLA)
+        salida = logging.StreamHandler(sys.stdout)
+        salida.setFormatter(_FormatoTexto() if FORMATO == "texto" else _FormatoJSON())
+
+        raiz = logging.getLogger("app")
+        raiz.setLevel(NIVEL)
+        raiz.addHandler(_ManejadorCola(cola))
+        raiz.propagate = False
+
+        _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=False)
+        _listener.start()
+        atexit.register(detener)
+
+
+def detener():
+    """Vacía la cola y para el hilo escritor (al apagar la app o al salir del proceso)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            for handler in list(logging.getLogger("app").handlers):
+                if isinstance(handler, _ManejadorCola):
+                    logging.getLogger("app").removeHandler(handler)
+
+
+def estadisticas() -> dict:
+    return {
+        **_contadores,
+        "nivel": NIVEL,
+        "formato": FORMATO,
+        "muestreo": MUESTREO,
+        "prompts": REGISTRAR_PROMPTS,
+    }
+
+
+class Registro:
+    """
+    Logger de un módulo. Los campos se pasan como argumentos con nombre y no se
+    serializan hasta que el hilo escritor los formatea:
+
+        log = registro.obtener(__name__)
+        log.info("Respuesta servida desde la caché", categoria="cache", apartamento=nombre)
+    """
+
+    def __init__(self, nombre: str):
+        if not nombre.startswith("app"):
+            nombre = f"app.{nombre}"
+        self._logger = logging.getLogger(nombre)
+
+    def activo(self, nivel: int, categoria: str = "general") -> bool:
+        """Si un evento de este nivel y categoría se va a registrar (para no construir campos caros en balde)."""
+        configurar()
+        if not self._logger.isEnabledFor(nivel):
+            return False
+        tasa = MUESTREO.get(categoria, 1.0)
+        if nivel < logging.WARNING and tasa < 1.0 and random.random() >= tasa:
+            _contadores["descartados_muestreo"] += 1
+            return False
+        return True
+
+    def _emitir(self, nivel, mensaje, categoria, campos, exc_info=None):
+        if not self.activo(nivel, categoria):
+            return
+        _contadores["emitidos"] += 1
+        self._logger.log(nivel, mensaje, exc_info=exc_info,
+                         extra={"categoria": categoria, "campos": campos})
+
+    def debug(self, mensaje, categoria="general", **campos):
+        self._emitir(logging.DEBUG, mensaje, categoria, campos)
+
+    def info(self, mensaje, categoria="general", **campos):
+        self._emitir(logging.INFO, mensaje, categoria, campos)
+
+    def warning(self, mensaje, categoria="general", **campos):
+        self._emitir(logging.WARNING, mensaje, categoria, campos)
+
+    def error(self, mensaje, categoria="general", exc_info=None, **campos):
+        self._emitir(logging.ERROR, mensaje, categoria, campos, exc_info=exc_info)
+
+    def prompt(self, etapa: str, mensajes: list):
+        """Prompt completo enviado al modelo; solo con `LOG_PROMPTS=1` (puede ocupar varios KB)."""
+        if REGISTRAR_PROMPTS:
+            self._emitir(logging.INFO, "Prompt enviado a OpenAI", "prompt", {"etapa": etapa, "mensajes": mensajes})
+
+
+def obtener(nombre: str) -> Registro:
+    return Registro(nombre)
@@ -0,0 +1,189 @@
+import os
+import time
+from contextvars import ContextVar
+
+###############################################################################
+# Spans de latencia por etapa y métricas Prometheus
+###############################################################################
+#
+# Cada etapa de un turno (NLU, despacho, manejador, llamada al LLM, lectura/escritura
+# del estado...) se mide con `trazas.span(nombre, **etiquetas)`:
+#
+#     with trazas.span("llm", etapa=etapa):
+#         ...
+#
+#   - Las etiquetas se heredan: un span abierto dentro de otro lleva también las del
+#     padre (intención, subcategoría, apartamento). `trazas.etiquetar(...)` añade
+#     etiquetas al span en curso cuando se conocen a mitad de camino (p. ej. la
+#     subcategoría que elige un `categorizar_*`).
+#   - Todas las duraciones se agregan en histogramas que `/metrics` expone en el formato
+#     de texto de Prometheus.
+#   - Si la petición abrió una traza (`with trazas.traza()`), los spans se apuntan en
+#     ella y se pueden devolver en la cabecera `Server-Timing` (`METRICAS_CABECERA_TIEMPOS=1`).
+
+CABECERA_TIEMPOS = os.getenv("METRICAS_CABECERA_TIEMPOS", "0").lower() in ("1", "true", "si", "sí")
+
+# 🔹 Límites de los buckets del histograma (segundos)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 🔹 Etiquetas de los histogramas, en este orden (las que falten van vacías)
+ETIQUETAS = ("etapa", "intencion", "subcategoria", "apartamento")
+
+# 🔹 `nombre_apartamento` llega del cliente: a partir de este número de valores distintos
+# se agrupan en "otros" para no disparar el número de series
+MAX_APARTAMENTOS = int(os.getenv("METRICAS_MAX_APARTAMENTOS", 200))
+
+_span_actual = ContextVar("span_actual", default=None)
+_traza_actual = ContextVar("traza_actual", default=None)
+
+
+class Histogramas:
+    """Histogramas acumulados por (nombre del span, etiquetas). Todo corre en el event loop."""
+
+    def __init__(self):
+        self.series = {}      # (nombre, etiquetas) -> [contadores por bucket, suma, total]
+        self.errores = {}     # (nombre, etiquetas) -> spans que terminaron con excepción
+        self._apartamentos = set()
+
+    def _clave(self, nombre: str, etiquetas: dict) -> tuple:
+        apartamento = etiquetas.get("apartamento") or ""
+        if apartamento and apartamento not in self._apartamentos:
+            if len(self._apartamentos) >= MAX_APARTAMENTOS:
+                apartamento = "otros"
+            else:
+                self._apartamentos.add(apartamento)
+        valores = tuple(
+            apartamento if clave == "apartamento" else str(etiquetas.get(clave) or "")
+            for clave in ETIQUETAS
+        )
+        return nombre, valores
+
+    def observar(self, nombre: str, etiquetas: dict, segundos: float, error: bool = False):
+        clave = self._clave(nombre, etiquetas)
+        serie = self.series.get(clave)
+        if serie is None:
+            serie = self.series[clave] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                serie[0][i] += 1
+                break
+        serie[1] += segundos
+        serie[2] += 1
+        if error:
+            self.errores[clave] = self.errores.get(clave, 0) + 1
+
+    def exportar(self) -> str:
+        """Texto en formato de exposición de Prometheus (versión 0.0.4)."""
+        lineas = [
+            "# HELP chatbot_span_segundos Duración de cada etapa de una petición.",
+            "# TYPE chatbot_span_segundos histogram",
+        ]
+        for (nombre, valores), (buckets, suma, total) in sorted(self.series.items()):
+            base = _etiquetas_prometheus(nombre, valores)
+            acumulado = 0
+            for limite, cuenta in zip(BUCKETS, buckets):
+                acumulado += cuenta
+                lineas.append(f'chatbot_span_segundos_bucket{{{base},le="{limite}"}} {acumulado}')
+            lineas.append(f'chatbot_span_segundos_bucket{{{base},le="+Inf"}} {total}')
+            lineas.append(f"chatbot_span_segundos_sum{{{base}}} {suma:.6f}")
+            lineas.append(f"chatbot_span_segundos_count{{{base}}} {total}")
+
+        lineas.append("# HELP chatbot_span_errores_total Etapas que terminaron con una excepción.")
+        lineas.append("# TYPE chatbot_span_errores_total counter")
+        for (nombre, valores), cuenta in sorted(self.errores.items()):
+            lineas.append(f"chatbot_span_errores_total{{{_etiquetas_prometheus(nombre, valores)}}} {cuenta}")
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas_prometheus(nombre: str, valores: tuple) -> str:
+    pares = [f'span="{_escapar(nombre)}"']
+    pares += [f'{clave}="{_escapar(valor)}"' for clave, valor in zip(ETIQUETAS, valores)]
+    return ",".join(pares)
+
+
+# 🔹 Instancia compartida por todo el proceso
+histogramas = Histogramas()
+
+
+class Traza:
+    """Spans de una petición, en el orden en que terminaron."""
+
+    def __init__(self):
+        self.spans = []       # [(nombre, etiquetas, segundos)]
+
+    def desglose(self) -> list:
+        return [{"span": nombre, **etiquetas, "ms": round(segundos * 1000, 1)} for nombre, etiquetas, segundos in self.spans]
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera `Server-Timing`: `nlu;dur=12.3, llm;desc="clasificacion";dur=840.1, ...`."""
+        partes = []
+        for nombre, etiquetas, segundos in self.spans:
+            desc = etiquetas.get("etapa") or etiquetas.get("subcategoria") or etiquetas.get("intencion")
+            nombre_cabecera = nombre.replace(".", "-")
+            if desc:
+                partes.append(f'{nombre_cabecera};desc="{_escapar(str(desc))}";dur={segundos * 1000:.1f}')
+            else:
+                partes.append(f"{nombre_cabecera};dur={segundos * 1000:.1f}")
+        return ", ".join(partes)
+
+
+class _ContextoTraza:
+    def __init__(self, traza_existente=None):
+        self.traza = traza_existente if traza_existente is not None else Traza()
+
+    def __enter__(self) -> Traza:
+        self._token = _traza_actual.set(self.traza)
+        return self.traza
+
+    def __exit__(self, *exc):
+        _traza_actual.reset(self._token)
+        return False
+
+
+def traza(traza_existente: Traza = None) -> _ContextoTraza:
+    """
+    Abre la traza de una petición: los spans que terminen dentro se apuntan en ella
+    (en `traza_existente` si se pasa, p. ej. para leerla desde fuera de una tarea).
+    """
+    return _ContextoTraza(traza_existente)
+
+
+class Span:
+    def __init__(self, nombre: str, etiquetas: dict):
+        self.nombre = nombre
+        padre = _span_actual.get()
+        self.etiquetas = {**(padre.etiquetas if padre is not None else {}), **etiquetas}
+
+    def __enter__(self):
+        self._token = _span_actual.set(self)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        segundos = time.perf_counter() - self._inicio
+        _span_actual.reset(self._token)
+        histogramas.observar(self.nombre, self.etiquetas, segundos, error=tipo is not None)
+        traza_en_curso = _traza_actual.get()
+        if traza_en_curso is not None:
+            traza_en_curso.spans.append((self.nombre, dict(self.etiquetas), segundos))
+        return False
+
+
+def span(nombre: str, **etiquetas) -> Span:
+    """Mide el bloque `with` y lo registra con las etiquetas propias y las heredadas."""
+    return Span(nombre, {clave: valor for clave, valor in etiquetas.items() if valor is not None})
+
+
+def etiquetar(**etiquetas):
+    """Añade etiquetas al span en curso (y, por herencia, a los que se abran después dentro de él)."""
+    actual = _span_actual.get()
+    if actual is not None:
+        actual.etiquetas.update({clave: valor for clave, valor in etiquetas.items() if valor is not None})
+
+
+def exportar_prometheus() -> str:
+    return histogramas.exportar()
@@ -0,0 +1,139 @@
+import json
+import time
+import random
+import argparse
+from datetime import date, timedelta
+from app.catalogo_locales import CatalogoLocales, RUTA_ACTIVIDADES
+from app.horarios import dias_de, meses_de
+from app.ranking_actividades import buscar_actividades
+from benchmarks.carga import percentil
+from benchmarks.geo import generar_locales as generar_con_horarios
+
+###############################################################################
+# Latencia de las propuestas de actividades con los slots completos
+###############################################################################
+#
+# Genera catálogos de actividades sintéticos (vocabulario de `app/datos/actividades.json`,
+# con grupos, temporadas, horarios y coordenadas) y mide `buscar_actividades` con
+# criterios aleatorios (día, grupo, tipo, población, etiquetas) frente a un recorrido
+# lineal de la lista con las mismas reglas, comprobando que devuelven lo mismo.
+#
+#     python -m benchmarks.actividades --actividades 1000 10000 100000
+
+TEMPORADAS = [None, None, "jun-sep", "abr-oct", "may-sep", "nov-mar"]
+
+
+def generar_actividades(n: int, vocabulario: dict, semilla: int = 0) -> list:
+    aleatorio = random.Random(semilla)
+    actividades, pueblos = generar_con_horarios(n, semilla)
+    for actividad in actividades:
+        actividad["tipo"] = aleatorio.choice(vocabulario["tipo"])
+        actividad["poblacion"] = aleatorio.choice(vocabulario["poblacion"])
+        actividad["etiquetas"] = aleatorio.sample(vocabulario["etiquetas"], aleatorio.randint(0, 3))
+        actividad["grupos"] = aleatorio.sample(vocabulario["grupos"], aleatorio.randint(1, 3))
+        temporada = aleatorio.choice(TEMPORADAS)
+        if temporada:
+            actividad["temporada"] = temporada
+    return actividades, pueblos
+
+
+def generar_criterios(n: int, vocabulario: dict, pueblos: list, n_actividades: int, semilla: int = 1) -> list:
+    aleatorio = random.Random(semilla)
+    consultas = []
+    for _ in range(n):
+        latitud, longitud = aleatorio.choice(pueblos)
+        consultas.append({
+            "criterios": {
+                "fecha": date(2026, 1, 1) + timedelta(days=aleatorio.randint(0, 364)) if aleatorio.random() < 0.9 else None,
+                "grupos": [aleatorio.choice(vocabulario["grupos"])],
+                "tipos": [aleatorio.choice(vocabulario["tipo"])] if aleatorio.random() < 0.6 else [],
+                "etiquetas": aleatorio.sample(vocabulario["etiquetas"], aleatorio.randint(0, 2)),
+                "poblaciones": [aleatorio.choice(vocabulario["poblacion"])] if aleatorio.random() < 0.2 else [],
+            },
+            "origen": (latitud, longitud),
+            "excluir_ids": [aleatorio.randint(1, n_actividades) for _ in range(aleatorio.randint(0, 6))],
+        })
+    return consultas
+
+
+def _abre_el(actividad: dict, fecha: date) -> bool:
+    if actividad.get("temporada") and fecha.month - 1 not in meses_de(actividad["temporada"]):
+        return False
+    horario = actividad.get("horario")
+    return not horario or any(fecha.weekday() in dias_de(clave) and tramos for clave, tramos in horario.items())
+
+
+def recorrido_lineal(catalogo: CatalogoLocales, criterios: dict, origen, k: int, excluir_ids) -> list:
+    """Referencia sin índices: las mismas reglas que `buscar_actividades`, actividad a actividad."""
+    excluidos = set(excluir_ids)
+    base = [
+        (i, a) for i, a in enumerate(catalogo.locales)
+        if a["id"] not in excluidos
+        and (criterios["fecha"] is None or _abre_el(a, criterios["fecha"]))
+        and (not criterios["grupos"] or set(criterios["grupos"]) & set(a["grupos"]))
+    ]
+    tipos, poblaciones = set(criterios["tipos"]), set(criterios["poblaciones"])
+    candidatas = []
+    for exigir_poblacion in (True, False):
+        candidatas = [
+            (i, a) for i, a in base
+            if (not tipos or a["tipo"] in tipos) and (not exigir_poblacion or not poblaciones or a["poblacion"] in poblaciones)
+        ]
+        if candidatas:
+            break
+    candidatas = candidatas or base
+    distancias = catalogo.geo.distancias(origen, [i for i, _ in candidatas]).tolist()
+    ordenadas = sorted(
+        zip(candidatas, distancias),
+        key=lambda c: (-sum(e in c[0][1]["etiquetas"] for e in criterios["etiquetas"]), c[1], c[0][0]),
+    )
+    return [a["id"] for (_, a), _ in ordenadas[:k]]
+
+
+def medir(funcion, consultas: list) -> dict:
+    tiempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        funcion(consulta)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {q: round(percentil(tiempos, q) * 1e6, 1) for q in (50, 95, 99)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide las propuestas de actividades con los slots completos.")
+    parser.add_argument("--actividades", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(RUTA_ACTIVIDADES, encoding="utf-8") as f:
+        datos = json.load(f)
+    vocabulario = {
+        campo: sorted({v for a in datos["locales"] for v in (a[campo] if isinstance(a[campo], list) else [a[campo]])})
+        for campo in ("tipo", "poblacion", "etiquetas", "grupos")
+    }
+
+    for n in args.actividades:
+        actividades, pueblos = generar_actividades(n, vocabulario)
+        catalogo = CatalogoLocales(f"sintetico-{n}", campos=("tipo", "poblacion", "grupos"))
+        inicio = time.perf_counter()
+        catalogo.indexar(actividades, datos.get("sinonimos"))
+        segundos_indexar = time.perf_counter() - inicio
+        consultas = generar_criterios(args.consultas, vocabulario, pueblos, n)
+
+        def indices(c):
+            return buscar_actividades(c["criterios"], c["origen"], args.k, c["excluir_ids"], catalogo)
+
+        def lineal(c):
+            return recorrido_lineal(catalogo, c["criterios"], c["origen"], args.k, c["excluir_ids"])
+
+        for consulta in consultas[:100]:
+            if [p["actividad"]["id"] for p in indices(consulta)] != lineal(consulta):
+                raise SystemExit(f"❌ Resultado distinto del recorrido lineal para {consulta}")
+
+        rapido = medir(indices, consultas)
+        lento = medir(lineal, consultas[:100])
+        print(f"📌 {n} actividades (índices en {segundos_indexar * 1000:.0f} ms), {len(consultas)} consultas, k={args.k}")
+        print(f"⚡ Índices: p50={rapido[50]}µs p95={rapido[95]}µs p99={rapido[99]}µs")
+        print(f"🐢 Recorrido lineal: p50={lento[50]}µs p95={lento[95]}µs p99={lento[99]}µs (x{lento[50] / max(rapido[50], 1e-9):.0f})")
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+import httpx
+
+###############################################################################
+# Prueba de carga de extremo a extremo
+###############################################################################
+#
+# Arranca los servidores falsos de OpenAI y Supabase (`benchmarks/servidores_falsos.py`) y
+# la app real con uvicorn apuntando a ellos. Después lanza muchos huéspedes simulados a
+# la vez contra `/chat` y mide:
+#
+#   - rendimiento (turnos por segundo) y latencia p50/p95/p99 de `/chat`;
+#   - llamadas a OpenAI y a Supabase por turno (en total, por prompt y por operación);
+#   - las `/estadisticas` de la app al terminar.
+#
+# El resultado se escribe en un JSON (por defecto en `benchmarks/resultados/`) para poder
+# comparar ejecuciones; las variables `--env CLAVE=VALOR` se pasan a la app:
+#
+#     python -m benchmarks.carga --huespedes 50 --turnos 5
+#     python -m benchmarks.carga --env BUFFER_ESCRITURA=1 --salida buffer.json
+#     python -m benchmarks.carga --comparar sin_buffer.json buffer.json
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil `p` (0-100) con interpolación lineal; `valores` ya ordenados."""
+    if not valores:
+        return 0.0
+    posicion = (len(valores) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicion - inferior)
+
+
+async def _esperar_servidor(url: str, timeout: float = 30):
+    limite = time.monotonic() + timeout
+    async with httpx.AsyncClient() as cliente:
+        while time.monotonic() < limite:
+            try:
+                await cliente.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"❌ El servidor {url} no ha arrancado en {timeout}s")
+
+
+class Entorno:
+    """Procesos de los servidores falsos y de la app, con sus URLs."""
+
+    def __init__(self, escenario: str, env_app: dict):
+        self.escenario = escenario
+        self.env_app = env_app
+        self.puertos = {"openai": _puerto_libre(), "supabase": _puerto_libre(), "app": _puerto_libre()}
+        self.url_openai = f"http://127.0.0.1:{self.puertos['openai']}"
+        self.url_supabase = f"http://127.0.0.1:{self.puertos['supabase']}"
+        self.url_app = f"http://127.0.0.1:{self.puertos['app']}"
+        self.procesos = []
+
+    async def __aenter__(self):
+        self.procesos.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.servidores_falsos", "--escenario", self.escenario,
+             "--puerto-openai", str(self.puertos["openai"]), "--puerto-supabase", str(self.puertos["supabase"])],
+            cwd=RAIZ,
+        ))
+        await _esperar_servidor(f"{self.url_openai}/__estadisticas")
+        await _esperar_servidor(f"{self.url_supabase}/__estadisticas")
+
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{self.url_openai}/v1",
+            "OPENAI_API_KEY": "sk-falsa",
+            "SUPABASE_URL": self.url_supabase,
+            "SUPABASE_KEY": "falsa.falsa.falsa",
+            "LOG_NIVEL": "WARNING",
+            **self.env_app,
+        }
+        self.procesos.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.puertos["app"]), "--log-level", "warning", "--no-access-log"],
+            cwd=RAIZ, env=env,
+        ))
+        await _esperar_servidor(f"{self.url_app}/estadisticas")
+        return self
+
+    async def __aexit__(self, *exc):
+        for proceso in reversed(self.procesos):
+            proceso.terminate()
+            try:
+                proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        return False
+
+
+async def _huesped(cliente, url_app, numero, mensajes, apartamento, turnos, rng, latencias, errores):
+    """Un huésped: `turnos` mensajes seguidos, cada uno cuando llega la respuesta del anterior."""
+    for _ in range(turnos):
+        mensaje = rng.choice(mensajes)
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.post(f"{url_app}/chat", json={
+                "numero_telefono": numero, "message": mensaje["texto"], "nombre_apartamento": apartamento,
+            })
+            respuesta.raise_for_status()
+            latencias.append(time.perf_counter() - inicio)
+        except httpx.HTTPError as e:
+            errores.append(f"{type(e).__name__}: {e}")
+
+
+async def ejecutar(escenario_ruta: str, huespedes: int, turnos: int, calentamiento: int, env_app: dict, semilla: int) -> dict:
+    with open(escenario_ruta, encoding="utf-8") as f:
+        escenario = json.load(f)
+    mensajes = escenario["mensajes"]
+    apartamentos = [a["nombre"] for a in escenario["apartamentos"]]
+    rng = random.Random(semilla)
+
+    async with Entorno(escenario_ruta, env_app) as entorno:
+        limites = httpx.Limits(max_connections=huespedes + 10, max_keepalive_connections=huespedes + 10)
+        async with httpx.AsyncClient(limits=limites, timeout=120) as cliente:
+            # 🔹 Calentamiento: conexiones, clientes perezosos y catálogo cargados antes de medir
+            for i in range(calentamiento):
+                await cliente.post(f"{entorno.url_app}/chat", json={
+                    "numero_telefono": f"calentamiento-{i}", "message": mensajes[i % len(mensajes)]["texto"],
+                    "nombre_apartamento": apartamentos[i % len(apartamentos)],
+                })
+            await cliente.post(f"{entorno.url_openai}/__reiniciar")
+            await cliente.post(f"{entorno.url_supabase}/__reiniciar")
+
+            # 🔹 Carga: todos los huéspedes a la vez
+            latencias, errores = [], []
+            inicio = time.perf_counter()
+            await asyncio.gather(*(
+                _huesped(cliente, entorno.url_app, f"6000{i:05d}", mensajes, apartamentos[i % len(apartamentos)],
+                         turnos, random.Random(rng.random()), latencias, errores)
+                for i in range(huespedes)
+            ))
+            segundos = time.perf_counter() - inicio
+
+            openai = (await cliente.get(f"{entorno.url_openai}/__estadisticas")).json()
+            supabase = (await cliente.get(f"{entorno.url_supabase}/__estadisticas")).json()
+            estadisticas_app = (await cliente.get(f"{entorno.url_app}/estadisticas")).json()
+
+    completados = len(latencias)
+    total = completados + len(errores)
+    ordenadas = sorted(latencias)
+
+    def _por_turno(valor):
+        return round(valor / completados, 3) if completados else None
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "escenario": escenario_ruta,
+        "parametros": {"huespedes": huespedes, "turnos": turnos, "calentamiento": calentamiento, "semilla": semilla},
+        "entorno_app": env_app,
+        "latencias_falsas": escenario.get("latencias", {}),
+        "turnos": total,
+        "completados": completados,
+        "errores": len(errores),
+        "ejemplos_error": errores[:5],
+        "segundos": round(segundos, 3),
+        "turnos_por_segundo": round(completados / segundos, 2) if segundos else None,
+        "latencia_ms": {
+            "p50": round(percentil(ordenadas, 50) * 1000, 1),
+            "p95": round(percentil(ordenadas, 95) * 1000, 1),
+            "p99": round(percentil(ordenadas, 99) * 1000, 1),
+            "media": round(sum(ordenadas) / completados * 1000, 1) if completados else None,
+            "max": round(ordenadas[-1] * 1000, 1) if ordenadas else None,
+        },
+        "llamadas_por_turno": {
+            "openai": _por_turno(openai["llamadas"]),
+            "openai_por_prompt": {k: _por_turno(v) for k, v in sorted(openai["por_prompt"].items())},
+            "tokens_openai": _por_turno(openai["tokens"]),
+            "supabase": _por_turno(supabase["llamadas"]),
+            "supabase_por_operacion": {k: _por_turno(v) for k, v in sorted(supabase["por_operacion"].items())},
+        },
+        "estadisticas_app": estadisticas_app,
+    }
+
+
+def imprimir(resultado: dict):
+    latencia = resultado["latencia_ms"]
+    llamadas = resultado["llamadas_por_turno"]
+    print(f"📌 {resultado['completados']}/{resultado['turnos']} turnos en {resultado['segundos']}s "
+          f"→ {resultado['turnos_por_segundo']} turnos/s ({resultado['errores']} errores)")
+    print(f"⏱️  Latencia /chat: p50={latencia['p50']}ms p95={latencia['p95']}ms p99={latencia['p99']}ms max={latencia['max']}ms")
+    print(f"🧠 OpenAI por turno: {llamadas['openai']} llamadas, {llamadas['tokens_openai']} tokens {llamadas['openai_por_prompt']}")
+    print(f"🗄️  Supabase por turno: {llamadas['supabase']} llamadas {llamadas['supabase_por_operacion']}")
+
+
+def comparar(ruta_a: str, ruta_b: str):
+    """Diferencias entre dos ejecuciones guardadas (b respecto a a)."""
+    with open(ruta_a, encoding="utf-8") as f:
+        a = json.load(f)
+    with open(ruta_b, encoding="utf-8") as f:
+        b = json.load(f)
+
+    def _fila(nombre, va, vb):
+        if va in (None, 0) or vb is None:
+            print(f"{nombre:<28} {va!s:>10} {vb!s:>10}")
+        else:
+            print(f"{nombre:<28} {va:>10} {vb:>10} {(vb - va) / va:>+8.1%}")
+
+    print(f"{'':<28} {'a':>10} {'b':>10} {'Δ':>8}")
+    _fila("turnos/s", a["turnos_por_segundo"], b["turnos_por_segundo"])
+    for p in ("p50", "p95", "p99"):
+        _fila(f"latencia {p} (ms)", a["latencia_ms"][p], b["latencia_ms"][p])
+    _fila("openai por turno", a["llamadas_por_turno"]["openai"], b["llamadas_por_turno"]["openai"])
+    _fila("tokens openai por turno", a["llamadas_por_turno"]["tokens_openai"], b["llamadas_por_turno"]["tokens_openai"])
+    _fila("supabase por turno", a["llamadas_por_turno"]["supabase"], b["llamadas_por_turno"]["supabase"])
+
+
+def _leer_env(pares: list) -> dict:
+    env = {}
+    for par in pares or []:
+        clave, _, valor = par.partition("=")
+        env[clave] = valor
+    return env
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de /chat con OpenAI y Supabase falsos.")
+    parser.add_argument("--escenario", default=os.path.join("benchmarks", "escenarios", "basico.json"))
+    parser.add_argument("--huespedes", type=int, default=50, help="huéspedes simulados a la vez")
+    parser.add_argument("--turnos", type=int, default=5, help="mensajes por huésped")
+    parser.add_argument("--calentamiento", type=int, default=5, help="turnos previos que no se miden")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--env", action="append", metavar="CLAVE=VALOR", help="variable de entorno para la app (repetible)")
+    parser.add_argument("--salida", help="fichero JSON de resultados (por defecto benchmarks/resultados/carga-<fecha>.json)")
+    parser.add_argument("--comparar", nargs=2, metavar=("A", "B"), help="compara dos resultados guardados y sale")
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        sys.exit(0)
+
+    resultado = asyncio.run(ejecutar(args.escenario, args.huespedes, args.turnos, args.calentamiento,
+                                     _leer_env(args.env), args.semilla))
+    imprimir(resultado)
+
+    salida = args.salida or os.path.join(RAIZ, "benchmarks", "resultados", f"carga-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados guardados en {salida}")
+    sys.exit(1 if resultado["errores"] else 0)
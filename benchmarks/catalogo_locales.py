@@ -0,0 +1,117 @@
+import json
+import time
+import random
+import argparse
+from app.catalogo_locales import CatalogoLocales, RUTA_RESTAURANTES
+from benchmarks.carga import percentil
+
+###############################################################################
+# Latencia de las consultas al catálogo de locales
+###############################################################################
+#
+# Genera un catálogo sintético del tamaño pedido con el vocabulario real de
+# `app/datos/restaurantes.json` (cocinas, presupuestos, poblaciones y etiquetas) y
+# lanza consultas aleatorias de varios atributos con exclusiones, comparando los
+# índices invertidos con el recorrido lineal de la lista (lo que hacía `query_restaurantes`).
+#
+#     python -m benchmarks.catalogo_locales --locales 50000 --consultas 2000
+
+
+def generar_locales(n: int, vocabulario: dict, semilla: int = 0) -> list:
+    aleatorio = random.Random(semilla)
+    return [
+        {
+            "id": i,
+            "nombre": f"Local {i}",
+            "tipo_cocina": aleatorio.choice(vocabulario["tipo_cocina"]),
+            "budget": aleatorio.choice(vocabulario["budget"]),
+            "poblacion": aleatorio.choice(vocabulario["poblacion"]),
+            "etiquetas": aleatorio.sample(vocabulario["etiquetas"], aleatorio.randint(0, 4)),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def generar_consultas(n: int, vocabulario: dict, n_locales: int, semilla: int = 1) -> list:
+    """Consultas como las de `handle_recomendaciones`: cocina y presupuesto casi siempre, a veces población y etiquetas."""
+    aleatorio = random.Random(semilla)
+    consultas = []
+    for _ in range(n):
+        consulta = {"tipo_cocina": aleatorio.choice(vocabulario["tipo_cocina"])}
+        if aleatorio.random() < 0.8:
+            consulta["budget"] = aleatorio.sample(vocabulario["budget"], aleatorio.randint(1, 2))
+        if aleatorio.random() < 0.5:
+            consulta["poblacion"] = aleatorio.choice(vocabulario["poblacion"])
+        if aleatorio.random() < 0.5:
+            consulta["etiquetas"] = aleatorio.sample(vocabulario["etiquetas"], aleatorio.randint(1, 2))
+        consulta["excluir_ids"] = [aleatorio.randint(1, n_locales) for _ in range(aleatorio.randint(0, 20))]
+        consultas.append(consulta)
+    return consultas
+
+
+def recorrido_lineal(locales: list, tipo_cocina=None, budget=None, poblacion=None, etiquetas=None, excluir_ids=None):
+    """Referencia: filtrar la lista entera en cada consulta."""
+    budgets = [budget] if isinstance(budget, str) else budget
+    excluidos = set(excluir_ids or ())
+    return [
+        l for l in locales
+        if (not tipo_cocina or l["tipo_cocina"] == tipo_cocina)
+        and (not budgets or l["budget"] in budgets)
+        and (not poblacion or l["poblacion"] == poblacion)
+        and all(e in l["etiquetas"] for e in etiquetas or ())
+        and l["id"] not in excluidos
+    ]
+
+
+def medir(funcion, consultas: list) -> dict:
+    tiempos = []
+    resultados = 0
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados += len(funcion(**consulta))
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {
+        "p50_us": round(percentil(tiempos, 50) * 1e6, 1),
+        "p95_us": round(percentil(tiempos, 95) * 1e6, 1),
+        "p99_us": round(percentil(tiempos, 99) * 1e6, 1),
+        "resultados_medios": round(resultados / len(consultas), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide la latencia de las consultas al catálogo de locales.")
+    parser.add_argument("--locales", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--consultas", type=int, default=2000)
+    parser.add_argument("--limite", type=int, default=3, help="Resultados que pide `handle_recomendaciones`")
+    parser.add_argument("--sin-lineal", action="store_true", help="No medir el recorrido lineal de referencia")
+    args = parser.parse_args()
+
+    with open(RUTA_RESTAURANTES, encoding="utf-8") as f:
+        datos = json.load(f)
+    vocabulario = {
+        campo: sorted({v for l in datos["locales"] for v in (l[campo] if isinstance(l[campo], list) else [l[campo]])})
+        for campo in ("tipo_cocina", "budget", "poblacion", "etiquetas")
+    }
+
+    for n in args.locales:
+        locales = generar_locales(n, vocabulario)
+        catalogo = CatalogoLocales(f"sintetico-{n}")
+        inicio = time.perf_counter()
+        catalogo.indexar(locales, datos.get("sinonimos"))
+        segundos_indexar = time.perf_counter() - inicio
+        consultas = generar_consultas(args.consultas, vocabulario, n)
+
+        primeros = medir(lambda **c: catalogo.buscar(limite=args.limite, **c), consultas)
+        todos = medir(catalogo.buscar_ids, consultas)
+        print(f"📌 {n} locales (indexados en {segundos_indexar * 1000:.0f} ms), {len(consultas)} consultas")
+        print(f"⚡ Índices, primeros {args.limite}: p50={primeros['p50_us']}µs p95={primeros['p95_us']}µs p99={primeros['p99_us']}µs")
+        print(f"⚡ Índices, todos:        p50={todos['p50_us']}µs p95={todos['p95_us']}µs p99={todos['p99_us']}µs "
+              f"({todos['resultados_medios']} resultados de media)")
+        if not args.sin_lineal:
+            lineal = medir(lambda **c: recorrido_lineal(locales, **c), consultas)
+            print(f"🐢 Recorrido lineal:      p50={lineal['p50_us']}µs p95={lineal['p95_us']}µs p99={lineal['p99_us']}µs")
+            for consulta in consultas[:200]:
+                esperado = [l["id"] for l in recorrido_lineal(locales, **consulta)]
+                if catalogo.buscar_ids(**consulta) != esperado:
+                    raise SystemExit(f"❌ Resultado distinto del recorrido lineal para {consulta}")
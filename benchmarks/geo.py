@@ -0,0 +1,117 @@
+import time
+import random
+import argparse
+from datetime import datetime
+import numpy as np
+from app.catalogo_locales import CatalogoLocales
+from benchmarks.carga import percentil
+
+###############################################################################
+# Latencia de "los N más cercanos abiertos" con el índice en rejilla
+###############################################################################
+#
+# Reparte locales sintéticos por una zona del tamaño de Cataluña (la mayoría agrupados
+# alrededor de pueblos, el resto sueltos), con horarios variados, y mide para varios
+# radios `CatalogoLocales.cercanos` (rejilla + horarios) frente a calcular la distancia
+# a todos los locales. Comprueba que ambos devuelven lo mismo.
+#
+#     python -m benchmarks.geo --locales 10000 100000 1000000 --radios 1 5 20
+
+ZONA = {"latitud": (40.5, 42.8), "longitud": (0.2, 3.3)}
+PUEBLOS = 300
+DISPERSION_KM = 1.5
+
+HORARIOS = [
+    None,
+    {"lun-dom": ["13:00-16:00", "20:00-23:30"]},
+    {"mar-dom": ["12:00-16:00", "19:00-00:00"]},
+    {"lun-sab": ["09:00-14:00", "17:00-20:30"]},
+    {"jue-sab": ["23:30-05:00"]},
+    {"lun-dom": ["08:00-13:00"]},
+]
+
+
+def generar_locales(n: int, semilla: int = 0) -> list:
+    aleatorio = random.Random(semilla)
+    pueblos = [(aleatorio.uniform(*ZONA["latitud"]), aleatorio.uniform(*ZONA["longitud"])) for _ in range(PUEBLOS)]
+    grados = DISPERSION_KM / 111.32
+    locales = []
+    for i in range(1, n + 1):
+        if aleatorio.random() < 0.8:
+            latitud, longitud = aleatorio.choice(pueblos)
+            latitud, longitud = aleatorio.gauss(latitud, grados), aleatorio.gauss(longitud, grados * 1.33)
+        else:
+            latitud, longitud = aleatorio.uniform(*ZONA["latitud"]), aleatorio.uniform(*ZONA["longitud"])
+        local = {"id": i, "nombre": f"Local {i}", "tipo": "local", "poblacion": f"pueblo {i % PUEBLOS}",
+                 "etiquetas": [], "latitud": latitud, "longitud": longitud}
+        horario = aleatorio.choice(HORARIOS)
+        if horario:
+            local["horario"] = horario
+        locales.append(local)
+    return locales, pueblos
+
+
+def generar_consultas(n: int, pueblos: list, semilla: int = 1) -> list:
+    """Orígenes cerca de un pueblo (como un apartamento) y un momento de la semana."""
+    aleatorio = random.Random(semilla)
+    consultas = []
+    for _ in range(n):
+        latitud, longitud = aleatorio.choice(pueblos)
+        consultas.append({
+            "origen": (latitud + aleatorio.uniform(-0.01, 0.01), longitud + aleatorio.uniform(-0.01, 0.01)),
+            "abierto_en": datetime(2026, 10, 19 + aleatorio.randint(0, 6), aleatorio.randint(0, 23), aleatorio.choice((0, 15, 30, 45))),
+        })
+    return consultas
+
+
+def fuerza_bruta(catalogo: CatalogoLocales, origen, n: int, radio_km: float, abierto_en=None) -> list:
+    """Referencia: distancia a todos los locales, filtro de radio y horario, y los `n` mejores."""
+    distancias = catalogo.geo.distancias(origen)
+    validos = distancias <= radio_km
+    if abierto_en is not None:
+        validos &= catalogo.horarios.abiertos(abierto_en)
+    posiciones = np.flatnonzero(validos)
+    orden = np.argsort(distancias[posiciones], kind="stable")[:n]
+    return [catalogo.locales[p]["id"] for p in posiciones[orden]]
+
+
+def medir(funcion, consultas: list) -> dict:
+    tiempos = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        funcion(consulta)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {q: round(percentil(tiempos, q) * 1e6, 1) for q in (50, 95, 99)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el índice geográfico frente a calcular todas las distancias.")
+    parser.add_argument("--locales", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--radios", type=float, nargs="+", default=[1.0, 5.0, 20.0])
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--n", type=int, default=5, help="Resultados por consulta")
+    args = parser.parse_args()
+
+    for n in args.locales:
+        locales, pueblos = generar_locales(n)
+        catalogo = CatalogoLocales(f"sintetico-{n}", campos=("tipo", "poblacion"))
+        inicio = time.perf_counter()
+        catalogo.indexar(locales)
+        segundos_indexar = time.perf_counter() - inicio
+        consultas = generar_consultas(args.consultas, pueblos)
+        print(f"📌 {n} locales (catálogo, rejilla y horarios en {segundos_indexar * 1000:.0f} ms), {len(consultas)} consultas, n={args.n}")
+
+        for radio in args.radios:
+            for consulta in consultas[:100]:
+                esperado = fuerza_bruta(catalogo, consulta["origen"], args.n, radio, consulta["abierto_en"])
+                obtenido = [l["id"] for l, _ in catalogo.cercanos(consulta["origen"], args.n, radio, abierto_en=consulta["abierto_en"])]
+                if obtenido != esperado:
+                    raise SystemExit(f"❌ Resultado distinto de la fuerza bruta para {consulta} (radio {radio} km)")
+
+            rejilla = medir(lambda c: catalogo.cercanos(c["origen"], args.n, radio), consultas)
+            abiertos = medir(lambda c: catalogo.cercanos(c["origen"], args.n, radio, abierto_en=c["abierto_en"]), consultas)
+            bruta = medir(lambda c: fuerza_bruta(catalogo, c["origen"], args.n, radio, c["abierto_en"]), consultas[:100])
+            print(f"   {radio:g} km ⚡ rejilla: p50={rejilla[50]}µs p99={rejilla[99]}µs · "
+                  f"abiertos: p50={abiertos[50]}µs p99={abiertos[99]}µs · "
+                  f"🐢 todas las distancias: p50={bruta[50]}µs p99={bruta[99]}µs")
@@ -0,0 +1,123 @@
+import json
+import time
+import random
+import argparse
+from app.catalogo_locales import CatalogoLocales, RUTA_RESTAURANTES
+from app.ranking_restaurantes import MatrizRanking
+from benchmarks.carga import percentil
+from benchmarks.catalogo_locales import generar_locales
+
+###############################################################################
+# Escalado del ranking vectorizado de restaurantes
+###############################################################################
+#
+# Genera catálogos sintéticos (vocabulario de `app/datos/restaurantes.json`, con
+# valoraciones y coordenadas repartidas por las cuatro poblaciones) y mide, para cada
+# tamaño, cuánto tarda construir la matriz y cuánto un `rankear` completo (puntuar
+# todos los locales + top-k con diversidad + exclusiones) con preferencias aleatorias.
+# Hasta `--max-python` locales también mide un bucle en Python puro como referencia.
+#
+#     python -m benchmarks.ranking_restaurantes --locales 1000 10000 100000
+
+CENTROS = [(41.1866, 1.5680), (41.1955, 1.6040), (41.1975, 1.6355), (41.1765, 1.5225)]
+
+
+def generar_con_coordenadas(n: int, vocabulario: dict, semilla: int = 0) -> list:
+    aleatorio = random.Random(semilla)
+    locales = generar_locales(n, vocabulario, semilla)
+    for local in locales:
+        latitud, longitud = aleatorio.choice(CENTROS)
+        local["latitud"] = latitud + aleatorio.uniform(-0.01, 0.01)
+        local["longitud"] = longitud + aleatorio.uniform(-0.015, 0.015)
+        local["valoracion"] = round(aleatorio.uniform(3.0, 5.0), 1)
+    return locales
+
+
+def generar_preferencias(n: int, vocabulario: dict, n_locales: int, semilla: int = 1) -> list:
+    aleatorio = random.Random(semilla)
+    preferencias = []
+    for _ in range(n):
+        latitud, longitud = aleatorio.choice(CENTROS)
+        preferencias.append({
+            "tipo_cocina": aleatorio.choice(vocabulario["tipo_cocina"]),
+            "budget": aleatorio.choice(vocabulario["budget"]),
+            "etiquetas": aleatorio.sample(vocabulario["etiquetas"], aleatorio.randint(0, 2)),
+            "poblaciones": [aleatorio.choice(vocabulario["poblacion"])] if aleatorio.random() < 0.3 else [],
+            "origen": (latitud, longitud),
+            "excluir_ids": [aleatorio.randint(1, n_locales) for _ in range(aleatorio.randint(0, 10))],
+        })
+    return preferencias
+
+
+def ranking_python(matriz: MatrizRanking, locales: list, k: int, excluir_ids=None, **preferencias) -> list:
+    """Referencia sin NumPy: puntuar local a local con la misma fórmula y ordenar."""
+    import math
+    from app.ranking_restaurantes import RADIO_TIERRA_KM
+
+    pesos, excluidos = matriz.pesos, set(excluir_ids or ())
+    lat0, lon0 = (math.radians(c) for c in preferencias["origen"])
+    etiquetas = preferencias["etiquetas"]
+    puntuados = []
+    for i, local in enumerate(locales):
+        if local["id"] in excluidos:
+            continue
+        puntuacion = pesos["cocina"] * float(matriz.afinidad[matriz.cocinas.index(preferencias["tipo_cocina"]), matriz.codigo_cocina[i]])
+        pedido = matriz.orden_budget.index(preferencias["budget"])
+        puntuacion += pesos["budget"] * (1 - abs(int(matriz.escalon_budget[i]) - pedido) / matriz.max_escalon)
+        if etiquetas:
+            puntuacion += pesos["etiquetas"] * sum(e in local["etiquetas"] for e in etiquetas) / len(etiquetas)
+        lat, lon = math.radians(local["latitud"]), math.radians(local["longitud"])
+        a = math.sin((lat - lat0) / 2) ** 2 + math.cos(lat0) * math.cos(lat) * math.sin((lon - lon0) / 2) ** 2
+        puntuacion += pesos["distancia"] * math.exp(-2 * RADIO_TIERRA_KM * math.asin(math.sqrt(a)) / matriz.escala_km)
+        puntuacion += pesos["valoracion"] * local["valoracion"] / 5
+        puntuados.append((puntuacion, local["id"]))
+    puntuados.sort(reverse=True)
+    return puntuados[:k]
+
+
+def medir(funcion, preferencias: list) -> dict:
+    tiempos = []
+    for p in preferencias:
+        inicio = time.perf_counter()
+        funcion(p)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {q: round(percentil(tiempos, q) * 1000, 3) for q in (50, 95, 99)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide cómo escala el ranking vectorizado de restaurantes.")
+    parser.add_argument("--locales", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--consultas", type=int, default=300)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--max-python", type=int, default=10000, help="Tamaño máximo para medir el bucle en Python")
+    args = parser.parse_args()
+
+    with open(RUTA_RESTAURANTES, encoding="utf-8") as f:
+        datos = json.load(f)
+    vocabulario = {
+        campo: sorted({v for l in datos["locales"] for v in (l[campo] if isinstance(l[campo], list) else [l[campo]])})
+        for campo in ("tipo_cocina", "budget", "poblacion", "etiquetas")
+    }
+
+    for n in args.locales:
+        catalogo = CatalogoLocales(f"sintetico-{n}")
+        catalogo.indexar(generar_con_coordenadas(n, vocabulario), datos.get("sinonimos"), {k: v for k, v in datos.items() if k not in ("locales", "sinonimos")})
+        inicio = time.perf_counter()
+        matriz = MatrizRanking(catalogo)
+        segundos_matriz = time.perf_counter() - inicio
+
+        preferencias = generar_preferencias(args.consultas, vocabulario, n)
+        for p in preferencias:
+            for campo in ("tipo_cocina", "budget"):
+                p[campo] = catalogo.canonico(campo, p[campo])
+            p["etiquetas"] = [catalogo.canonico("etiquetas", e) for e in p["etiquetas"]]
+            p["poblaciones"] = [catalogo.canonico("poblacion", x) for x in p["poblaciones"]]
+
+        numpy_ms = medir(lambda p: matriz.rankear(k=args.k, **p), preferencias)
+        print(f"📌 {n} locales (matriz en {segundos_matriz * 1000:.0f} ms), {len(preferencias)} consultas, k={args.k}")
+        print(f"⚡ NumPy: p50={numpy_ms[50]}ms p95={numpy_ms[95]}ms p99={numpy_ms[99]}ms")
+        if n <= args.max_python:
+            python_ms = medir(lambda p: ranking_python(matriz, catalogo.locales, args.k, **p), preferencias[:50])
+            print(f"🐢 Python puro: p50={python_ms[50]}ms p95={python_ms[95]}ms p99={python_ms[99]}ms "
+                  f"(x{python_ms[50] / max(numpy_ms[50], 1e-9):.0f})")
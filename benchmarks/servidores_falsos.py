@@ -0,0 +1,249 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.prompts import PROMPTS
+
+###############################################################################
+# Servidores falsos de OpenAI y Supabase para las pruebas de carga
+###############################################################################
+#
+# Sustituyen a la API de chat-completions y a las tablas `dinamicos`, `apartamentos` y
+# `mensajes` de Supabase (API REST de PostgREST) con servidores HTTP locales. La app se
+# arranca sin cambios, apuntando a ellos con `OPENAI_BASE_URL` y `SUPABASE_URL`.
+#
+#   - Cada servidor espera una latencia sacada de la distribución del escenario antes de
+#     responder (`fija`, `uniforme`, `normal` o `lognormal`).
+#   - OpenAI falso reconoce qué prompt le llega comparando el mensaje `system` con el
+#     registro de `app/prompts.py` y contesta con la respuesta guionizada para ese prompt;
+#     la clasificación devuelve las intenciones del mensaje del huésped en el escenario.
+#   - `GET /__estadisticas` devuelve las llamadas recibidas y `POST /__reiniciar` las pone a cero.
+#
+#     python -m benchmarks.servidores_falsos --escenario benchmarks/escenarios/basico.json
+
+
+class Latencia:
+    """Distribución de latencia de un servidor falso, en milisegundos en el escenario."""
+
+    def __init__(self, config: dict = None, semilla: int = None):
+        self.config = config or {"distribucion": "fija", "ms": 0}
+        self._random = random.Random(semilla)
+
+    def muestra(self) -> float:
+        """Segundos que debe tardar la siguiente respuesta."""
+        c = self.config
+        distribucion = c.get("distribucion", "fija")
+        if distribucion == "fija":
+            ms = c.get("ms", 0)
+        elif distribucion == "uniforme":
+            ms = self._random.uniform(c["min_ms"], c["max_ms"])
+        elif distribucion == "normal":
+            ms = self._random.gauss(c["media_ms"], c.get("desviacion_ms", 0))
+        elif distribucion == "lognormal":
+            ms = c["mediana_ms"] * self._random.lognormvariate(0, c.get("sigma", 0.5))
+        else:
+            raise ValueError(f"❌ Distribución de latencia desconocida: {distribucion}")
+        return max(ms, 0) / 1000
+
+    async def esperar(self):
+        segundos = self.muestra()
+        if segundos:
+            await asyncio.sleep(segundos)
+
+
+def _tokens(texto: str) -> int:
+    return (len(texto.encode("utf-8")) + 3) // 4
+
+
+def crear_openai_falso(escenario: dict) -> FastAPI:
+    """API de chat-completions con respuestas guionizadas por prompt."""
+    app = FastAPI(title="OpenAI falso")
+    latencia = Latencia(escenario.get("latencias", {}).get("openai"), escenario.get("semilla"))
+    prompt_por_sistema = {prompt.sistema: nombre for nombre, prompt in PROMPTS.items()}
+    respuestas = escenario.get("respuestas", {})
+    guiones = escenario.get("mensajes", [])
+    llamadas = Counter()
+    tokens = Counter()
+    siguiente = Counter()
+
+    def _respuesta(nombre: str, contenido_usuario: str) -> str:
+        if nombre == "clasificacion":
+            # El mensaje del huésped va dentro del prompt: buscamos a qué guion corresponde
+            for guion in guiones:
+                if guion["texto"] in contenido_usuario:
+                    return json.dumps({"idioma": guion.get("idioma", "es"), "intenciones": guion["intenciones"]}, ensure_ascii=False)
+            return json.dumps({"idioma": "es", "intenciones": ["indeterminado"]})
+
+        respuesta = respuestas.get(nombre, "De acuerdo.")
+        if isinstance(respuesta, list):
+            # Varias respuestas posibles: se van alternando
+            respuesta = respuesta[siguiente[nombre] % len(respuesta)]
+            siguiente[nombre] += 1
+        return respuesta if isinstance(respuesta, str) else json.dumps(respuesta, ensure_ascii=False)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        cuerpo = await request.json()
+        mensajes = cuerpo.get("messages", [])
+        sistema = next((m["content"] for m in mensajes if m.get("role") == "system"), "")
+        usuario = next((m["content"] for m in reversed(mensajes) if m.get("role") == "user"), "")
+        nombre = prompt_por_sistema.get(sistema, "desconocido")
+        llamadas[nombre] += 1
+
+        await latencia.esperar()
+        texto = _respuesta(nombre, usuario)
+        uso = {
+            "prompt_tokens": sum(_tokens(m.get("content") or "") for m in mensajes),
+            "completion_tokens": _tokens(texto),
+        }
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        tokens[nombre] += uso["total_tokens"]
+        base = {"id": f"falso-{time.time_ns()}", "created": int(time.time()), "model": cuerpo.get("model", "falso")}
+
+        if not cuerpo.get("stream"):
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": texto}}],
+                "usage": uso,
+            }
+
+        async def _trozos():
+            paso = max(len(texto) // 4, 1)
+            for inicio in range(0, len(texto), paso):
+                trozo = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": texto[inicio:inicio + paso]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(trozo, ensure_ascii=False)}\n\n"
+            fin = {**base, "object": "chat.completion.chunk", "choices": [], "usage": uso}
+            yield f"data: {json.dumps(fin)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(_trozos(), media_type="text/event-stream")
+
+    @app.get("/__estadisticas")
+    async def estadisticas():
+        return {"llamadas": sum(llamadas.values()), "por_prompt": dict(llamadas),
+                "tokens": sum(tokens.values()), "tokens_por_prompt": dict(tokens)}
+
+    @app.post("/__reiniciar")
+    async def reiniciar():
+        llamadas.clear()
+        tokens.clear()
+        return {"ok": True}
+
+    return app
+
+
+def _filtrar(filas: list, parametros) -> list:
+    """Aplica los filtros `columna=eq.valor`, `order=col.desc` y `limit` de PostgREST."""
+    for clave, valor in parametros.multi_items():
+        if clave in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+            continue
+        operador, _, operando = valor.partition(".")
+        if operador != "eq":
+            raise ValueError(f"Operador no soportado por el Supabase falso: {clave}={valor}")
+        filas = [f for f in filas if str(f.get(clave)) == operando]
+
+    orden = parametros.get("order")
+    if orden:
+        columna, _, sentido = orden.partition(".")
+        filas = sorted(filas, key=lambda f: f.get(columna) or 0, reverse=sentido.startswith("desc"))
+
+    limite = parametros.get("limit")
+    if limite is not None:
+        filas = filas[:int(limite)]
+
+    seleccion = parametros.get("select", "*")
+    if seleccion != "*":
+        columnas = [c.strip() for c in seleccion.split(",")]
+        filas = [{c: f.get(c) for c in columnas} for f in filas]
+    return filas
+
+
+def crear_supabase_falso(escenario: dict) -> FastAPI:
+    """API REST de PostgREST (`/rest/v1/<tabla>`) sobre tablas en memoria."""
+    app = FastAPI(title="Supabase falso")
+    latencia = Latencia(escenario.get("latencias", {}).get("supabase"), escenario.get("semilla"))
+    tablas = {"dinamicos": [], "mensajes": [], "apartamentos": [dict(a) for a in escenario.get("apartamentos", [])]}
+    llamadas = Counter()
+    ids = Counter()
+
+    @app.get("/rest/v1/{tabla}")
+    async def leer(tabla: str, request: Request):
+        llamadas[f"{tabla}.select"] += 1
+        await latencia.esperar()
+        try:
+            return _filtrar(tablas.setdefault(tabla, []), request.query_params)
+        except ValueError as e:
+            return JSONResponse({"message": str(e)}, status_code=400)
+
+    @app.post("/rest/v1/{tabla}")
+    async def escribir(tabla: str, request: Request):
+        cuerpo = await request.json()
+        filas = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+        prefer = request.headers.get("prefer", "")
+        upsert = "merge-duplicates" in prefer
+        llamadas[f"{tabla}.{'upsert' if upsert else 'insert'}"] += 1
+        await latencia.esperar()
+
+        destino = tablas.setdefault(tabla, [])
+        conflicto = request.query_params.get("on_conflict")
+        resultado = []
+        for fila in filas:
+            existente = None
+            if upsert and conflicto:
+                existente = next((f for f in destino if f.get(conflicto) == fila.get(conflicto)), None)
+            if existente is not None:
+                existente.update(fila)
+                resultado.append(existente)
+            else:
+                nueva = dict(fila)
+                if tabla == "mensajes":
+                    ids[tabla] += 1
+                    nueva["id"] = ids[tabla]
+                destino.append(nueva)
+                resultado.append(nueva)
+        return JSONResponse(resultado if "return=representation" in prefer else [], status_code=201)
+
+    @app.get("/__estadisticas")
+    async def estadisticas():
+        return {"llamadas": sum(llamadas.values()), "por_operacion": dict(llamadas),
+                "filas": {tabla: len(filas) for tabla, filas in tablas.items()}}
+
+    @app.post("/__reiniciar")
+    async def reiniciar():
+        llamadas.clear()
+        return {"ok": True}
+
+    return app
+
+
+async def servir(escenario: dict, puerto_openai: int, puerto_supabase: int):
+    """Arranca los dos servidores falsos en este event loop hasta que se cancele."""
+    import uvicorn
+
+    servidores = [
+        uvicorn.Server(uvicorn.Config(crear_openai_falso(escenario), host="127.0.0.1", port=puerto_openai, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(crear_supabase_falso(escenario), host="127.0.0.1", port=puerto_supabase, log_level="warning")),
+    ]
+    await asyncio.gather(*(servidor.serve() for servidor in servidores))
+
+
+def cargar_escenario(ruta: str) -> dict:
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidores falsos de OpenAI y Supabase para pruebas de carga.")
+    parser.add_argument("--escenario", default="benchmarks/escenarios/basico.json")
+    parser.add_argument("--puerto-openai", type=int, default=8101)
+    parser.add_argument("--puerto-supabase", type=int, default=8102)
+    args = parser.parse_args()
+
+    asyncio.run(servir(cargar_escenario(args.escenario), args.puerto_openai, args.puerto_supabase))
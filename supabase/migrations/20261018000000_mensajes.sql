@@ -0,0 +1,46 @@
+-- 📌 Historial de conversación en modo append-only (HISTORIAL_MODE=mensajes)
+-- Cada turno es una fila nueva: guardar un turno no reescribe el historial entero.
+
+create table if not exists public.mensajes (
+    id bigint generated always as identity primary key,
+    numero_telefono text not null,
+    usuario text not null,
+    bot text not null,
+    created_at timestamptz not null default now()
+);
+
+-- 🔹 Los últimos N turnos de un usuario se leen con un único recorrido de este índice
+create index if not exists mensajes_numero_telefono_id_idx
+    on public.mensajes (numero_telefono, id desc);
+
+-- 🔹 Recorte en el servidor: se conservan los últimos 50 turnos de cada usuario.
+-- Trigger por sentencia, así un insert masivo del buffer de escritura recorta una vez por usuario.
+create or replace function public.recortar_mensajes()
+returns trigger
+language plpgsql
+as $$
+begin
+    delete from public.mensajes m
+    using (
+        select u.numero_telefono,
+               (select x.id
+                  from public.mensajes x
+                 where x.numero_telefono = u.numero_telefono
+                 order by x.id desc
+                offset 50
+                 limit 1) as corte
+          from (select distinct numero_telefono from nuevos) u
+    ) c
+    where m.numero_telefono = c.numero_telefono
+      and c.corte is not null
+      and m.id <= c.corte;
+    return null;
+end;
+$$;
+
+drop trigger if exists recortar_mensajes on public.mensajes;
+create trigger recortar_mensajes
+    after insert on public.mensajes
+    referencing new table as nuevos
+    for each statement
+    execute function public.recortar_mensajes();